@@ -0,0 +1,90 @@
+# Database routing between the primary and read replicas
+#
+# Everything reads from and writes to 'default' (the primary), except safe (GET/HEAD/OPTIONS)
+# API viewset actions, which read from a replica (see ReplicaReadMixin in listings/views.py).
+# After a user writes something, their reads stay on the primary for REPLICA_PIN_SECONDS so
+# they always see their own changes even if the replicas are a little behind. The pin is kept
+# in the shared cache (CACHES in settings.py), so it holds whichever worker serves the next read.
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Routing state of the request currently being handled (None outside API requests)
+_routing = ContextVar('db_routing', default=None)
+
+
+class RoutingState:
+    def __init__(self, replica=None, allowed=True):
+        self.replica = replica   # replica alias to read from, or None for the primary
+        self.allowed = allowed   # may reads go to the replica right now?
+        self.wrote = False       # did this request write anything?
+
+
+def replica_aliases():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+def pick_replica():
+    """
+    A random replica alias, or 'default' when no replicas are configured.
+    """
+    replicas = replica_aliases()
+    return random.choice(replicas) if replicas else 'default'
+
+
+def _pin_key(user):
+    return f"db-pin:{user.pk}"
+
+
+def is_pinned(user):
+    """
+    True if this user wrote recently and must keep reading from the primary.
+    """
+    return bool(user and user.is_authenticated and cache.get(_pin_key(user)))
+
+
+def pin_to_primary(user):
+    if user and user.is_authenticated:
+        cache.set(_pin_key(user), True, getattr(settings, 'REPLICA_PIN_SECONDS', 10))
+
+
+@contextmanager
+def read_from_replica(allowed=True):
+    """
+    Routes reads inside the block to one replica (picked once, so the block sees one consistent copy).
+    Yields the RoutingState so callers can switch replica reads on/off and see whether anything was written.
+    """
+    replicas = replica_aliases()
+    state = RoutingState(random.choice(replicas) if replicas else None, allowed=allowed)
+    token = _routing.set(state)
+    try:
+        yield state
+    finally:
+        _routing.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        # Once a request has written, it reads its own writes from the primary
+        if state is None or state.replica is None or not state.allowed or state.wrote:
+            return 'default'
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.wrote = True
+        return 'default'
+
+    # Replicas hold the same data as the primary, so relations across them are fine
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    # Only the primary gets migrated; replicas copy its schema (SQLite stand-ins share its file)
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
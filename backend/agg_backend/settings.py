@@ -59,6 +59,7 @@ INSTALLED_APPS = [
 # Middleware processes requests/responses in order
 # pipeline that every request goes through
 MIDDLEWARE = [
+    'listings.middleware.MetricsMiddleware',           # Per-endpoint timings for /metrics (keep first)
     'corsheaders.middleware.CorsMiddleware',           # Handle CORS for React
     'django.middleware.security.SecurityMiddleware',   # Security features
     'django.contrib.sessions.middleware.SessionMiddleware',  # Sessions
@@ -99,16 +100,91 @@ TEMPLATES = [
 WSGI_APPLICATION = 'agg_backend.wsgi.application'
 
 # tells Django how to connect to PostgreSQL database
-DATABASES = {
-    'default': {
+# Connections are kept open between requests (CONN_MAX_AGE seconds) and checked before reuse
+# Set DB_POOL=1 to use psycopg's connection pool instead (needs psycopg[pool] installed)
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', '60'))
+DB_POOL = os.environ.get('DB_POOL') == '1'
+
+def postgres_database(host, port):
+    database = {
         'ENGINE': 'django.db.backends.postgresql',  # Use PostgreSQL
         'NAME': os.environ.get('POSTGRES_DB', 'content'),
         'USER': os.environ.get('POSTGRES_USER', 'lunerd'),
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
-        'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
-        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+        'HOST': host,
+        'PORT': port,
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,     # make sure a reused connection is still alive
+    }
+    if DB_POOL:
+        from psycopg_pool import ConnectionPool
+        database['CONN_MAX_AGE'] = 0    # the pool keeps the connections instead
+        database['OPTIONS'] = {
+            'pool': {
+                'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+                'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+                'check': ConnectionPool.check_connection,  # health check on checkout
+            },
+        }
+    return database
+
+# Read replicas, e.g. POSTGRES_REPLICAS="replica1:5432,replica2:5432"
+# Safe API reads go to them (see agg_backend/db_router.py), everything else uses 'default'
+POSTGRES_REPLICAS = [host for host in os.environ.get('POSTGRES_REPLICAS', '').split(',') if host]
+
+# DB_ENGINE=sqlite runs on a local SQLite file instead. DB_SQLITE_REPLICAS stand-in replicas
+# are read-only connections to that same file, so replica reads see the primary's data
+# (with no lag) and a write routed to a replica fails the way it would on a real one.
+if os.environ.get('DB_ENGINE') == 'sqlite':
+    DATABASES = {
+        'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'db.sqlite3'},
+    }
+    for number in range(1, int(os.environ.get('DB_SQLITE_REPLICAS', '0')) + 1):
+        DATABASES[f'replica{number}'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': f"file:{BASE_DIR / 'db.sqlite3'}?mode=ro",
+        }
+else:
+    DATABASES = {
+        'default': postgres_database(
+            os.environ.get('POSTGRES_HOST', 'localhost'),
+            os.environ.get('POSTGRES_PORT', '5432'),
+        ),
+    }
+    for number, replica in enumerate(POSTGRES_REPLICAS, start=1):
+        host, _, port = replica.partition(':')
+        DATABASES[f'replica{number}'] = postgres_database(host, port or '5432')
+
+# In tests the replicas are just the test database again
+for alias in DATABASES:
+    if alias != 'default':
+        DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['agg_backend.db_router.PrimaryReplicaRouter']
+
+# How long a user's reads stay on the primary after they write something
+REPLICA_PIN_SECONDS = 10
+
+# === CACHE ===
+
+# The replica pin (db_router.py) must be seen by every worker process, so the cache is shared:
+# Redis when REDIS_URL is set (needs the redis package installed), otherwise a table on the
+# primary (create it once with `python manage.py createcachetable`).
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'django_cache',
+        },
     }
-}
 
 # === CUSTOM USER MODEL ===
 
@@ -152,6 +228,27 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')  # Where to collect static f
 MEDIA_URL = '/media/'                      # URL prefix for media files
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')  # Where to store uploaded files
 
+# Local cache of listing images (see listings/images.py)
+IMAGE_CACHE = {
+    'ROOT': 'image_cache',                           # folder inside MEDIA_ROOT
+    'SIZES': {'card': (400, 300), 'detail': (1024, 768)},  # thumbnail sizes (max width, height)
+    'ALLOWED_HOSTS': ['ss.com', 'www.ss.com', 'i.ss.com', 'i.ss.lv'],  # only download from these
+    'WORKERS': 8,                                    # parallel downloads in fetch_images
+    'MAX_BYTES': 5 * 1024 ** 3,                      # evict_images keeps the cache under this size
+    'MAX_AGE': 24 * 3600,                            # browsers revalidate served images after this
+}
+
+# === SIMILAR LISTINGS ===
+# Memory-mapped feature vectors for /api/listings/<id>/similar/ (see listings/similar.py)
+# Rebuilt by `python manage.py build_similarity_index`, kept current by ingest in between
+SIMILAR_LISTINGS = {
+    'ROOT': os.path.join(BASE_DIR, 'vector_index'),  # folder with the .npy files
+    'BLOCK_ROWS': 65536,                             # rows per vectorized distance block
+}
+
+# Tests keep the index in a temporary folder instead (see agg_backend/test_runner.py)
+TEST_RUNNER = 'agg_backend.test_runner.TestRunner'
+
 # === DEFAULT PRIMARY KEY TYPE ===
 
 # What type of ID field to use for new models
@@ -177,6 +274,23 @@ REST_FRAMEWORK = {
     ],
 }
 
+# === LISTING ARCHIVE ===
+
+# When the archive_listings command moves listings out of the live table
+LISTING_ARCHIVE = {
+    'INACTIVE_AFTER_DAYS': 30,   # inactive listings older than this get archived
+    'STALE_AFTER_DAYS': 90,      # "active" listings not scraped for this long get archived
+    'BATCH_SIZE': 1000,          # rows moved per transaction
+}
+
+# === NOTIFICATION INBOX ===
+
+# How much notification history the trim_notifications command keeps (see listings/inbox.py)
+NOTIFICATION_INBOX = {
+    'KEEP_PER_USER': 1000,       # newest notifications kept per user, older ones are deleted
+    'BATCH_SIZE': 1000,          # rows deleted per transaction
+}
+
 # === CORS CONFIGURATION ===
 
 # React frontend to access the Django API
@@ -203,15 +317,21 @@ DEFAULT_FROM_EMAIL = 'noreply@carlistings.com'  # Default sender email
 # === LOGGING CONFIGURATION ===
 
 # Where to store Django logs
+# Log files are written by a background thread (QueueFileHandler) so logging never slows a request
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
     'handlers': {
         'file': {
             'level': 'INFO',
-            'class': 'logging.FileHandler',
+            'class': 'listings.log.QueueFileHandler',
             'filename': 'django.log',  # Log file will be created in your backend/ folder
         },
+        'slow_queries': {
+            'level': 'WARNING',
+            'class': 'listings.log.QueueFileHandler',
+            'filename': 'slow_queries.log',
+        },
     },
     'loggers': {
         'django': {
@@ -219,5 +339,22 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        # Queries slower than SLOW_QUERY_THRESHOLD_MS, with their SQL (see listings/middleware.py)
+        'listings.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
     },
-}
\ No newline at end of file
+}
+
+# === PERFORMANCE METRICS ===
+
+# Queries taking at least this long (milliseconds) are logged and counted as slow
+SLOW_QUERY_THRESHOLD_MS = 200
+
+# Who may read /metrics besides staff users: Prometheus sends METRICS_TOKEN as a bearer token
+# (bearer_token in its scrape config), or scrapes from one of METRICS_ALLOWED_IPS.
+# Behind a reverse proxy REMOTE_ADDR is the proxy, so use the token there.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip for ip in os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip]
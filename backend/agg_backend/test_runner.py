@@ -0,0 +1,25 @@
+# Test runner (TEST_RUNNER in settings.py)
+# Runs the tests with the similar-listings index in a temporary folder, so API writes in tests
+# never touch the real vector_index/ next to the code. Tests that build an index still point
+# SIMILAR_LISTINGS at a folder of their own.
+
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._index_root = tempfile.TemporaryDirectory()
+        self._index_settings = override_settings(
+            SIMILAR_LISTINGS={**getattr(settings, 'SIMILAR_LISTINGS', {}), 'ROOT': self._index_root.name},
+        )
+        self._index_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._index_settings.disable()
+        self._index_root.cleanup()
+        super().teardown_test_environment(**kwargs)
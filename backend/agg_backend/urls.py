@@ -17,6 +17,7 @@ Including another URLconf
 
 from django.contrib import admin
 from django.urls import path, include
+from listings.views import metrics_view
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -26,4 +27,6 @@ urlpatterns = [
     # The include() function allows references another URLconf.
     # The listings app's urls.py file defines the actual API endpoints.
     path("api/", include("listings.urls")),
+    # Prometheus scrapes request/DB/scraper metrics from here
+    path("metrics", metrics_view, name="metrics"),
 ]
\ No newline at end of file
@@ -1,13 +1,27 @@
-from django.contrib import admin
-from .models import User, Source, Listing, Filter, Favorite, Notification
+from django.contrib import admin, messages
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import User, Source, Place, Listing, ArchivedListing, CachedImage, Filter, Favorite, Notification
+from .archive import delete_archived_listings
+from .inbox import delete_notification_rows, delete_with_notifications, mark_read, notifications_created, recount_unread
+from .paginators import EstimatedCountPaginator
 
 #Admin is for staff/superusers to manage all users and data
+
+# For tables with millions of rows: page counts come from PostgreSQL's estimate instead of
+# COUNT(*), and the "N total" link (a second full count on every search) is turned off.
+# Search fields should be exact ('=field') or backed by a trigram index (see search.py).
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
     list_display = ('username', 'email', 'role', 'email_notifications', 'created_at', 'is_active', 'is_staff')
     list_filter = ('role', 'email_notifications', 'is_active', 'is_staff')
     search_fields = ('username', 'email')
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('unread_notifications', 'created_at', 'updated_at')
     ordering = ('-created_at',)
 
 @admin.register(Source)
@@ -17,33 +31,166 @@ class SourceAdmin(admin.ModelAdmin):
     search_fields = ('name', 'url')
     readonly_fields = ('created_at', 'last_scraped')
 
+@admin.register(Place)
+class PlaceAdmin(admin.ModelAdmin):
+    list_display = ('name', 'region', 'latitude', 'longitude', 'geohash')
+    list_filter = ('region',)
+    search_fields = ('name',)
+    readonly_fields = ('geohash',)
+
 @admin.register(Listing)
-class ListingAdmin(admin.ModelAdmin):
+class ListingAdmin(LargeTableAdmin):
     list_display = (
-        'title', 'listing_type', 'price', 'location', 'source', 'is_active', 'created_at', 'updated_at'
+        'title', 'listing_type', 'price', 'location', 'source', 'is_active', 'rescrape_requested',
+        'created_at', 'updated_at'
     )
-    list_filter = ('listing_type', 'is_active', 'source')
-    search_fields = ('title', 'location', 'external_id')
+    list_filter = ('listing_type', 'is_active', 'rescrape_requested', 'source')
+    list_select_related = ('source',)
+    search_fields = ('=external_id', 'title')
     readonly_fields = ('created_at', 'updated_at', 'scraped_at')
     ordering = ('-created_at',)
+    raw_id_fields = ('source', 'place')
+    actions = ('deactivate', 'request_rescrape')
+
+    # Actions are one UPDATE ... WHERE over the whole selection, never a loop over rows
+    @admin.action(description="Deactivate selected listings")
+    def deactivate(self, request, queryset):
+        # Inactive listings aren't deals any more (see valuation.py)
+        updated = queryset.update(is_active=False, market_price=None, deal_score=None, updated_at=timezone.now())
+        self.message_user(request, f"Deactivated {updated} listings.", messages.SUCCESS)
+
+    @admin.action(description="Re-scrape selected listings on the next scraper run")
+    def request_rescrape(self, request, queryset):
+        updated = queryset.update(rescrape_requested=True)
+        self.message_user(request, f"Marked {updated} listings for re-scraping.", messages.SUCCESS)
+
+    # Notifications go first, so the unread counters stay right (see inbox.py)
+    def delete_model(self, request, obj):
+        delete_with_notifications(Listing.objects.filter(pk=obj.pk), 'listing')
+
+    def delete_queryset(self, request, queryset):
+        delete_with_notifications(queryset, 'listing')
+
+@admin.register(ArchivedListing)
+class ArchivedListingAdmin(LargeTableAdmin):
+    list_display = ('title', 'listing_type', 'price', 'location', 'source', 'updated_at', 'archived_at')
+    list_filter = ('listing_type', 'source')
+    list_select_related = ('source',)
+    search_fields = ('=external_id', 'title')
+    readonly_fields = ('created_at', 'updated_at', 'scraped_at', 'archived_at')
+    ordering = ('-archived_at',)
     raw_id_fields = ('source',)
 
+    # Favorites and notifications of an archived listing go with it (nothing cascades to them)
+    def delete_model(self, request, obj):
+        delete_archived_listings([obj.pk])
+
+    def delete_queryset(self, request, queryset):
+        delete_archived_listings(queryset.values_list('pk', flat=True))
+
+@admin.register(CachedImage)
+class CachedImageAdmin(LargeTableAdmin):
+    list_display = ('url', 'status', 'content_type', 'size', 'attempts', 'fetched_at')
+    list_filter = ('status',)
+    search_fields = ('=url_hash', '=content_hash')
+    readonly_fields = ('url_hash', 'content_hash', 'created_at', 'fetched_at')
+
 @admin.register(Filter)
 class FilterAdmin(admin.ModelAdmin):
     list_display = ('name', 'user', 'filter_type', 'is_active', 'created_at')
     list_filter = ('filter_type', 'is_active')
     search_fields = ('name', 'user__username')
+    list_select_related = ('user',)
     readonly_fields = ('created_at', 'updated_at')
+    raw_id_fields = ('user', 'place')
+
+    def delete_model(self, request, obj):
+        delete_with_notifications(Filter.objects.filter(pk=obj.pk), 'filter')
 
+    def delete_queryset(self, request, queryset):
+        delete_with_notifications(queryset, 'filter')
+
+# The listing of a favorite/notification may be archived, and select_related would join
+# only the live table (hiding those rows), so listings are prefetched instead:
+# one extra query per page that also looks in the archive (see ArchiveAwareListingDescriptor)
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(LargeTableAdmin):
     list_display = ('user', 'listing', 'created_at')
-    search_fields = ('user__username', 'listing__title')
+    list_select_related = ('user',)
+    search_fields = ('=user__username',)
     readonly_fields = ('created_at',)
+    raw_id_fields = ('user', 'listing')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('listing')
+
+    # Also finds favorites by listing title. listing__title would join only the live table,
+    # so titles are searched in the live table and the archive (both trigram indexed)
+    # and favorites are matched on the listing ids found
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        words = search_term.split()
+        if not words:
+            return results, may_have_duplicates
+        live, archived = Listing.objects.all(), ArchivedListing.objects.all()
+        for word in words:
+            live, archived = live.filter(title__icontains=word), archived.filter(title__icontains=word)
+        by_title = queryset.filter(
+            Q(listing_id__in=live.values('pk')) | Q(listing_id__in=archived.values('pk'))
+        )
+        return results | by_title, may_have_duplicates
 
 @admin.register(Notification)
-class NotificationAdmin(admin.ModelAdmin):
-    list_display = ('user', 'listing', 'message', 'read', 'created_at')
-    list_filter = ('read',)
-    search_fields = ('user__username', 'listing__title', 'message')
-    readonly_fields = ('created_at',)
+class NotificationAdmin(LargeTableAdmin):
+    list_display = ('user', 'listing', 'notification_type', 'status', 'read', 'message', 'created_at', 'sent_at')
+    list_filter = ('status', 'notification_type', 'read')
+    list_select_related = ('user',)
+    search_fields = ('=user__username', 'message')
+    # read only changes through the actions, which keep the users' unread counters right
+    readonly_fields = ('read', 'created_at', 'sent_at')
+    raw_id_fields = ('user', 'filter', 'listing')
+    actions = ('resend', 'mark_as_read', 'mark_as_unread')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('listing')
+
+    @admin.action(description="Resend selected notifications")
+    def resend(self, request, queryset):
+        # Back to the queue - the sender picks up pending notifications
+        updated = queryset.update(status='pending', sent_at=None)
+        self.message_user(request, f"Queued {updated} notifications to be sent again.", messages.SUCCESS)
+
+    # {user id: [notification ids]} - the inbox functions work one user at a time
+    def _by_user(self, queryset):
+        by_user = {}
+        for pk, user_id in queryset.values_list('pk', 'user_id'):
+            by_user.setdefault(user_id, []).append(pk)
+        return by_user
+
+    def _set_read(self, request, queryset, read):
+        changed = sum(mark_read(user_id, pks, read) for user_id, pks in self._by_user(queryset).items())
+        self.message_user(request, f"Marked {changed} notifications as {'read' if read else 'unread'}.", messages.SUCCESS)
+
+    @admin.action(description="Mark selected notifications as read")
+    def mark_as_read(self, request, queryset):
+        self._set_read(request, queryset, True)
+
+    @admin.action(description="Mark selected notifications as unread")
+    def mark_as_unread(self, request, queryset):
+        self._set_read(request, queryset, False)
+
+    # Saving and deleting through the admin keeps the unread counters right too
+    def save_model(self, request, obj, form, change):
+        with transaction.atomic():
+            old_user_id = form.initial.get('user') if change else None
+            super().save_model(request, obj, form, change)
+            if not change:
+                notifications_created([obj])
+            elif old_user_id != obj.user_id:
+                recount_unread([old_user_id, obj.user_id])
+
+    def delete_model(self, request, obj):
+        delete_notification_rows(Notification.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        delete_notification_rows(queryset)
@@ -0,0 +1,126 @@
+# Hot/cold split for listings
+# Old inactive listings (and active ones the scraper hasn't seen for a long time) are moved
+# from the live Listing table into ArchivedListing in small batches. Favorites, notifications
+# and detail lookups still find them there (see ListingForeignKey in models.py).
+# Their foreign key has no database constraint, so nothing cascades when an archived listing
+# is deleted: delete them with delete_archived_listings(), which removes those rows too.
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from .inbox import delete_notification_rows
+from .models import ArchivedListing, Favorite, Listing, Notification
+
+DEFAULTS = {
+    'INACTIVE_AFTER_DAYS': 30,   # archive listings that have been inactive this long
+    'STALE_AFTER_DAYS': 90,      # archive "active" listings not scraped for this long
+    'BATCH_SIZE': 1000,          # rows moved per transaction
+}
+
+
+def archive_settings():
+    return {**DEFAULTS, **getattr(settings, 'LISTING_ARCHIVE', {})}
+
+
+def archive_candidates(inactive_after_days=None, stale_after_days=None, now=None):
+    """
+    Listings that should be moved to the archive, oldest first.
+    """
+    config = archive_settings()
+    if inactive_after_days is None:
+        inactive_after_days = config['INACTIVE_AFTER_DAYS']
+    if stale_after_days is None:
+        stale_after_days = config['STALE_AFTER_DAYS']
+    now = now or timezone.now()
+
+    inactive = models.Q(is_active=False, updated_at__lt=now - timedelta(days=inactive_after_days))
+    stale = models.Q(is_active=True, scraped_at__lt=now - timedelta(days=stale_after_days))
+    return Listing.objects.filter(inactive | stale).order_by('updated_at')
+
+
+def _move_rows(source_queryset, target_model, extra_values=None):
+    # INSERT INTO target (...) SELECT ... FROM source WHERE ...; DELETE FROM source WHERE ...
+    # Done in SQL so rows never pass through Python and the delete doesn't cascade
+    # to favorites/notifications (they keep pointing at the same id).
+    fields = [field.attname for field in Listing._meta.concrete_fields]
+    columns = [Listing._meta.get_field(name).column for name in fields]
+    select_queryset = source_queryset.order_by()
+    if extra_values:
+        select_queryset = select_queryset.annotate(**extra_values)
+        columns += [target_model._meta.get_field(name).column for name in extra_values]
+    select_sql, select_params = select_queryset.values(*fields, *(extra_values or {})).query.sql_with_params()
+
+    quote = connection.ops.quote_name
+    source_table = quote(source_queryset.model._meta.db_table)
+    target_table = quote(target_model._meta.db_table)
+    pk_column = quote(source_queryset.model._meta.pk.column)
+    pk_sql, pk_params = source_queryset.order_by().values('pk').query.sql_with_params()
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {target_table} ({', '.join(quote(c) for c in columns)}) {select_sql}",
+            select_params,
+        )
+        cursor.execute(f"DELETE FROM {source_table} WHERE {pk_column} IN ({pk_sql})", pk_params)
+        return cursor.rowcount
+
+
+def archive_listings(pks, now=None):
+    """
+    Moves the given listings to the archive in one transaction. Returns how many were moved.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        return _move_rows(
+            Listing.objects.filter(pk__in=pks),
+            ArchivedListing,
+            extra_values={'archived_at': models.Value(now, output_field=models.DateTimeField())},
+        )
+
+
+def restore_listings(pks):
+    """
+    Moves archived listings back to the live table (e.g. when an ad shows up again).
+    """
+    with transaction.atomic():
+        return _move_rows(ArchivedListing.objects.filter(pk__in=pks), Listing)
+
+
+def restore_by_external_ids(external_ids):
+    """
+    Restores any archived listings with these external ids, so upserts update them
+    instead of creating duplicates.
+    """
+    pks = list(ArchivedListing.objects.filter(external_id__in=external_ids).values_list('pk', flat=True))
+    return restore_listings(pks) if pks else 0
+
+
+def delete_archived_listings(pks):
+    """
+    Deletes archived listings with their favorites and notifications (keeping unread counters right).
+    Returns how many listings were deleted.
+    """
+    pks = list(pks)
+    with transaction.atomic():
+        Favorite.objects.filter(listing_id__in=pks).delete()
+        delete_notification_rows(Notification.objects.filter(listing_id__in=pks))
+        deleted, _ = ArchivedListing.objects.filter(pk__in=pks).delete()
+    return deleted
+
+
+def run_archival(batch_size=None, max_batches=None, **candidate_kwargs):
+    """
+    Archives all current candidates in bounded batches. Yields the size of each batch moved.
+    """
+    batch_size = batch_size or archive_settings()['BATCH_SIZE']
+    now = timezone.now()
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        pks = list(archive_candidates(now=now, **candidate_kwargs).values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            break
+        yield archive_listings(pks, now=now)
+        batches += 1
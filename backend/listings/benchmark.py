@@ -0,0 +1,194 @@
+# API load benchmark
+# Replays a fixed set of requests against the API in-process (Django test client, no network)
+# and reports latency percentiles, throughput and queries per request for each scenario.
+# Also: a write benchmark comparing random (v4) and time-ordered (v7) primary keys.
+
+import math
+import statistics
+import subprocess
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import DatabaseError, connection, connections, models, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from .ids import uuid7
+from .models import Listing, User
+
+# (name, URL, needs a logged-in user?)
+# {listing} is replaced with a random existing listing id
+SCENARIOS = [
+    ('listings.list', '/api/listings/', False),
+    ('listings.list.page50', '/api/listings/?page=50', False),
+    ('listings.filter.car_price', '/api/listings/?listing_type=car&max_price=15000', False),
+    ('listings.filter.car_full', '/api/listings/?listing_type=car&min_year=2015&max_mileage=150000&fuel_type=diesel,hybrid', False),
+    ('listings.filter.location', '/api/listings/?location=R%C4%ABga&is_active=true', False),
+    ('listings.filter.real_estate', '/api/listings/?listing_type=real_estate&min_rooms=2&max_rooms=3&min_area=50', False),
+    ('listings.detail', '/api/listings/{listing}/', False),
+    ('favorites.list', '/api/favorites/', True),
+    ('notifications.list', '/api/notifications/', True),
+    ('filters.list', '/api/filters/', True),
+]
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile
+    if not sorted_values:
+        return None
+    rank = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+
+def summarize(timings, query_counts, total_seconds, statuses):
+    timings = sorted(timings)
+    return {
+        'requests': len(timings),
+        'p50_ms': round(percentile(timings, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 2),
+        'mean_ms': round(statistics.fmean(timings) * 1000, 2),
+        'throughput_rps': round(len(timings) / total_seconds, 1) if total_seconds else None,
+        'queries_per_request': round(statistics.fmean(query_counts), 2),
+        'statuses': sorted(set(statuses)),
+    }
+
+
+def benchmark_user():
+    """
+    A user that actually has favorites and notifications, so the per-user endpoints do real work.
+    """
+    user = User.objects.filter(favorite__isnull=False, notification__isnull=False).first()
+    return user or User.objects.first()
+
+
+def run_scenario(client, url, requests, warmup):
+    for _ in range(warmup):
+        client.get(url)
+
+    # Reads may go to a replica (see db_router.py), so queries are counted on every database
+    databases = [connections[alias] for alias in settings.DATABASES]
+    timings, query_counts, statuses = [], [], []
+    started = time.perf_counter()
+    for _ in range(requests):
+        with ExitStack() as stack:
+            captured = [stack.enter_context(CaptureQueriesContext(database)) for database in databases]
+            start = time.perf_counter()
+            response = client.get(url)
+            timings.append(time.perf_counter() - start)
+        query_counts.append(sum(len(queries) for queries in captured))
+        statuses.append(response.status_code)
+    return timings, query_counts, time.perf_counter() - started, statuses
+
+
+def run_benchmark(requests=100, warmup=5, only=None):
+    """
+    Runs every scenario (or the ones named in `only`) and returns {scenario name: summary}.
+    """
+    anonymous = APIClient()
+    logged_in = APIClient()
+    user = benchmark_user()
+    if user:
+        logged_in.force_authenticate(user)
+
+    listing_ids = list(Listing.objects.values_list('id', flat=True)[:1])
+    results = {}
+    for name, url, needs_user in SCENARIOS:
+        if only and name not in only:
+            continue
+        if needs_user and not user:
+            continue
+        if '{listing}' in url:
+            if not listing_ids:
+                continue
+            url = url.format(listing=listing_ids[0])
+        client = logged_in if needs_user else anonymous
+        results[name] = {'url': url, **summarize(*run_scenario(client, url, requests, warmup))}
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+# === PRIMARY KEY WRITE BENCHMARK ===
+
+ID_GENERATORS = {
+    'uuid4': uuid.uuid4,
+    'uuid7': uuid7,
+}
+
+
+def _primary_key_index_size(cursor, table):
+    # Size of the primary key index in bytes (None if the database can't tell)
+    if connection.vendor == 'postgresql':
+        cursor.execute(
+            "SELECT pg_relation_size(indexrelid) FROM pg_index WHERE indrelid = %s::regclass AND indisprimary",
+            [table],
+        )
+        row = cursor.fetchone()
+        return row[0] if row else None
+    if connection.vendor == 'sqlite':
+        # dbstat is only there if SQLite was compiled with it
+        try:
+            cursor.execute(
+                "SELECT SUM(pgsize) FROM dbstat WHERE name IN "
+                "(SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s)",
+                [table],
+            )
+        except DatabaseError:
+            return None
+        return cursor.fetchone()[0]
+    return None
+
+
+def run_id_benchmark(rows=200000, batch_size=1000, payload_size=200):
+    """
+    Inserts the same number of rows into two scratch tables, one keyed by uuid4 and one by
+    uuid7, and reports insert throughput (overall and for the last 10% of rows, when the index
+    is biggest) and the final primary key index size. The scratch tables are dropped afterwards.
+    """
+    uuid_field = models.UUIDField()
+    column_type = connection.data_types['UUIDField']
+    payload = 'x' * payload_size
+    results = {}
+    for name, generate in ID_GENERATORS.items():
+        table = f"benchmark_ids_{name}"
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+            cursor.execute(f"CREATE TABLE {table} (id {column_type} PRIMARY KEY, payload varchar({payload_size}) NOT NULL)")
+
+        batch_seconds = []
+        for start in range(0, rows, batch_size):
+            # Ids are generated before the clock starts - only the database work is timed
+            values = [
+                (uuid_field.get_db_prep_value(generate(), connection), payload)
+                for _ in range(min(batch_size, rows - start))
+            ]
+            started = time.perf_counter()
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(f"INSERT INTO {table} (id, payload) VALUES (%s, %s)", values)
+            batch_seconds.append(time.perf_counter() - started)
+
+        with connection.cursor() as cursor:
+            index_bytes = _primary_key_index_size(cursor, table)
+            cursor.execute(f"DROP TABLE {table}")
+
+        tail = batch_seconds[-max(1, len(batch_seconds) // 10):]
+        tail_rows = min(rows, len(tail) * batch_size)
+        results[name] = {
+            'rows': rows,
+            'seconds': round(sum(batch_seconds), 3),
+            'rows_per_second': round(rows / sum(batch_seconds), 1),
+            'last_10pct_rows_per_second': round(tail_rows / sum(tail), 1),
+            'index_bytes': index_bytes,
+        }
+    return results
@@ -0,0 +1,111 @@
+# Fast bulk loading of rows that skips the ORM
+# On PostgreSQL rows are streamed with COPY ... FROM STDIN; other databases (SQLite in
+# development) get a plain executemany INSERT. Either way values are written as given,
+# so things like created_at are not overwritten by auto_now.
+
+import json
+from datetime import date, datetime
+from io import StringIO
+
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+# Rows sent to the database per COPY / executemany call
+CHUNK_SIZE = 10000
+
+
+def _default_value(field, now):
+    if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+        return now
+    # The field's default, or '' / None like the ORM would use
+    return field.get_default()
+
+
+def _copy_text(value, field):
+    # One value in COPY's text format: \N is NULL, and \, tab and newlines are escaped
+    if value is None:
+        return '\\N'
+    if isinstance(field, models.JSONField):
+        value = json.dumps(value, ensure_ascii=False)
+    elif isinstance(value, bool):
+        value = 't' if value else 'f'
+    elif isinstance(value, (datetime, date)):
+        value = value.isoformat()
+    else:
+        value = str(value)
+    return (
+        value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+    )
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _copy_chunk(cursor, table, columns, fields, chunk):
+    buffer = StringIO()
+    for row in chunk:
+        buffer.write('\t'.join(_copy_text(value, field) for value, field in zip(row, fields)))
+        buffer.write('\n')
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+    raw_cursor = cursor.cursor
+    if hasattr(raw_cursor, 'copy'):
+        # psycopg 3
+        with raw_cursor.copy(sql) as copy:
+            copy.write(buffer.getvalue())
+    else:
+        # psycopg2
+        buffer.seek(0)
+        raw_cursor.copy_expert(sql, buffer)
+
+
+def copy_into(cursor, table, columns, rows):
+    """
+    COPYs plain value rows into an existing table, e.g. a temporary one (PostgreSQL only).
+    """
+    _copy_chunk(cursor, table, columns, [None] * len(columns), rows)
+
+
+def _insert_chunk(cursor, table, columns, fields, chunk):
+    placeholders = ', '.join(['%s'] * len(columns))
+    rows = [
+        [field.get_db_prep_save(value, connection) for value, field in zip(row, fields)]
+        for row in chunk
+    ]
+    cursor.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+
+
+def copy_rows(model, rows, chunk_size=CHUNK_SIZE):
+    """
+    Loads an iterable of {field name: value} dicts into the model's table in chunks.
+    Fields missing from a row get their default (auto_now fields get the current time);
+    auto-increment primary keys are left to the database. Returns the number of rows loaded.
+    Each chunk is committed separately, so memory stays flat and a crash loses one chunk at most.
+    """
+    fields = [
+        field for field in model._meta.concrete_fields
+        if not (field.primary_key and isinstance(field, models.AutoField))
+    ]
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    columns = [quote(field.column) for field in fields]
+    load_chunk = _copy_chunk if connection.vendor == 'postgresql' else _insert_chunk
+
+    total = 0
+    for chunk in _chunks(rows, chunk_size):
+        now = timezone.now()
+        values = [
+            [row[field.attname] if field.attname in row else _default_value(field, now) for field in fields]
+            for row in chunk
+        ]
+        with transaction.atomic(), connection.cursor() as cursor:
+            load_chunk(cursor, table, columns, fields, values)
+        total += len(values)
+    return total
@@ -0,0 +1,140 @@
+# Query parameter filtering for listings
+# Shared by the listings API, the export endpoint and the export_listings command,
+# so "the same filters" always means the same thing everywhere
+
+from django.db.models import F
+from rest_framework import serializers
+from .models import DEAL_SCORE_RANK, Listing, Place
+from .places import places_within
+
+
+def _comma_list(value):
+    # "petrol,diesel" -> ['petrol', 'diesel']
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+class ListingFilterSerializer(serializers.Serializer):
+    # === COMMON FILTERS ===
+    listing_type = serializers.ChoiceField(choices=Listing.LISTING_TYPES, required=False)
+    source = serializers.IntegerField(required=False)
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    location = serializers.CharField(max_length=100, required=False)
+    place = serializers.IntegerField(required=False)
+    region = serializers.ChoiceField(choices=Place.REGIONS, required=False)
+
+    # "Within N km": ?near=56.95,24.10&radius_km=20 or ?near_place=<place id>&radius_km=20
+    near = serializers.RegexField(r'^-?\d+(\.\d+)?,-?\d+(\.\d+)?$', required=False)
+    near_place = serializers.IntegerField(required=False)
+    radius_km = serializers.FloatField(min_value=0, max_value=500, required=False)
+    is_active = serializers.BooleanField(required=False, allow_null=True, default=None)
+
+    # Only listings changed at or after this moment (for incremental pulls)
+    changed_since = serializers.DateTimeField(required=False)
+
+    # === CAR FILTERS ===
+    min_year = serializers.IntegerField(required=False)
+    max_year = serializers.IntegerField(required=False)
+    max_mileage = serializers.IntegerField(required=False)
+    fuel_type = serializers.CharField(required=False)       # comma separated
+    car_category = serializers.CharField(required=False)    # comma separated
+
+    # === REAL ESTATE FILTERS ===
+    min_rooms = serializers.IntegerField(required=False)
+    max_rooms = serializers.IntegerField(required=False)
+    min_area = serializers.DecimalField(max_digits=8, decimal_places=2, required=False)
+    max_area = serializers.DecimalField(max_digits=8, decimal_places=2, required=False)
+    property_type = serializers.CharField(required=False)   # comma separated
+
+
+# query param name -> ORM lookup
+FILTER_LOOKUPS = {
+    'listing_type': 'listing_type',
+    'source': 'source_id',
+    'min_price': 'price__gte',
+    'max_price': 'price__lte',
+    'location': 'location',
+    'place': 'place_id',
+    'region': 'place__region',
+    'is_active': 'is_active',
+    'changed_since': 'updated_at__gte',
+    'min_year': 'year__gte',
+    'max_year': 'year__lte',
+    'max_mileage': 'mileage__lte',
+    'fuel_type': 'fuel_type__in',
+    'car_category': 'car_category__in',
+    'min_rooms': 'rooms__gte',
+    'max_rooms': 'rooms__lte',
+    'min_area': 'area__gte',
+    'max_area': 'area__lte',
+    'property_type': 'property_type__in',
+}
+
+LIST_PARAMS = ('fuel_type', 'car_category', 'property_type')
+
+# Handled separately (they combine into one "place_id IN (...)" condition)
+RADIUS_PARAMS = ('near', 'near_place', 'radius_km')
+
+# Allowed values of ?ordering= (prefix with - for descending, e.g. ?ordering=-deal_score)
+ORDERING_FIELDS = ('deal_score', 'price', 'created_at', 'updated_at')
+
+
+def _nearby_place_ids(values):
+    radius_km = values.get('radius_km')
+    if 'near' in values:
+        latitude, longitude = (float(part) for part in values['near'].split(','))
+    elif 'near_place' in values:
+        place = Place.objects.filter(pk=values['near_place']).values_list('latitude', 'longitude').first()
+        if place is None:
+            raise serializers.ValidationError({'near_place': ['Unknown place.']})
+        latitude, longitude = place
+    else:
+        raise serializers.ValidationError({'radius_km': ['Use together with near or near_place.']})
+    if radius_km is None:
+        raise serializers.ValidationError({'radius_km': ['Required with near / near_place.']})
+    return places_within(latitude, longitude, radius_km)
+
+
+def filter_listings(queryset, params):
+    """
+    Applies listing filters from a dict of query params to a Listing queryset.
+    Unknown params are ignored; invalid values raise serializers.ValidationError.
+    """
+    names = [*FILTER_LOOKUPS, *RADIUS_PARAMS]
+    data = {name: params.get(name) for name in names if params.get(name) not in (None, '')}
+    filter_serializer = ListingFilterSerializer(data=data)
+    filter_serializer.is_valid(raise_exception=True)
+
+    conditions = {}
+    values = filter_serializer.validated_data
+    if any(name in values for name in RADIUS_PARAMS):
+        conditions['place_id__in'] = _nearby_place_ids(values)
+    for name, value in values.items():
+        if value is None or name in RADIUS_PARAMS:
+            continue
+        if name in LIST_PARAMS:
+            value = _comma_list(value)
+        conditions[FILTER_LOOKUPS[name]] = value
+    return queryset.filter(**conditions)
+
+
+def order_listings(queryset, params):
+    """
+    Applies ?ordering=<field> / ?ordering=-<field> (see ORDERING_FIELDS) to a Listing queryset.
+    Listings without a value (like no deal_score yet) always come last.
+    """
+    ordering = params.get('ordering')
+    if not ordering:
+        return queryset
+    name = ordering.removeprefix('-')
+    if name not in ORDERING_FIELDS:
+        raise serializers.ValidationError({'ordering': [f"Choose one of: {', '.join(ORDERING_FIELDS)}"]})
+    if ordering == '-deal_score':
+        # Matches the listing_deal_score_idx expression index
+        expression = DEAL_SCORE_RANK.desc()
+    elif ordering.startswith('-'):
+        expression = F(name).desc(nulls_last=True)
+    else:
+        expression = F(name).asc(nulls_last=True)
+    # id breaks ties, so pages don't overlap
+    return queryset.order_by(expression, 'id')
@@ -0,0 +1,79 @@
+# Small geography helpers: geohash grid cells and distances
+# A geohash turns a coordinate into a short string; places that share a prefix are in the
+# same grid cell, so "what is near X" becomes a few indexed prefix lookups.
+
+import math
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+EARTH_RADIUS_KM = 6371.0
+
+
+def geohash_encode(latitude, longitude, precision=8):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    use_longitude = True
+    while len(chars) < precision:
+        value, value_range = (longitude, lon_range) if use_longitude else (latitude, lat_range)
+        middle = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            value_range[0] = middle
+        else:
+            value_range[1] = middle
+        use_longitude = not use_longitude
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """
+    (height, width) of a geohash cell in degrees.
+    """
+    total_bits = precision * 5
+    lat_bits = total_bits // 2
+    lon_bits = total_bits - lat_bits
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def covering_cells(latitude, longitude, radius_km, max_cells=32, max_precision=8):
+    """
+    Geohash prefixes whose cells together cover the circle around the point.
+    Picks the finest precision (up to max_precision, the length of the stored geohashes -
+    a longer prefix would match nothing) that needs at most max_cells cells.
+    """
+    lat_delta = radius_km / 111.32
+    lon_delta = radius_km / (111.32 * max(math.cos(math.radians(latitude)), 0.01))
+    south, north = latitude - lat_delta, latitude + lat_delta
+    west, east = longitude - lon_delta, longitude + lon_delta
+
+    best = {geohash_encode(latitude, longitude, 1)}
+    for precision in range(1, max_precision + 1):
+        height, width = cell_size(precision)
+        rows = math.floor(north / height) - math.floor(south / height) + 1
+        columns = math.floor(east / width) - math.floor(west / width) + 1
+        if rows * columns > max_cells:
+            break
+        cells = set()
+        lat = south
+        while lat < north + height:
+            lon = west
+            while lon < east + width:
+                cells.add(geohash_encode(min(lat, north), min(lon, east), precision))
+                lon += width
+            lat += height
+        best = cells
+    return best
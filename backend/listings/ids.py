@@ -0,0 +1,63 @@
+# Time-ordered UUIDs (version 7, RFC 9562) for primary keys
+# A v7 UUID starts with the creation time in milliseconds, so new rows get ids larger than
+# every existing one and are appended at the right edge of the primary key index, instead of
+# landing on a random B-tree page like uuid4 ids (page splits, cache misses, more WAL).
+# The rest is random, so ids are still unguessable and can be generated anywhere.
+
+import os
+import threading
+import time
+import uuid
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+_COUNTER_MAX = 0xFFF
+
+
+def _build(ms, counter, random_bits):
+    # 48 bits unix ms | version 7 | 12-bit counter | variant 10 | 62 random bits
+    value = (ms & 0xFFFFFFFFFFFF) << 80
+    value |= 0x7 << 76
+    value |= (counter & _COUNTER_MAX) << 64
+    value |= 0b10 << 62
+    value |= random_bits & ((1 << 62) - 1)
+    return uuid.UUID(int=value)
+
+
+def uuid7():
+    """
+    A new time-ordered UUID. Ids made by this process are strictly increasing, even within
+    the same millisecond (a 12-bit counter after the timestamp, started at a random value).
+    """
+    global _last_ms, _counter
+    with _lock:
+        ms = time.time_ns() // 1_000_000
+        if ms > _last_ms:
+            _last_ms = ms
+            # Random start, but low enough that the counter rarely overflows
+            _counter = int.from_bytes(os.urandom(2), 'big') & 0x7FF
+        else:
+            _counter += 1
+            if _counter > _COUNTER_MAX:
+                # More than ~2000 ids in one millisecond: borrow the next millisecond
+                _last_ms += 1
+                _counter = 0
+        ms, counter = _last_ms, _counter
+    return _build(ms, counter, int.from_bytes(os.urandom(8), 'big'))
+
+
+def uuid7_at(moment, entropy=None):
+    """
+    A v7 UUID for a row created at the given datetime (used when re-keying existing rows,
+    so their new ids sort in creation order). entropy (10+ bytes) replaces the random part,
+    for reproducible ids.
+    """
+    ms = int(moment.timestamp() * 1000)
+    entropy = entropy or os.urandom(10)
+    return _build(ms, int.from_bytes(entropy[:2], 'big'), int.from_bytes(entropy[2:10], 'big'))
+
+
+def is_time_ordered(value):
+    return value.version == 7
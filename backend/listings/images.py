@@ -0,0 +1,260 @@
+# Local image cache for listing pictures
+# Scraped image URLs are queued as CachedImage rows, downloaded by a pool of worker threads
+# (fetch_images command), stored once per content hash under MEDIA_ROOT and resized into
+# fixed-size thumbnails. The API serves them from /api/images/<url hash>/<size>/, cached by
+# clients for MAX_AGE and revalidated by content hash (ETag) after that - the URL is keyed by the
+# source URL, whose picture can change when it is evicted and fetched again. evict_images keeps
+# the cache under a size limit (least recently served first).
+
+import hashlib
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO
+from pathlib import Path
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from PIL import Image
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CachedImage
+
+DEFAULTS = {
+    'ROOT': 'image_cache',                  # folder inside MEDIA_ROOT
+    'SIZES': {'card': (400, 300), 'detail': (1024, 768)},
+    'ALLOWED_HOSTS': ['ss.com', 'www.ss.com', 'i.ss.com', 'i.ss.lv'],
+    'WORKERS': 8,
+    'TIMEOUT': 10,                          # seconds per download
+    'MAX_DOWNLOAD_BYTES': 15 * 1024 * 1024,
+    'MAX_ATTEMPTS': 3,
+    'MAX_REDIRECTS': 3,                     # each redirect target must be an allowed host too
+    'CLAIM_TIMEOUT': 15 * 60,               # seconds before a crashed worker's images are retried
+    'MAX_BYTES': 5 * 1024 ** 3,             # evict_images trims the cache to this size
+    'MAX_AGE': 24 * 3600,                   # seconds clients may reuse a served image unchecked
+}
+
+ORIGINAL = 'original'
+
+logger = logging.getLogger(__name__)
+
+
+def image_settings():
+    return {**DEFAULTS, **getattr(settings, 'IMAGE_CACHE', {})}
+
+
+def url_hash(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+def cache_root():
+    return Path(settings.MEDIA_ROOT) / image_settings()['ROOT']
+
+
+def image_path(content_hash, size=ORIGINAL):
+    # Two levels of folders so no single directory gets millions of files
+    return cache_root() / size / content_hash[:2] / content_hash[2:4] / content_hash
+
+
+def enqueue_images(urls):
+    """
+    Queues remote image URLs for download (already known URLs are ignored).
+    """
+    urls = {url for url in urls if url}
+    CachedImage.objects.bulk_create(
+        [CachedImage(url=url, url_hash=url_hash(url)) for url in urls],
+        ignore_conflicts=True,
+    )
+
+
+def _write_atomic(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as tmp:
+        tmp.write(data)
+    os.replace(tmp.name, path)
+
+
+def _check_host(url, config):
+    host = urlsplit(url).hostname or ''
+    if host not in config['ALLOWED_HOSTS']:
+        raise ValueError(f"Host not allowed: {host}")
+
+
+def download(url, config):
+    # Redirects are followed by hand, so every hop is checked against ALLOWED_HOSTS
+    # before anything is requested from it
+    for _ in range(config['MAX_REDIRECTS'] + 1):
+        _check_host(url, config)
+        resp = requests.get(
+            url, timeout=config['TIMEOUT'], stream=True, allow_redirects=False,
+            headers={"User-Agent": "Mozilla/5.0"},
+        )
+        if not resp.is_redirect:
+            break
+        resp.close()
+        url = urljoin(url, resp.headers['Location'])
+    else:
+        raise ValueError("Too many redirects")
+    with resp:
+        resp.raise_for_status()
+        chunks = []
+        received = 0
+        for chunk in resp.iter_content(64 * 1024):
+            received += len(chunk)
+            if received > config['MAX_DOWNLOAD_BYTES']:
+                raise ValueError("Image too large")
+            chunks.append(chunk)
+    return b''.join(chunks)
+
+
+def store_image(data, config):
+    """
+    Saves the original (once per content hash) and its thumbnails. Returns (content_hash, content_type).
+    """
+    content_hash = hashlib.sha256(data).hexdigest()
+    with Image.open(BytesIO(data)) as image:
+        image_format = image.format
+        image.load()
+        original = image_path(content_hash)
+        if not original.exists():
+            _write_atomic(original, data)
+        for size_name, dimensions in config['SIZES'].items():
+            path = image_path(content_hash, size_name)
+            if path.exists():
+                continue
+            thumbnail = image.convert('RGB')
+            thumbnail.thumbnail(dimensions)
+            buffer = BytesIO()
+            thumbnail.save(buffer, 'JPEG', quality=82, optimize=True)
+            _write_atomic(path, buffer.getvalue())
+    return content_hash, Image.MIME.get(image_format, 'application/octet-stream')
+
+
+def _process(image_id, url, config):
+    # Runs in a worker thread: network and files only, no database access.
+    # Any error (network, decompression bomb, broken file...) only fails this one image.
+    try:
+        data = download(url, config)
+        content_hash, content_type = store_image(data, config)
+        return image_id, {'content_hash': content_hash, 'content_type': content_type, 'size': len(data)}
+    except Exception as e:
+        logger.info("Image %s failed: %s", url, e)
+        return image_id, {'error': str(e) or e.__class__.__name__}
+
+
+def release_stale_claims(config=None):
+    """
+    Gives images claimed by a worker that never finished back to the queue (or fails them
+    once they used up their attempts). Returns how many were released.
+    """
+    config = config or image_settings()
+    stale = CachedImage.objects.filter(
+        status='fetching', claimed_at__lt=timezone.now() - timedelta(seconds=config['CLAIM_TIMEOUT']),
+    )
+    failed = stale.filter(attempts__gte=config['MAX_ATTEMPTS'] - 1).update(
+        status='failed', attempts=F('attempts') + 1, claimed_at=None,
+    )
+    return failed + stale.update(status='pending', attempts=F('attempts') + 1, claimed_at=None)
+
+
+def claim_pending(batch_size, config=None):
+    """
+    Marks up to batch_size pending images as 'fetching' for this worker. Returns [(id, url), ...].
+    Rows another worker has locked are skipped, so two workers never get the same image.
+    """
+    with transaction.atomic():
+        pending = list(
+            CachedImage.objects.filter(status='pending').order_by('created_at')
+            .select_for_update(skip_locked=True).values_list('id', 'url')[:batch_size]
+        )
+        CachedImage.objects.filter(pk__in=[image_id for image_id, _ in pending]).update(
+            status='fetching', claimed_at=timezone.now(),
+        )
+    return pending
+
+
+def fetch_pending(batch_size=100, workers=None):
+    """
+    Downloads one batch of pending images with a thread pool. Returns (ready, failed) counts.
+    """
+    config = image_settings()
+    release_stale_claims(config)
+    pending = claim_pending(batch_size, config)
+    if not pending:
+        return 0, 0
+
+    images = CachedImage.objects.in_bulk([image_id for image_id, _ in pending])
+    ready = failed = 0
+    with ThreadPoolExecutor(max_workers=workers or config['WORKERS']) as pool:
+        jobs = [pool.submit(_process, image_id, url, config) for image_id, url in pending]
+        for job in jobs:
+            image_id, result = job.result()
+            image = images[image_id]
+            image.attempts += 1
+            if 'error' in result:
+                image.status = 'failed' if image.attempts >= config['MAX_ATTEMPTS'] else 'pending'
+                failed += 1
+            else:
+                image.content_hash = result['content_hash']
+                image.content_type = result['content_type']
+                image.size = result['size']
+                image.status = 'ready'
+                image.fetched_at = timezone.now()
+                ready += 1
+            image.claimed_at = None
+            image.save(update_fields=[
+                'attempts', 'status', 'content_hash', 'content_type', 'size', 'fetched_at', 'claimed_at',
+            ])
+    return ready, failed
+
+
+def touch(path):
+    """
+    Marks a cached file as recently used (for LRU eviction), at most once an hour.
+    """
+    try:
+        now = timezone.now().timestamp()
+        if now - path.stat().st_mtime > 3600:
+            os.utime(path, (now, now))
+    except OSError:
+        pass
+
+
+def evict(max_bytes=None):
+    """
+    Deletes the least recently served images until the cache fits in max_bytes.
+    Returns (files deleted, bytes freed).
+    """
+    max_bytes = image_settings()['MAX_BYTES'] if max_bytes is None else max_bytes
+    # content hash -> [total bytes, last used, [paths]] (an image and its thumbnails go together)
+    entries = {}
+    total = 0
+    for path in cache_root().glob('*/*/*/*'):
+        if not path.is_file():
+            continue
+        stat = path.stat()
+        entry = entries.setdefault(path.name, [0, 0, []])
+        entry[0] += stat.st_size
+        entry[1] = max(entry[1], stat.st_mtime)
+        entry[2].append(path)
+        total += stat.st_size
+
+    deleted = freed = 0
+    evicted_hashes = []
+    for content_hash, (size, _, paths) in sorted(entries.items(), key=lambda item: item[1][1]):
+        if total - freed <= max_bytes:
+            break
+        for path in paths:
+            path.unlink(missing_ok=True)
+            deleted += 1
+        freed += size
+        evicted_hashes.append(content_hash)
+
+    for start in range(0, len(evicted_hashes), 1000):
+        CachedImage.objects.filter(content_hash__in=evicted_hashes[start:start + 1000]).update(status='evicted')
+    return deleted, freed
@@ -0,0 +1,180 @@
+# Notification inbox
+# Every user's notifications are read newest first through the (user, -created_at) index,
+# with cursor pagination, so page 500 costs the same as page 1. The unread badge comes from
+# User.unread_notifications, a counter kept next to the user row instead of a COUNT(*) over
+# the inbox. It is only ever changed by the number of rows an UPDATE/DELETE actually touched,
+# in the same transaction, so concurrent requests can't make it drift:
+#   new unread notification    +1
+#   marked read / unread       -n / +n (only rows whose state changed)
+#   unread notification gone   -n
+# There is no post_delete receiver (it would turn every cascade into a query per row): listings
+# and filters are deleted through delete_with_notifications(), which deletes their notifications
+# first, counted in bulk, so the cascade has nothing left to do.
+# Bulk loads (generate_data, import_legacy_db) write notifications directly and recount instead;
+# `trim_notifications --recount` repairs counters after anything that wrote around all of this.
+# trim_notifications keeps each inbox at KEEP_PER_USER notifications (oldest are deleted).
+
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+from .models import Notification, User
+
+DEFAULTS = {
+    'KEEP_PER_USER': 1000,   # trim_notifications deletes anything older in a user's inbox
+    'BATCH_SIZE': 1000,      # rows deleted / users recounted per transaction
+}
+
+
+def inbox_settings():
+    return {**DEFAULTS, **getattr(settings, 'NOTIFICATION_INBOX', {})}
+
+
+# Newest first; the cursor remembers where the last page ended instead of an OFFSET.
+# "count" is kept from the page-number responses this replaced: an inbox is trimmed to
+# KEEP_PER_USER rows, so counting it stays cheap.
+class InboxPagination(CursorPagination):
+    ordering = ('-created_at', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = queryset.count()
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        schema = super().get_paginated_response_schema(schema)
+        schema['properties'] = {'count': {'type': 'integer', 'example': 123}, **schema['properties']}
+        return schema
+
+
+def add_unread(user_id, delta):
+    if delta:
+        User.objects.filter(pk=user_id).update(
+            unread_notifications=Greatest(F('unread_notifications') + delta, Value(0))
+        )
+
+
+def unread_count(user_id):
+    return User.objects.values_list('unread_notifications', flat=True).get(pk=user_id)
+
+
+def notifications_created(notifications):
+    """
+    Counts newly saved notifications into their users' unread counters
+    (call it in the transaction that created them).
+    """
+    new_unread = Counter(notification.user_id for notification in notifications if not notification.read)
+    for user_id, count in new_unread.items():
+        add_unread(user_id, count)
+
+
+def mark_read(user_id, pks=None, read=True):
+    """
+    Marks a user's notifications (all of them, or the given ids) read or unread.
+    Returns how many changed state.
+    """
+    notifications = Notification.objects.filter(user_id=user_id, read=not read)
+    if pks is not None:
+        notifications = notifications.filter(pk__in=pks)
+    with transaction.atomic():
+        changed = notifications.update(read=read)
+        add_unread(user_id, -changed if read else changed)
+    return changed
+
+
+def delete_notification_rows(notifications):
+    """
+    Deletes a queryset of notifications and takes the unread ones off their users' counters.
+    Returns how many were deleted.
+    """
+    with transaction.atomic():
+        # Lock the rows first, so the unread counts match what gets deleted
+        unread = Counter(
+            user_id for user_id, read in notifications.select_for_update().values_list('user_id', 'read') if not read
+        )
+        # Nothing references notifications and no signals are connected, so this is one DELETE
+        deleted, _ = notifications.delete()
+        for user_id, count in unread.items():
+            add_unread(user_id, -count)
+    return deleted
+
+
+def delete_notifications(user_id, pks):
+    """
+    Deletes some of a user's notifications and takes the unread ones off the counter.
+    """
+    return delete_notification_rows(Notification.objects.filter(user_id=user_id, pk__in=pks))
+
+
+def delete_with_notifications(queryset, field):
+    """
+    Deletes listings or filters (`field` is the Notification foreign key to them) with their
+    notifications, which go first so the unread counters stay right.
+    Returns what QuerySet.delete() does.
+    """
+    pks = list(queryset.values_list('pk', flat=True))
+    with transaction.atomic():
+        delete_notification_rows(Notification.objects.filter(**{f"{field}__in": pks}))
+        return queryset.model.objects.filter(pk__in=pks).delete()
+
+
+def recount_unread(user_ids=None, batch_size=None):
+    """
+    Sets the unread counters from the notifications table (all users, or the given ones).
+    For after bulk loads, and to repair counters if something wrote around this module.
+    """
+    batch_size = batch_size or inbox_settings()['BATCH_SIZE']
+    unread = (
+        Notification.objects.filter(user=OuterRef('pk'), read=False)
+        .order_by().values('user').annotate(count=Count('pk')).values('count')
+    )
+    users = User.objects.order_by('pk')
+    if user_ids is not None:
+        users = users.filter(pk__in=list(user_ids))
+    last_pk = None
+    while True:
+        batch = users if last_pk is None else users.filter(pk__gt=last_pk)
+        pks = list(batch.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return
+        User.objects.filter(pk__in=pks).update(unread_notifications=Coalesce(Subquery(unread), 0))
+        last_pk = pks[-1]
+
+
+def overfull_inboxes(keep):
+    """
+    (user id, notification count) of users with more than `keep` notifications.
+    """
+    return (
+        Notification.objects.order_by().values_list('user').annotate(count=Count('pk'))
+        .filter(count__gt=keep).values_list('user', 'count')
+    )
+
+
+def trim_inbox(user_id, keep, batch_size=None):
+    """
+    Deletes a user's notifications beyond the newest `keep`, in batches.
+    Yields the number deleted per batch.
+    """
+    batch_size = batch_size or inbox_settings()['BATCH_SIZE']
+    inbox = Notification.objects.filter(user_id=user_id).order_by('-created_at', '-id')
+    while True:
+        pks = list(inbox.values_list('pk', flat=True)[keep:keep + batch_size])
+        if not pks:
+            return
+        yield delete_notifications(user_id, pks)
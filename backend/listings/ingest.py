@@ -0,0 +1,168 @@
+# Batch upsert of listings for external scrapers
+# Items are validated against one prefetched source lookup and written with one
+# INSERT ... ON CONFLICT (external_id) DO UPDATE per chunk instead of one request per listing.
+# A chunk is written in one transaction. If the body turns out to be unreadable part way
+# (a truncated or corrupt gzip stream), the chunks written so far stay written and
+# upsert_listings() raises UnreadableBody with their results, so the client knows where to resume.
+
+import gzip
+import json
+import zlib
+
+from django.db import transaction
+
+from .archive import restore_by_external_ids
+from .images import enqueue_images
+from .models import Listing, Source
+from .places import resolve_place
+from .serializers import ListingBatchSerializer
+from .similar import index_listings
+from .valuation import refresh_segments, segment_for
+
+# How many listings are validated and written together
+CHUNK_SIZE = 1000
+
+# Fields overwritten when a listing with the same external_id already exists
+UPSERT_FIELDS = [
+    'listing_type', 'source', 'title', 'description', 'price', 'location', 'place', 'images', 'url',
+    'year', 'mileage', 'fuel_type', 'car_category', 'rooms', 'area', 'property_type',
+    'market_segment', 'is_active', 'rescrape_requested', 'updated_at', 'scraped_at',
+]
+
+
+class UnreadableBody(Exception):
+    """
+    The request body couldn't be read to the end; `results` has the items written before that.
+    """
+    def __init__(self, message, results=()):
+        super().__init__(message)
+        self.results = list(results)
+
+
+def iter_ndjson(stream, compressed=False):
+    """
+    Yields one parsed item (or a ValueError) per non-empty line of an NDJSON stream.
+    The body is read line by line, so big (gzipped) uploads are never held in memory at once.
+    Raises UnreadableBody if the (compressed) stream is cut off or corrupt.
+    """
+    if compressed:
+        stream = gzip.GzipFile(fileobj=stream, mode='rb')
+    lines = iter(stream)
+    while True:
+        try:
+            line = next(lines)
+        except StopIteration:
+            return
+        except (OSError, EOFError, zlib.error) as e:
+            raise UnreadableBody(f"Could not read the request body: {e}") from e
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ValueError(f"Invalid JSON: {e}")
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _upsert_chunk(chunk, offset, sources):
+    results = [None] * len(chunk)
+    valid = {}  # external_id -> (position in chunk, Listing)
+
+    for position, item in enumerate(chunk):
+        index = offset + position
+        if isinstance(item, Exception):
+            results[position] = {'index': index, 'status': 'error', 'errors': {'non_field_errors': [str(item)]}}
+            continue
+        if not isinstance(item, dict):
+            results[position] = {'index': index, 'status': 'error', 'errors': {'non_field_errors': ['Expected an object.']}}
+            continue
+
+        serializer = ListingBatchSerializer(data=item, context={'sources': sources})
+        if not serializer.is_valid():
+            results[position] = {
+                'index': index, 'external_id': item.get('external_id'),
+                'status': 'error', 'errors': serializer.errors,
+            }
+            continue
+
+        listing = Listing(**serializer.validated_data)
+        listing.place_id = resolve_place(listing.location)
+        listing.market_segment = segment_for(listing)
+        if listing.external_id in valid:
+            # The same listing twice in one chunk: the later copy wins
+            earlier, _ = valid[listing.external_id]
+            results[earlier] = {'index': offset + earlier, 'external_id': listing.external_id, 'status': 'skipped'}
+        valid[listing.external_id] = (position, listing)
+
+    if valid:
+        listings = [listing for _, listing in valid.values()]
+        new_ids = {listing.external_id: listing.id for listing in listings}
+        with transaction.atomic():
+            # A listing that comes back after being archived is restored, not duplicated
+            restore_by_external_ids(list(valid))
+            # Segments these listings are leaving still count them until they are refreshed too
+            previous_segments = set(
+                Listing.objects.select_for_update().filter(external_id__in=list(valid))
+                .exclude(market_segment=None).values_list('market_segment', flat=True)
+            )
+            Listing.objects.bulk_create(
+                listings,
+                update_conflicts=True,
+                unique_fields=['external_id'],
+                update_fields=UPSERT_FIELDS,
+            )
+            # bulk_create doesn't hand back the ids of rows it updated (ours are set before the
+            # INSERT), so read them back. The upsert holds these rows' locks until commit, so
+            # a concurrent insert can't change them any more: a row that kept the id generated
+            # here was created by this chunk, any other id means it already existed.
+            ids = dict(Listing.objects.filter(external_id__in=list(valid)).values_list('external_id', 'id'))
+        for external_id, (position, listing) in valid.items():
+            listing.id = ids[external_id]
+            results[position] = {
+                'index': offset + position, 'external_id': external_id, 'id': str(listing.id),
+                'status': 'created' if listing.id == new_ids[external_id] else 'updated',
+            }
+        enqueue_images(image for listing in listings for image in listing.images or [])
+        index_listings(listings)
+        # Deal scores of the segments these listings are in or just left (only those)
+        refresh_segments(previous_segments | {listing.market_segment for listing in listings})
+    return results
+
+
+def upsert_listings(items, chunk_size=None):
+    """
+    Creates or updates listings (matched on external_id) from an iterable of dicts.
+    Returns one result dict per item, in input order.
+    If reading `items` fails with UnreadableBody, the chunk being read is dropped
+    and the exception is re-raised with the results of the chunks already written.
+    """
+    chunk_size = chunk_size or CHUNK_SIZE
+    sources = Source.objects.in_bulk()
+    results = []
+    try:
+        for chunk in _chunks(items, chunk_size):
+            results.extend(_upsert_chunk(chunk, len(results), sources))
+    except UnreadableBody as e:
+        raise UnreadableBody(str(e), results) from e.__cause__
+    return results
+
+
+def count_statuses(results):
+    """
+    {'created': n, 'updated': n, 'skipped': n, 'error': n} for upsert results.
+    """
+    counts = {status: 0 for status in ('created', 'updated', 'skipped', 'error')}
+    for result in results:
+        counts[result['status']] += 1
+    return counts
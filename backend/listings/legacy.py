@@ -0,0 +1,395 @@
+# Import of the old Express/SQLite database (database/agreggator.db, schema in create_tables.sql)
+# The legacy tables are read in id order, one chunk at a time (WHERE id > last ORDER BY id LIMIT n),
+# mapped to the Django models and loaded with bulkload.copy_rows (COPY on PostgreSQL).
+#
+# Legacy integer ids become UUIDs derived from (table, id), so foreign keys can be remapped
+# without keeping a lookup table in memory, and importing the same row twice gives the same id.
+# Progress (last id per table) is saved to a small JSON state file after every chunk, and rows
+# that already exist are skipped, so an interrupted import can simply be started again.
+# If rekey_uuid7 ran in between, the derived ids are followed to the rows' new ids (IdAlias).
+#
+# Old passwords (plain text) are not hashed by default: PBKDF2 per user would make the user
+# import take hours. Users get an unusable password instead, so has_usable_password() is False
+# for exactly the accounts that have to set a new one; hash_passwords=True opts in to hashing.
+
+import json
+import sqlite3
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth.hashers import make_password
+
+from .bulkload import copy_rows
+from .images import enqueue_images
+from .inbox import recount_unread
+from .models import BaseListing, Favorite, Listing, Notification, Source, User
+from .places import resolve_place
+from .rekey import alias_map
+from .valuation import market_segment
+
+# Namespace for legacy id -> UUID (any fixed UUID works, it just must never change)
+LEGACY_NAMESPACE = uuid.UUID('6f1d9c2e-5b1a-4d8e-9a63-0c2f7f3e4b10')
+
+# Rows read from the legacy database and loaded per chunk
+CHUNK_SIZE = 10000
+
+# Legacy type values -> ours
+LISTING_TYPES = {'car': 'car', 'real-estate': 'real_estate'}
+NOTIFICATION_TYPES = {
+    'new-listing': 'new_listing',
+    'price-change': 'price_drop',
+    'system': 'favorite_update',
+}
+
+# Our prices are all in euros. Legacy listings priced in anything else are not imported
+# (there are no exchange rates to convert with); they are counted in skipped_counts().
+CURRENCIES = {'EUR', '€'}
+
+# SQL conditions (l = legacy listings): a known type, and a listing that gets imported
+# (favorites and notifications of the others are left out too)
+KNOWN_TYPE = "l.type IN ({})".format(', '.join(f"'{value}'" for value in LISTING_TYPES))
+IMPORTED_LISTING = "{} AND UPPER(TRIM(l.currency)) IN ({})".format(
+    KNOWN_TYPE, ', '.join(f"'{value}'" for value in CURRENCIES),
+)
+
+# Keys of the legacy specs JSON -> listing fields (the old frontend's names)
+SPEC_FIELDS = {
+    'year': 'year',
+    'mileage': 'mileage',
+    'fuel': 'fuel_type',
+    'rooms': 'rooms',
+    'area': 'area',
+}
+
+FUEL_TYPES = {value for value, _ in BaseListing.FUEL_TYPES}
+PROPERTY_TYPES = {value for value, _ in BaseListing.PROPERTY_TYPES}
+
+# Import order: referenced tables first
+TABLES = ['users', 'listings', 'favorites', 'notifications']
+
+
+def legacy_id(table, legacy_pk):
+    """
+    The UUID a legacy row gets in the new database.
+    """
+    return uuid.uuid5(LEGACY_NAMESPACE, f"{table}:{legacy_pk}")
+
+
+def open_legacy(path):
+    # Read-only, so the import can never change the old database
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    connection.row_factory = sqlite3.Row
+    return connection
+
+
+def _columns(connection, table):
+    return {row['name'] for row in connection.execute(f"PRAGMA table_info({table})")}
+
+
+def normalize_email(email):
+    # Emails are usernames here, and the legacy app let "Anna@x.lv" and "anna@x.lv" both register
+    return (email or '').strip().lower()
+
+
+def _timestamp(value):
+    # SQLite CURRENT_TIMESTAMP is UTC "YYYY-MM-DD HH:MM:SS"
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(str(value))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=dt_timezone.utc)
+
+
+def _integer(value):
+    try:
+        return int(float(str(value).replace(' ', '').replace('km', '')))
+    except (TypeError, ValueError):
+        return None
+
+
+def _decimal(value, places='0.01'):
+    try:
+        return Decimal(str(value)).quantize(Decimal(places))
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+
+
+class LegacyImport:
+    """
+    One import run. state is a dict that is saved after every chunk:
+    {'last_ids': {table: last legacy id}, 'user_ids': {legacy user id: existing user id}}
+    """
+
+    def __init__(self, connection, state, chunk_size=CHUNK_SIZE, hash_passwords=False, on_chunk=None):
+        self.connection = connection
+        self.state = state
+        self.state.setdefault('last_ids', {})
+        # Legacy users whose email already exists here are linked to that user instead
+        self.state.setdefault('user_ids', {})
+        self.chunk_size = chunk_size
+        self.hash_passwords = hash_passwords
+        self.on_chunk = on_chunk or (lambda table, loaded, skipped: None)
+        self.sources = {}
+
+    def _chunks(self, table, query):
+        """
+        Yields lists of legacy rows after the last imported id, chunk by chunk.
+        query selects from the table aliased as t and has no WHERE / ORDER BY / LIMIT.
+        """
+        last_id = self.state['last_ids'].get(table, 0)
+        while True:
+            rows = self.connection.execute(
+                f"{query} WHERE t.id > ? ORDER BY t.id LIMIT ?",
+                [last_id, self.chunk_size],
+            ).fetchall()
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1]['id']
+
+    def _load(self, table, model, rows, last_id, skipped=0):
+        # Rows already imported by an interrupted run are skipped (also when re-keyed since)
+        pks = [row['id'] for row in rows]
+        existing = set(model.objects.filter(pk__in=pks).values_list('pk', flat=True)) | set(alias_map(model, pks))
+        new_rows = [row for row in rows if row['id'] not in existing]
+        if new_rows:
+            copy_rows(model, new_rows, chunk_size=len(new_rows))
+        self.state['last_ids'][table] = last_id
+        self.on_chunk(table, len(new_rows), skipped + len(rows) - len(new_rows))
+
+    def user_id(self, legacy_pk):
+        linked = self.state['user_ids'].get(str(legacy_pk))
+        return uuid.UUID(linked) if linked else legacy_id('users', legacy_pk)
+
+    def _follow_rekeys(self, rows, field, model):
+        # Users and listings imported by an earlier run may have been given new ids since
+        aliases = alias_map(model, {row[field] for row in rows})
+        if aliases:
+            for row in rows:
+                row[field] = aliases.get(row[field], row[field])
+
+    # === USERS ===
+
+    def import_users(self):
+        for rows in self._chunks('users', "SELECT t.* FROM users t"):
+            emails = [normalize_email(row['email']) for row in rows]
+            taken = dict(User.objects.filter(email__in=emails).values_list('email', 'id'))
+            mapped = []
+            for row, email in zip(rows, emails):
+                pk = legacy_id('users', row['id'])
+                if email in taken and taken[email] != pk:
+                    # Same person already has an account (maybe one earlier in this chunk, the
+                    # legacy emails differ in case only) - point their favorites etc. there
+                    self.state['user_ids'][str(row['id'])] = str(taken[email])
+                    continue
+                taken[email] = pk
+                created = _timestamp(row['created_at'])
+                mapped.append({
+                    'id': pk,
+                    'username': email,
+                    'email': email,
+                    'first_name': (row['name'] or '')[:150],
+                    # Old passwords were stored in plain text; None gives an unusable one (no hashing)
+                    'password': make_password(row['password'] if self.hash_passwords else None),
+                    'role': row['role'],
+                    'is_staff': row['role'] == 'admin',
+                    'date_joined': created,
+                    'created_at': created,
+                    'updated_at': _timestamp(row['updated_at']) or created,
+                })
+            self._load('users', User, mapped, rows[-1]['id'], skipped=len(rows) - len(mapped))
+
+    # === LISTINGS ===
+
+    def _source_id(self, name, listing_type):
+        name = (name or 'legacy').strip()[:20] or 'legacy'
+        key = (name, listing_type)
+        if key not in self.sources:
+            source = Source.objects.filter(name=name, source_type=listing_type).first()
+            if source is None:
+                source = Source.objects.create(name=name, source_type=listing_type, url='https://legacy.invalid/')
+            self.sources[key] = source.id
+        return self.sources[key]
+
+    def _images_table(self):
+        """
+        A table of listing_images that can be searched by listing_id. The legacy schema has no
+        index on it (and the database is opened read-only), so without one every chunk of
+        listings would scan all images: they are copied once into an indexed TEMP table.
+        """
+        for index in self.connection.execute("PRAGMA index_list(listing_images)").fetchall():
+            columns = [row['name'] for row in self.connection.execute(f"PRAGMA index_info({index['name']})")]
+            if columns[:1] == ['listing_id']:
+                return 'listing_images'
+        self.connection.execute("DROP TABLE IF EXISTS temp.listing_images_by_listing")
+        self.connection.execute(
+            "CREATE TEMP TABLE listing_images_by_listing AS "
+            "SELECT listing_id, id, url FROM main.listing_images ORDER BY listing_id, id"
+        )
+        self.connection.execute(
+            "CREATE INDEX temp.listing_images_by_listing_id ON listing_images_by_listing (listing_id, id)"
+        )
+        return 'listing_images_by_listing'
+
+    def _images(self, table, first_id, last_id):
+        # listing_images of one chunk of listings, as {legacy listing id: [urls]}
+        images = {}
+        rows = self.connection.execute(
+            f"SELECT listing_id, url FROM {table} WHERE listing_id BETWEEN ? AND ? ORDER BY listing_id, id",
+            [first_id, last_id],
+        )
+        for row in rows:
+            images.setdefault(row['listing_id'], []).append(row['url'])
+        return images
+
+    def _listing(self, row, images, has_hidden):
+        listing_type = LISTING_TYPES.get(row['type'])
+        price = _decimal(row['price'])
+        if listing_type is None or price is None or (row['currency'] or '').strip().upper() not in CURRENCIES:
+            return None
+        try:
+            specs = json.loads(row['specs']) if row['specs'] else {}
+        except ValueError:
+            specs = {}
+        if not isinstance(specs, dict):
+            specs = {}
+        values = {name: specs.get(key) for key, name in SPEC_FIELDS.items()}
+
+        created = _timestamp(row['created_at']) or _timestamp(row['date_posted'])
+        category = (row['category'] or '').strip()
+        listing = {
+            'id': legacy_id('listings', row['id']),
+            'external_id': f"legacy-{row['id']}",
+            'listing_type': listing_type,
+            'source_id': self._source_id(row['source'], listing_type),
+            'title': row['title'][:500],
+            'description': row['description'] or '',
+            'price': price,
+            'location': (row['location'] or '')[:100],
+            'place_id': resolve_place(row['location']),
+            'images': images.get(row['id'], []),
+            'url': '',
+            'is_active': not (has_hidden and row['hidden']),
+            'created_at': created,
+            'updated_at': _timestamp(row['updated_at']) or created,
+            'scraped_at': created,
+        }
+        if listing_type == 'car':
+            fuel = str(values['fuel_type'] or '').strip().lower()
+            listing.update({
+                'year': _integer(values['year']),
+                'mileage': _integer(values['mileage']),
+                'fuel_type': fuel if fuel in FUEL_TYPES else ('other' if fuel else None),
+                'car_category': category[:100] or None,
+            })
+        else:
+            category = category.lower()
+            listing.update({
+                'rooms': _integer(values['rooms']),
+                'area': _decimal(values['area']),
+                'property_type': category if category in PROPERTY_TYPES else ('other' if category else None),
+            })
+        listing['market_segment'] = market_segment(
+            listing_type, listing['title'], listing.get('property_type'), listing['place_id'], listing['location'],
+        )
+        return listing
+
+    def import_listings(self):
+        has_hidden = 'hidden' in _columns(self.connection, 'listings')
+        images_table = None
+        for rows in self._chunks('listings', "SELECT t.* FROM listings t"):
+            images_table = images_table or self._images_table()
+            images = self._images(images_table, rows[0]['id'], rows[-1]['id'])
+            mapped = [listing for listing in (self._listing(row, images, has_hidden) for row in rows) if listing]
+            self._load('listings', Listing, mapped, rows[-1]['id'], skipped=len(rows) - len(mapped))
+            enqueue_images(url for listing in mapped for url in listing['images'])
+
+    # === FAVORITES AND NOTIFICATIONS ===
+
+    def import_favorites(self):
+        # Favorites of users/listings that don't exist (anymore) are left out by the joins
+        query = (
+            "SELECT t.* FROM favorites t "
+            f"JOIN users u ON u.id = t.user_id JOIN listings l ON l.id = t.listing_id AND {IMPORTED_LISTING}"
+        )
+        for rows in self._chunks('favorites', query):
+            mapped = [
+                {
+                    'user_id': self.user_id(row['user_id']),
+                    'listing_id': legacy_id('listings', row['listing_id']),
+                    'created_at': _timestamp(row['created_at']),
+                }
+                for row in rows
+            ]
+            self._follow_rekeys(mapped, 'user_id', User)
+            self._follow_rekeys(mapped, 'listing_id', Listing)
+            # Favorites have integer ids of their own, so "already imported" means same user + listing
+            existing = set(
+                Favorite.objects.filter(
+                    user_id__in={row['user_id'] for row in mapped},
+                    listing_id__in=[row['listing_id'] for row in mapped],
+                ).values_list('user_id', 'listing_id')
+            )
+            new_rows = []
+            for row in mapped:
+                key = (row['user_id'], row['listing_id'])
+                # (two legacy accounts linked to the same user may have liked the same listing)
+                if key not in existing:
+                    existing.add(key)
+                    new_rows.append(row)
+            if new_rows:
+                copy_rows(Favorite, new_rows, chunk_size=len(new_rows))
+            self.state['last_ids']['favorites'] = rows[-1]['id']
+            self.on_chunk('favorites', len(new_rows), len(rows) - len(new_rows))
+
+    def import_notifications(self):
+        # Our notifications are always about a listing; legacy ones without one are left out
+        query = (
+            "SELECT t.* FROM notifications t "
+            f"JOIN users u ON u.id = t.user_id JOIN listings l ON l.id = t.listing_id AND {IMPORTED_LISTING}"
+        )
+        for rows in self._chunks('notifications', query):
+            mapped = []
+            for row in rows:
+                created = _timestamp(row['created_at'])
+                title, message = row['title'] or '', row['message'] or ''
+                mapped.append({
+                    'id': legacy_id('notifications', row['id']),
+                    'user_id': self.user_id(row['user_id']),
+                    'listing_id': legacy_id('listings', row['listing_id']),
+                    'notification_type': NOTIFICATION_TYPES.get(row['type'], 'favorite_update'),
+                    'status': 'sent',
+                    'message': f"{title}: {message}" if title and message else title or message,
+                    'created_at': created,
+                    'sent_at': created,
+                    'read': bool(row['read']),
+                })
+            self._follow_rekeys(mapped, 'user_id', User)
+            self._follow_rekeys(mapped, 'listing_id', Listing)
+            self._load('notifications', Notification, mapped, rows[-1]['id'])
+            # The rows went in with COPY, past the unread counters
+            recount_unread({row['user_id'] for row in mapped})
+
+    def run(self, tables=TABLES):
+        for table in tables:
+            getattr(self, f"import_{table}")()
+
+    def skipped_counts(self):
+        """
+        Legacy rows that can't be imported at all, as {reason: count}.
+        """
+        imported_listings = f"SELECT l.id FROM listings l WHERE {IMPORTED_LISTING}"
+        query = {
+            'legacy listings are not priced in EUR':
+                f"SELECT COUNT(*) FROM listings l WHERE {KNOWN_TYPE} AND l.id NOT IN ({imported_listings})",
+            'legacy listings have an unknown type':
+                f"SELECT COUNT(*) FROM listings l WHERE NOT ({KNOWN_TYPE})",
+            'legacy favorites point at missing or skipped users/listings':
+                "SELECT COUNT(*) FROM favorites t WHERE t.user_id NOT IN (SELECT id FROM users) "
+                f"OR t.listing_id NOT IN ({imported_listings})",
+            'legacy notifications point at missing or skipped users/listings':
+                "SELECT COUNT(*) FROM notifications t WHERE t.listing_id IS NULL "
+                "OR t.user_id NOT IN (SELECT id FROM users) "
+                f"OR t.listing_id NOT IN ({imported_listings})",
+        }
+        return {reason: self.connection.execute(sql).fetchone()[0] for reason, sql in query.items()}
@@ -0,0 +1,24 @@
+# Logging helpers
+
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+
+class QueueFileHandler(QueueHandler):
+    """
+    Log file handler that hands records to a background thread, so writing
+    a log line never blocks the request that produced it.
+    """
+
+    def __init__(self, filename, encoding='utf-8'):
+        super().__init__(queue.SimpleQueue())
+        self.file_handler = logging.FileHandler(filename, encoding=encoding)
+        self.listener = QueueListener(self.queue, self.file_handler)
+        self.listener.start()
+
+    def close(self):
+        # Writes whatever is still queued before closing the file
+        self.listener.stop()
+        self.file_handler.close()
+        super().close()
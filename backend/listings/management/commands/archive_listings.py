@@ -0,0 +1,39 @@
+# Moves old inactive and stale listings into the archive table
+# Usage:
+#   python manage.py archive_listings
+#   python manage.py archive_listings --inactive-days 14 --stale-days 60 --batch-size 500
+# Meant to run regularly (e.g. nightly cron); each batch is its own short transaction
+
+from django.core.management.base import BaseCommand
+
+from listings.archive import archive_candidates, archive_settings, run_archival
+from listings.metrics import track_job
+
+
+class Command(BaseCommand):
+    help = "Archive listings that have been inactive (or not scraped) for a long time"
+
+    def add_arguments(self, parser):
+        config = archive_settings()
+        parser.add_argument('--inactive-days', type=int, default=config['INACTIVE_AFTER_DAYS'])
+        parser.add_argument('--stale-days', type=int, default=config['STALE_AFTER_DAYS'])
+        parser.add_argument('--batch-size', type=int, default=config['BATCH_SIZE'])
+        parser.add_argument('--max-batches', type=int, help="Stop after this many batches")
+        parser.add_argument('--dry-run', action='store_true', help="Only count what would be archived")
+
+    def handle(self, *args, **options):
+        candidate_kwargs = {
+            'inactive_after_days': options['inactive_days'],
+            'stale_after_days': options['stale_days'],
+        }
+        if options['dry_run']:
+            count = archive_candidates(**candidate_kwargs).count()
+            self.stdout.write(f"{count} listings would be archived")
+            return
+
+        total = 0
+        with track_job('archive_listings'):
+            for moved in run_archival(options['batch_size'], options['max_batches'], **candidate_kwargs):
+                total += moved
+                self.stdout.write(f"Archived {moved} listings ({total} so far)")
+        self.stdout.write(self.style.SUCCESS(f"Done, archived {total} listings"))
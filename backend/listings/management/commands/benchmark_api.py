@@ -0,0 +1,77 @@
+# Benchmarks the key API endpoints and stores the results as JSON
+# Usage:
+#   python manage.py generate_data --listings 1000000
+#   python manage.py benchmark_api --requests 200
+#   python manage.py benchmark_api --compare benchmarks/<older commit>.json
+# Results go to benchmarks/<git commit>.json by default so runs can be compared between commits.
+
+import json
+import os
+import platform
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from listings.benchmark import SCENARIOS, git_commit, run_benchmark
+from listings.models import Favorite, Listing, Notification, User
+
+
+class Command(BaseCommand):
+    help = "Measure p50/p95/p99 latency, throughput and queries per request of the API"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100, help="Measured requests per scenario")
+        parser.add_argument('--warmup', type=int, default=5, help="Unmeasured requests per scenario")
+        parser.add_argument(
+            '--scenario', action='append', choices=[name for name, _, _ in SCENARIOS],
+            help="Only run this scenario (repeatable)",
+        )
+        parser.add_argument('--output', help="JSON file to write (default: benchmarks/<commit>.json)")
+        parser.add_argument('--compare', help="Earlier results JSON to compare against")
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError("--requests must be at least 1")
+        if options['warmup'] < 0:
+            raise CommandError("--warmup can't be negative")
+        commit = git_commit()
+        report = {
+            'commit': commit,
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'dataset': {
+                'listings': Listing.objects.count(),
+                'users': User.objects.count(),
+                'favorites': Favorite.objects.count(),
+                'notifications': Notification.objects.count(),
+            },
+            'settings': {'requests': options['requests'], 'warmup': options['warmup']},
+            'results': run_benchmark(options['requests'], options['warmup'], options['scenario']),
+        }
+
+        output = Path(options['output'] or Path(settings.BASE_DIR) / 'benchmarks' / f"{commit}.json")
+        os.makedirs(output.parent, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2))
+
+        previous = None
+        if options['compare']:
+            try:
+                previous = json.loads(Path(options['compare']).read_text())['results']
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f"Can't read {options['compare']}: {e}")
+
+        self.stdout.write(f"{'scenario':32} {'p50':>9} {'p95':>9} {'p99':>9} {'req/s':>8} {'queries':>8}")
+        for name, result in report['results'].items():
+            line = (
+                f"{name:32} {result['p50_ms']:>7.1f}ms {result['p95_ms']:>7.1f}ms {result['p99_ms']:>7.1f}ms "
+                f"{result['throughput_rps']:>8.1f} {result['queries_per_request']:>8.1f}"
+            )
+            if previous and name in previous:
+                change = (result['p95_ms'] - previous[name]['p95_ms']) / previous[name]['p95_ms'] * 100
+                line += f"   p95 {change:+.0f}%"
+            self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}"))
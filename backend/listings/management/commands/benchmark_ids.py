@@ -0,0 +1,47 @@
+# Compares insert throughput and primary key index size of random (uuid4) and
+# time-ordered (uuid7) ids, using two scratch tables
+# Usage:
+#   python manage.py benchmark_ids --rows 1000000
+# Results go to benchmarks/ids-<git commit>.json. Run it against PostgreSQL for real numbers.
+
+import json
+import os
+import platform
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from listings.benchmark import git_commit, run_id_benchmark
+
+
+class Command(BaseCommand):
+    help = "Measure insert throughput and index size with uuid4 vs uuid7 primary keys"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--output', help="JSON file to write (default: benchmarks/ids-<commit>.json)")
+
+    def handle(self, *args, **options):
+        commit = git_commit()
+        report = {
+            'commit': commit,
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'results': run_id_benchmark(options['rows'], options['batch_size']),
+        }
+        output = Path(options['output'] or Path(settings.BASE_DIR) / 'benchmarks' / f"ids-{commit}.json")
+        os.makedirs(output.parent, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2))
+
+        self.stdout.write(f"{'ids':8} {'rows/s':>10} {'last 10%':>10} {'index size':>12}")
+        for name, result in report['results'].items():
+            size = f"{result['index_bytes'] / 1024 ** 2:.1f} MB" if result['index_bytes'] is not None else 'n/a'
+            self.stdout.write(
+                f"{name:8} {result['rows_per_second']:>10.0f} {result['last_10pct_rows_per_second']:>10.0f} {size:>12}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}"))
@@ -0,0 +1,33 @@
+# Rebuilds the "similar listings" vector index from the database (see listings/similar.py)
+# Usage:
+#   python manage.py build_similarity_index
+#   python manage.py build_similarity_index --listing-type car
+# Ingest keeps the index current between runs; a regular rebuild (e.g. nightly cron)
+# recomputes the feature scaling and drops listings deactivated in bulk or archived
+
+from django.core.management.base import BaseCommand
+
+from listings.metrics import track_job
+from listings.models import Listing
+from listings.similar import FEATURES, SOURCE_FIELDS, get_index, similar_settings
+
+
+class Command(BaseCommand):
+    help = "Rebuild the memory-mapped feature vectors used by /api/listings/<id>/similar/"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listing-type', choices=list(FEATURES), help="Only rebuild this type")
+
+    def handle(self, *args, **options):
+        listing_types = [options['listing_type']] if options['listing_type'] else list(FEATURES)
+        chunk_size = similar_settings()['BUILD_CHUNK']
+        with track_job('build_similarity_index'):
+            for listing_type in listing_types:
+                rows = (
+                    Listing.objects.filter(listing_type=listing_type, is_active=True)
+                    .values(*SOURCE_FIELDS)
+                    .iterator(chunk_size=chunk_size)
+                )
+                count = get_index(listing_type).build(rows)
+                self.stdout.write(f"Indexed {count} {listing_type} listings")
+        self.stdout.write(self.style.SUCCESS("Done"))
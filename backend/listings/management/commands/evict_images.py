@@ -0,0 +1,22 @@
+# Frees disk space in the image cache, least recently served images first
+# Usage:
+#   python manage.py evict_images                  # trim to IMAGE_CACHE['MAX_BYTES']
+#   python manage.py evict_images --max-mb 2048
+
+from django.core.management.base import BaseCommand
+
+from listings.images import evict
+from listings.metrics import track_job
+
+
+class Command(BaseCommand):
+    help = "Delete least recently used cached images until the cache fits its size limit"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-mb', type=int, help="Cache size limit in MB (default: IMAGE_CACHE['MAX_BYTES'])")
+
+    def handle(self, *args, **options):
+        max_bytes = options['max_mb'] * 1024 * 1024 if options['max_mb'] is not None else None
+        with track_job('evict_images'):
+            deleted, freed = evict(max_bytes)
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} files, freed {freed / 1024 / 1024:.1f} MB"))
@@ -0,0 +1,65 @@
+# Dumps listings to a file (or stdout) as NDJSON or CSV
+# Usage:
+#   python manage.py export_listings --output listings.ndjson.gz --gzip
+#   python manage.py export_listings --format csv --filter listing_type=car --changed-since 2025-01-01T00:00
+# Uses the same filters as GET /api/listings/ and reads rows in chunks, so memory stays flat
+
+import gzip
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from listings.export import CHUNK_SIZE, EXPORT_FORMATS, blocks, csv_lines, iter_rows, ndjson_lines
+from listings.filters import filter_listings
+from listings.models import Listing
+
+
+class Command(BaseCommand):
+    help = "Stream all listings (optionally filtered) to NDJSON or CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='ndjson')
+        parser.add_argument('--output', help="File to write to (default: stdout)")
+        parser.add_argument('--gzip', action='store_true', help="Gzip the output")
+        parser.add_argument('--changed-since', help="Only listings updated at or after this ISO datetime")
+        parser.add_argument(
+            '--filter', action='append', default=[], metavar='NAME=VALUE',
+            help="Listing API filter, e.g. --filter listing_type=car (repeatable)",
+        )
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        params = {}
+        for item in options['filter']:
+            name, sep, value = item.partition('=')
+            if not sep:
+                raise CommandError(f"Filters must look like NAME=VALUE, got: {item}")
+            params[name] = value
+        if options['changed_since']:
+            params['changed_since'] = options['changed_since']
+
+        try:
+            queryset = filter_listings(Listing.objects.all(), params)
+        except ValidationError as e:
+            raise CommandError(f"Invalid filters: {e.detail}")
+
+        rows = iter_rows(queryset, chunk_size=options['chunk_size'])
+        lines = ndjson_lines(rows) if options['format'] == 'ndjson' else csv_lines(rows)
+
+        if options['output']:
+            opener = gzip.open if options['gzip'] else open
+            out = opener(options['output'], 'wb')
+        elif options['gzip']:
+            out = gzip.GzipFile(fileobj=sys.stdout.buffer, mode='wb')
+        else:
+            out = sys.stdout.buffer
+
+        try:
+            for block in blocks(lines):
+                out.write(block)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+            else:
+                out.flush()
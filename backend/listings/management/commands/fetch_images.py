@@ -0,0 +1,50 @@
+# Downloads queued listing images into the local cache and makes thumbnails
+# Usage:
+#   python manage.py fetch_images                 # process everything pending, then exit
+#   python manage.py fetch_images --forever       # keep running as a background worker
+#   python manage.py fetch_images --enqueue-existing   # queue images of listings already in the DB
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from listings.images import enqueue_images, fetch_pending
+from listings.metrics import track_job
+from listings.models import Listing
+
+
+class Command(BaseCommand):
+    help = "Download pending listing images with a pool of worker threads"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help="Parallel downloads (default: IMAGE_CACHE['WORKERS'])")
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--forever', action='store_true', help="Keep polling for new images")
+        parser.add_argument('--poll-seconds', type=int, default=30)
+        parser.add_argument('--enqueue-existing', action='store_true', help="Queue images of all active listings first")
+
+    def handle(self, *args, **options):
+        if options['enqueue_existing']:
+            images = Listing.objects.filter(is_active=True).values_list('images', flat=True).iterator(chunk_size=2000)
+            batch = []
+            for listing_images in images:
+                batch.extend(listing_images or [])
+                if len(batch) >= 5000:
+                    enqueue_images(batch)
+                    batch = []
+            enqueue_images(batch)
+
+        while True:
+            with track_job('fetch_images'):
+                ready = failed = 0
+                while True:
+                    batch_ready, batch_failed = fetch_pending(options['batch_size'], options['workers'])
+                    if not batch_ready and not batch_failed:
+                        break
+                    ready += batch_ready
+                    failed += batch_failed
+                    self.stdout.write(f"{ready} images cached, {failed} failed so far")
+            if not options['forever']:
+                break
+            time.sleep(options['poll_seconds'])
+        self.stdout.write(self.style.SUCCESS("Done"))
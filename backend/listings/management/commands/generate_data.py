@@ -0,0 +1,69 @@
+# Fills the database with synthetic sources, users, listings, filters, favorites and notifications
+# Usage:
+#   python manage.py generate_data --listings 100000
+#   python manage.py generate_data --listings 5000000 --users 200000 --seed 7
+# Rows are loaded with COPY on PostgreSQL (see bulkload.py), in chunks, with flat memory use.
+# The same --seed always produces the same data; use a different seed to add more on top.
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from listings import synthetic
+from listings.bulkload import CHUNK_SIZE, copy_rows
+from listings.inbox import recount_unread
+from listings.models import Favorite, Filter, Listing, Notification, Place, Source, User
+from listings.places import load_gazetteer
+
+
+class Command(BaseCommand):
+    help = "Generate synthetic data at scale for load testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=100000)
+        parser.add_argument('--users', type=int, help="Default: one user per 100 listings")
+        parser.add_argument('--filters-per-user', type=int, default=2, help="Average")
+        parser.add_argument('--favorites-per-user', type=int, default=5, help="Average")
+        parser.add_argument('--notifications-per-user', type=int, default=20, help="Average")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        seed = options['seed']
+        listing_count = options['listings']
+        user_count = options['users'] if options['users'] is not None else max(1, listing_count // 100)
+        if listing_count < 1:
+            raise CommandError("--listings must be at least 1")
+        if Listing.objects.filter(external_id=f"synthetic-{seed}-0").exists():
+            raise CommandError(f"Data for seed {seed} already exists, pick another --seed")
+
+        # Listings are linked to places as they are generated
+        if not Place.objects.exists():
+            load_gazetteer()
+
+        source_ids = {'car': [], 'real_estate': []}
+        for data in synthetic.sources():
+            source, _ = Source.objects.get_or_create(name=data['name'], defaults=data)
+            source_ids[source.source_type].append(source.id)
+
+        chunk_size = options['chunk_size']
+        # One "now" for every step, so favorites and notifications rebuild the same user/listing ids
+        now = timezone.now()
+        steps = [
+            (User, synthetic.users(seed, user_count, now)),
+            (Listing, synthetic.listings(seed, listing_count, source_ids, now)),
+            (Filter, synthetic.filters(seed, user_count, options['filters_per_user'], now)),
+            (Favorite, synthetic.favorites(seed, user_count, listing_count, options['favorites_per_user'], now)),
+            (Notification, synthetic.notifications(seed, user_count, listing_count, options['notifications_per_user'], now)),
+        ]
+        for model, rows in steps:
+            start = time.perf_counter()
+            loaded = copy_rows(model, rows, chunk_size=chunk_size)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{model.__name__}: {loaded} rows in {elapsed:.1f}s ({loaded / max(elapsed, 1e-9):.0f} rows/s)"
+            )
+        # Notifications were loaded past the unread counters
+        recount_unread()
+        self.stdout.write(self.style.SUCCESS("Done. Run ANALYZE on PostgreSQL before benchmarking."))
@@ -0,0 +1,77 @@
+# Imports users, listings (with their images), favorites and notifications from the old
+# Express/SQLite database into the Django models (see listings/legacy.py)
+# Usage:
+#   python manage.py import_legacy_db
+#   python manage.py import_legacy_db path/to/agreggator.db --chunk-size 20000
+#   python manage.py import_legacy_db --hash-passwords   # hash the old passwords too (slow, PBKDF2 per user)
+# Without --hash-passwords users get unusable passwords and have to reset them.
+# Progress is kept in <database>.import-state.json; running the command again continues
+# where it stopped (--restart ignores the saved progress).
+
+import json
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from listings.legacy import CHUNK_SIZE, TABLES, LegacyImport, open_legacy
+from listings.metrics import track_job
+
+
+class Command(BaseCommand):
+    help = "Import the legacy SQLite database (database/agreggator.db) into the Django models"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default=str(Path(settings.BASE_DIR) / 'database' / 'agreggator.db'),
+        )
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--state', help="Progress file (default: <path>.import-state.json)")
+        parser.add_argument('--restart', action='store_true', help="Start from the beginning")
+        parser.add_argument('--tables', nargs='+', choices=TABLES, default=TABLES)
+        parser.add_argument(
+            '--hash-passwords', action='store_true',
+            help="Hash the old passwords (slow) instead of giving imported users unusable ones",
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f"{path} does not exist")
+        state_path = Path(options['state'] or f"{path}.import-state.json")
+        state = {}
+        if state_path.exists() and not options['restart']:
+            state = json.loads(state_path.read_text())
+            self.stdout.write(f"Resuming from {state_path}: {state.get('last_ids', {})}")
+
+        totals = {}
+        started = time.perf_counter()
+
+        def on_chunk(table, loaded, skipped):
+            # Saved after every committed chunk, so a crash loses at most one chunk of progress
+            state_path.write_text(json.dumps(state))
+            count = totals.setdefault(table, [0, 0])
+            count[0] += loaded
+            count[1] += skipped
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{table}: {count[0]} imported, {count[1]} skipped ({elapsed:.0f}s)")
+
+        connection = open_legacy(path)
+        try:
+            importer = LegacyImport(
+                connection, state, chunk_size=options['chunk_size'],
+                hash_passwords=options['hash_passwords'], on_chunk=on_chunk,
+            )
+            with track_job('import_legacy_db'):
+                importer.run(options['tables'])
+            unusable = importer.skipped_counts()
+        finally:
+            connection.close()
+
+        for reason, count in unusable.items():
+            if count:
+                self.stdout.write(self.style.WARNING(f"{count} {reason} and were not imported"))
+        self.stdout.write(self.style.SUCCESS(
+            "Done. Run update_deal_scores and build_similarity_index to include the imported listings."
+        ))
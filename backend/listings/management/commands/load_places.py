@@ -0,0 +1,37 @@
+# Loads the bundled gazetteer of Latvian places and links listings/filters to them
+# Usage:
+#   python manage.py load_places              # create/update Place rows
+#   python manage.py load_places --backfill   # ...and resolve existing location strings
+# The backfill runs one UPDATE per distinct location string, not one per listing.
+
+from django.core.management.base import BaseCommand
+
+from listings.models import ArchivedListing, Filter, Listing
+from listings.places import load_gazetteer, resolve_place
+
+
+class Command(BaseCommand):
+    help = "Load Latvian places and resolve listing/filter locations to them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backfill', action='store_true', help="Resolve locations of existing rows")
+
+    def handle(self, *args, **options):
+        count = load_gazetteer()
+        self.stdout.write(f"{count} places loaded")
+        if not options['backfill']:
+            return
+
+        for model in (Listing, ArchivedListing, Filter):
+            resolved = unresolved = 0
+            locations = list(
+                model.objects.filter(place__isnull=True).exclude(location=None)
+                .values_list('location', flat=True).distinct()
+            )
+            for location in locations:
+                place_id = resolve_place(location)
+                if place_id is None:
+                    unresolved += 1
+                    continue
+                resolved += model.objects.filter(location=location, place__isnull=True).update(place_id=place_id)
+            self.stdout.write(f"{model.__name__}: {resolved} rows linked, {unresolved} unknown location strings")
@@ -0,0 +1,35 @@
+# Gives existing users, listings, filters and notifications time-ordered (v7) ids, online
+# Usage:
+#   python manage.py rekey_uuid7
+#   python manage.py rekey_uuid7 --model listing --batch-size 500 --pause 0.1
+# Safe to stop and rerun (rows that already have a v7 id are skipped). Old ids keep working
+# for listing detail links through IdAlias. Afterwards rebuild the similar-listings index
+# (build_similarity_index); users are logged out of browser sessions, API tokens keep working.
+
+from django.core.management.base import BaseCommand
+
+from listings.metrics import track_job
+from listings.rekey import BATCH_SIZE, MODELS, rekey_model
+
+
+class Command(BaseCommand):
+    help = "Rewrite random (v4) primary keys to time-ordered (v7) ones in small batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', action='append', choices=list(MODELS), help="Repeatable; default all")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--pause', type=float, default=0.0, help="Seconds to wait between batches")
+        parser.add_argument('--max-batches', type=int, help="Stop after this many batches per model")
+
+    def handle(self, *args, **options):
+        names = options['model'] or list(MODELS)
+        with track_job('rekey_uuid7'):
+            for name in names:
+                seen = changed = 0
+                for batch_seen, batch_changed in rekey_model(
+                    MODELS[name], options['batch_size'], options['pause'], options['max_batches'],
+                ):
+                    seen += batch_seen
+                    changed += batch_changed
+                    self.stdout.write(f"{name}: {changed} re-keyed ({seen} rows checked)")
+                self.stdout.write(self.style.SUCCESS(f"{name}: done, {changed} re-keyed"))
@@ -0,0 +1,36 @@
+# Emails pending notifications to their users (see listings/notify.py)
+# Usage:
+#   python manage.py send_notifications              # send everything pending, then exit
+#   python manage.py send_notifications --forever    # keep running as a background worker
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from listings.metrics import track_job
+from listings.notify import send_pending
+
+
+class Command(BaseCommand):
+    help = "Email pending notifications in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--forever', action='store_true', help="Keep polling for new notifications")
+        parser.add_argument('--poll-seconds', type=int, default=30)
+
+    def handle(self, *args, **options):
+        while True:
+            with track_job('send_notifications'):
+                sent = failed = 0
+                while True:
+                    batch_sent, batch_failed = send_pending(options['batch_size'])
+                    if not batch_sent and not batch_failed:
+                        break
+                    sent += batch_sent
+                    failed += batch_failed
+                    self.stdout.write(f"{sent} notifications sent, {failed} failed so far")
+            if not options['forever']:
+                break
+            time.sleep(options['poll_seconds'])
+        self.stdout.write(self.style.SUCCESS("Done"))
@@ -0,0 +1,43 @@
+# Keeps every user's notification history at the newest N notifications
+# Usage:
+#   python manage.py trim_notifications
+#   python manage.py trim_notifications --keep 500 --recount
+# Meant to run regularly (e.g. nightly cron); each batch is its own short transaction.
+# --recount also rebuilds all unread counters from the notifications table afterwards.
+
+from django.core.management.base import BaseCommand, CommandError
+
+from listings.inbox import inbox_settings, overfull_inboxes, recount_unread, trim_inbox
+from listings.metrics import track_job
+
+
+class Command(BaseCommand):
+    help = "Delete notifications beyond each user's newest KEEP_PER_USER"
+
+    def add_arguments(self, parser):
+        config = inbox_settings()
+        parser.add_argument('--keep', type=int, default=config['KEEP_PER_USER'])
+        parser.add_argument('--batch-size', type=int, default=config['BATCH_SIZE'])
+        parser.add_argument('--recount', action='store_true', help="Rebuild the unread counters afterwards")
+        parser.add_argument('--dry-run', action='store_true', help="Only count what would be deleted")
+
+    def handle(self, *args, **options):
+        keep = options['keep']
+        if keep < 0:
+            raise CommandError("--keep can't be negative")
+        inboxes = list(overfull_inboxes(keep))
+        if options['dry_run']:
+            count = sum(total - keep for _, total in inboxes)
+            self.stdout.write(f"{count} notifications of {len(inboxes)} users would be deleted")
+            return
+
+        total = 0
+        with track_job('trim_notifications'):
+            for user_id, _ in inboxes:
+                for deleted in trim_inbox(user_id, keep, options['batch_size']):
+                    total += deleted
+            self.stdout.write(f"Deleted {total} notifications of {len(inboxes)} users")
+            if options['recount']:
+                recount_unread(batch_size=options['batch_size'])
+                self.stdout.write("Unread counters rebuilt")
+        self.stdout.write(self.style.SUCCESS("Done"))
@@ -0,0 +1,29 @@
+# Recomputes market prices and deal scores of all active listings (see listings/valuation.py)
+# Usage:
+#   python manage.py update_deal_scores
+#   python manage.py update_deal_scores --listing-type car
+# Ingest already refreshes the segments it touches; run this regularly (e.g. nightly cron)
+# so scores also follow listings that were deactivated or archived
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from listings.metrics import track_job
+from listings.models import Listing
+from listings.valuation import score_all
+
+
+class Command(BaseCommand):
+    help = "Recompute market_price and deal_score for active listings"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listing-type', choices=[value for value, _ in Listing.LISTING_TYPES])
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        with track_job('update_deal_scores'):
+            updated = score_all(options['listing_type'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated {updated} listings in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,122 @@
+# Prometheus metrics for the whole backend
+# The API (MetricsMiddleware), the scraper, the notification worker and background jobs all
+# record into the same prometheus_client registry; GET /metrics exposes it in the Prometheus
+# text format.
+# /metrics isn't public: it answers staff users, requests carrying the METRICS_TOKEN bearer
+# token, and addresses in METRICS_ALLOWED_IPS (everyone else gets a 404).
+# When several processes run (gunicorn workers, cron jobs) set PROMETHEUS_MULTIPROC_DIR
+# so their numbers are collected from a shared directory.
+
+import hmac
+import os
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest,
+)
+
+# === API REQUESTS (labelled by route / viewset action, e.g. "ListingViewSet.list") ===
+
+REQUEST_LATENCY = Histogram(
+    'agg_http_request_duration_seconds', 'Time to handle an API request',
+    ['method', 'view', 'status'],
+)
+REQUEST_DB_QUERIES = Histogram(
+    'agg_http_request_db_queries', 'Database queries run per request',
+    ['view'], buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500),
+)
+REQUEST_DB_TIME = Histogram(
+    'agg_http_request_db_seconds', 'Time spent in the database per request',
+    ['view'],
+)
+REQUEST_SERIALIZATION_TIME = Histogram(
+    'agg_http_request_serialization_seconds', 'Time spent rendering the response body',
+    ['view'],
+)
+RESPONSE_SIZE = Histogram(
+    'agg_http_response_size_bytes', 'Size of the response body',
+    ['view'], buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+)
+SLOW_QUERIES = Counter(
+    'agg_db_slow_queries_total', 'Queries slower than SLOW_QUERY_THRESHOLD_MS',
+    ['view'],
+)
+
+# === SCRAPERS ===
+
+SCRAPER_FETCH_TIME = Histogram(
+    'agg_scraper_fetch_seconds', 'Time to download one page from a source',
+    ['source'],
+)
+SCRAPER_LISTINGS = Counter(
+    'agg_scraper_listings_total', 'Listings processed by the scrapers',
+    ['source', 'result'],
+)
+
+# === NOTIFICATION WORKER (send_notifications) ===
+
+NOTIFICATIONS_SENT = Counter(
+    'agg_notifications_total', 'Notifications processed by the notification worker',
+    ['result'],
+)
+
+# === BACKGROUND JOBS (scrapers, archival, notification jobs, ...) ===
+
+JOB_DURATION = Histogram(
+    'agg_job_duration_seconds', 'How long a background job run took',
+    ['job'], buckets=(1, 5, 15, 30, 60, 300, 900, 1800, 3600, 7200),
+)
+JOB_FAILURES = Counter(
+    'agg_job_failures_total', 'Background job runs that raised an error',
+    ['job'],
+)
+JOB_LAST_SUCCESS = Gauge(
+    'agg_job_last_success_timestamp_seconds', 'When the job last finished successfully',
+    ['job'], multiprocess_mode='max',
+)
+
+
+@contextmanager
+def track_job(name):
+    """
+    Records duration, failures and last success time of a background job run.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        JOB_FAILURES.labels(job=name).inc()
+        raise
+    else:
+        JOB_LAST_SUCCESS.labels(job=name).set_to_current_time()
+    finally:
+        JOB_DURATION.labels(job=name).observe(time.perf_counter() - start)
+
+
+def render_metrics():
+    """
+    Returns (body, content_type) with all metrics in the Prometheus text format.
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def can_scrape(request):
+    """
+    Whether the request may read /metrics (see the comment at the top).
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated and user.is_staff:
+        return True
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    if token and scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), token.encode()):
+        return True
+    return request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ())
@@ -0,0 +1,95 @@
+# Per-endpoint performance instrumentation
+# For every request records latency, number/time of DB queries, time spent rendering the
+# response and its size, labelled by route or viewset action (see metrics.py).
+# Queries slower than SLOW_QUERY_THRESHOLD_MS are logged with their SQL.
+
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+
+slow_query_logger = logging.getLogger('listings.slow_queries')
+
+
+class QueryStats:
+    """
+    Database execute wrapper that counts and times every query of one request.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.count = 0
+        self.duration = 0.0
+        self.slow_threshold = getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 200) / 1000
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            if elapsed >= self.slow_threshold:
+                view = view_label(self.request)
+                metrics.SLOW_QUERIES.labels(view=view).inc()
+                slow_query_logger.warning(
+                    "Slow query (%.0f ms) in %s on %s: %s",
+                    elapsed * 1000, view, context['connection'].alias, sql,
+                )
+
+
+def view_label(request):
+    # Set in process_view; requests that never matched a URL share one label
+    return getattr(request, 'metrics_view', 'unmatched')
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats(request)
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        view = view_label(request)
+        metrics.REQUEST_LATENCY.labels(method=request.method, view=view, status=response.status_code).observe(elapsed)
+        metrics.REQUEST_DB_QUERIES.labels(view=view).observe(stats.count)
+        metrics.REQUEST_DB_TIME.labels(view=view).observe(stats.duration)
+        if hasattr(request, 'metrics_render_time'):
+            metrics.REQUEST_SERIALIZATION_TIME.labels(view=view).observe(request.metrics_render_time)
+        if not response.streaming:
+            metrics.RESPONSE_SIZE.labels(view=view).observe(len(response.content))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # DRF viewsets: "ListingViewSet.list", "ListingViewSet.export", ...
+        view_class = getattr(view_func, 'cls', None)
+        actions = getattr(view_func, 'actions', None)
+        if view_class and actions:
+            action = actions.get(request.method.lower(), request.method.lower())
+            request.metrics_view = f"{view_class.__name__}.{action}"
+        elif view_class:
+            request.metrics_view = view_class.__name__
+        else:
+            request.metrics_view = request.resolver_match.view_name or view_func.__name__
+        return None
+
+    # DRF responses are rendered (serialized to JSON) after this hook - time that step
+    def process_template_response(self, request, response):
+        render_start = time.perf_counter()
+
+        def rendered(response):
+            request.metrics_render_time = time.perf_counter() - render_start
+
+        response.add_post_render_callback(rendered)
+        return response
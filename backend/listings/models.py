@@ -1,10 +1,14 @@
 # This file defines the structure of the database tables
 # each class = table, each field = column
 
+import copy
+
 from django.db import models
+from django.db.models.functions import Coalesce
+from django.db.models.fields.related_descriptors import ForwardManyToOneDescriptor
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
-import uuid
+from .ids import uuid7
 
 class User(AbstractUser):
     # Defines the different types of users
@@ -15,7 +19,8 @@ class User(AbstractUser):
     ]
     
     # Uses UUID instead of regular ID for better security (whatever that means)
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # Time-ordered (v7) so new rows are appended at the end of the index (see ids.py)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     
     # Use email as the username field
     username = models.EmailField(unique=True)
@@ -27,6 +32,9 @@ class User(AbstractUser):
     # Does this user want to receive email notifications?
     email_notifications = models.BooleanField(default=True)
     
+    # How many of their notifications are unread (the badge) - kept up to date by inbox.py
+    unread_notifications = models.PositiveIntegerField(default=0)
+    
     # When was this user account created and last updated?
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -66,9 +74,36 @@ class Source(models.Model):
     def __str__(self):
         return f"{self.name} ({self.source_type})"
 
-# Listing model - represents individual car or real estate listings
-# This is the main table that stores all the listings you scrape
-class Listing(models.Model):
+# Place model - one row per Latvian city/town from the bundled gazetteer (data/latvia_places.csv)
+# Scraped location strings ("Rīga", "Riga", "Rīgas raj.") are resolved to a Place at ingest
+# (see places.py), so filtering by city or distance works on an integer id instead of text
+class Place(models.Model):
+    REGIONS = [
+        ('riga', 'Rīga'),
+        ('vidzeme', 'Vidzeme'),
+        ('kurzeme', 'Kurzeme'),
+        ('zemgale', 'Zemgale'),
+        ('latgale', 'Latgale'),
+    ]
+    
+    # Official name, with diacritics (like "Jūrmala")
+    name = models.CharField(max_length=100, unique=True)
+    
+    # Which planning region is it in?
+    region = models.CharField(max_length=20, choices=REGIONS, db_index=True)
+    
+    # Where is it? (center of the town)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    
+    # Precomputed geohash grid cell - places sharing a prefix are near each other
+    geohash = models.CharField(max_length=12, db_index=True)
+    
+    def __str__(self):
+        return self.name
+
+# All the columns a listing has - shared by live listings (Listing) and archived ones (ArchivedListing)
+class BaseListing(models.Model):
     # What type of listing is this?
     LISTING_TYPES = [
         ('car', 'Car'),
@@ -97,7 +132,7 @@ class Listing(models.Model):
     # === BASIC INFORMATION (for both cars and real estate) ===
     
     # Unique ID for this listing in our system
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     
     # The original ID from the source website (like SS.com listing ID)
     external_id = models.CharField(max_length=100, unique=True)
@@ -117,9 +152,12 @@ class Listing(models.Model):
     # How much does it cost? (in EUR)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     
-    # Where is it located? (city name)
+    # Where is it located? (city name, as printed by the source website)
     location = models.CharField(max_length=100)
     
+    # The same location resolved to a known place (empty if we couldn't recognize it)
+    place = models.ForeignKey(Place, on_delete=models.SET_NULL, null=True, blank=True)
+    
     # List of image URLs (stored as JSON array)
     images = models.JSONField(default=list, blank=True)
     
@@ -146,6 +184,20 @@ class Listing(models.Model):
     # Is this listing still available? (gets set to False if listing disappears from source)
     is_active = models.BooleanField(default=True)
     
+    # === MARKET VALUE (computed by valuation.py, not entered by hand) ===
+    
+    # Which group of comparable listings is it valued against? (like "car:bmw x5")
+    market_segment = models.CharField(max_length=200, null=True, blank=True)
+    
+    # Typical price of comparable listings (median of its group)
+    market_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    
+    # How many percent cheaper than market_price it is (negative = more expensive)
+    deal_score = models.FloatField(null=True, blank=True)
+    
+    # Should the scraper fetch this listing's page again on its next run? (set from the admin)
+    rescrape_requested = models.BooleanField(default=False)
+    
     # When was this listing first added to our database?
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -155,17 +207,98 @@ class Listing(models.Model):
     # When did we scrape this listing?
     scraped_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        abstract = True
+    
+    # How this listing appears in Django admin
+    def __str__(self):
+        return f"{self.title} - €{self.price}"
+
+# deal_score for sorting: listings without a score rank below every real one
+# (an expression index instead of NULLS LAST, which SQLite indexes don't support)
+DEAL_SCORE_RANK = Coalesce('deal_score', models.Value(-1e9))
+
+# Listing model - represents individual car or real estate listings
+# This is the main ("hot") table that stores all the listings you scrape
+class Listing(BaseListing):
     # Database indexes to make searches faster
     class Meta:
         indexes = [
             models.Index(fields=['listing_type', 'price']),  # Fast search by type and price
             models.Index(fields=['location']),               # Fast search by location
             models.Index(fields=['created_at']),             # Fast search by date
+            models.Index(fields=['updated_at']),             # Fast incremental exports ("changed since")
+            models.Index(fields=['market_segment']),         # Fast refresh of one segment's deal scores
+            # Best deals first (?ordering=-deal_score), listings without a score at the end
+            models.Index(DEAL_SCORE_RANK.desc(), name='listing_deal_score_idx'),
+            # Only the few flagged rows are indexed, so the scraper finds them without a full scan
+            models.Index(
+                fields=['rescrape_requested'], condition=models.Q(rescrape_requested=True),
+                name='listing_rescrape_idx',
+            ),
         ]
-    
-    # How this listing appears in Django admin
-    def __str__(self):
-        return f"{self.title} - €{self.price}"
+
+# ArchivedListing model - the "cold" table for listings that are long gone
+# The archive_listings command moves old inactive/stale rows here (same id and columns)
+# so the live table and its indexes only hold what the API actually serves
+class ArchivedListing(BaseListing):
+    # When was this listing moved to the archive?
+    archived_at = models.DateTimeField(db_index=True)
+
+# Looks in the archive when the live listing a favorite/notification points to is gone,
+# and follows IdAlias when it still has the id the listing had before it was re-keyed
+# (a row written with the old id while or after rekey_uuid7 ran - nothing repoints it)
+class ArchiveAwareListingDescriptor(ForwardManyToOneDescriptor):
+    def get_object(self, instance):
+        try:
+            return super().get_object(instance)
+        except Listing.DoesNotExist:
+            pk = getattr(instance, self.field.attname)
+            new_pk = IdAlias.objects.filter(model='listings.listing', old_id=pk).values_list('new_id', flat=True).first()
+            for model, lookup in ((ArchivedListing, pk), (Listing, new_pk), (ArchivedListing, new_pk)):
+                listing = lookup and model.objects.filter(pk=lookup).first()
+                if listing:
+                    return listing
+            raise
+
+    def get_prefetch_querysets(self, instances, querysets=None):
+        # prefetch_related('listing') - fill in archived and re-keyed listings the live query didn't find
+        rel_qs, rel_obj_attr, instance_attr, single, cache_name, is_descriptor = (
+            super().get_prefetch_querysets(instances, querysets)
+        )
+        if querysets:
+            return rel_qs, rel_obj_attr, instance_attr, single, cache_name, is_descriptor
+        found = list(rel_qs)
+        missing = {key[0] for key in {instance_attr(instance) for instance in instances} - {rel_obj_attr(obj) for obj in found}}
+        if missing:
+            found += ArchivedListing.objects.filter(pk__in=missing)
+            missing -= {obj.pk for obj in found}
+        # Re-keyed listings are matched to the instances by the old id they still point at
+        # (a copy each, in case other instances point at the new id)
+        alias_keys = {}
+        if missing:
+            aliases = dict(
+                IdAlias.objects.filter(model='listings.listing', old_id__in=missing).values_list('new_id', 'old_id')
+            )
+            for model in (Listing, ArchivedListing):
+                for listing in model.objects.filter(pk__in=list(aliases)):
+                    listing = copy.copy(listing)
+                    alias_keys[id(listing)] = (aliases.pop(listing.pk),)
+                    found.append(listing)
+
+        def key(obj):
+            return alias_keys.get(id(obj)) or rel_obj_attr(obj)
+
+        return found, key, instance_attr, single, cache_name, is_descriptor
+
+# Foreign key to Listing that keeps working after the listing has been archived
+# (no database constraint, since the row may live in the archive table)
+class ListingForeignKey(models.ForeignKey):
+    forward_related_accessor_class = ArchiveAwareListingDescriptor
+
+    def __init__(self, *args, **kwargs):
+        kwargs['db_constraint'] = False
+        super().__init__(*args, **kwargs)
 
 # Filter model - represents saved search filters that users create
 # When users want to get notifications about new cars under €15,000 in Riga
@@ -176,7 +309,7 @@ class Filter(models.Model):
     ]
     
     # Unique ID for this filter
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     
     # Which user created this filter?
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -196,6 +329,9 @@ class Filter(models.Model):
     # Which city/location?
     location = models.CharField(max_length=100, null=True, blank=True)
     
+    # The same location resolved to a known place
+    place = models.ForeignKey(Place, on_delete=models.SET_NULL, null=True, blank=True)
+    
     # === CAR-SPECIFIC FILTERS ===
     
     # Year range for cars
@@ -240,8 +376,8 @@ class Favorite(models.Model):
     # Which user favorited this?
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     
-    # Which listing did they favorite?
-    listing = models.ForeignKey(Listing, on_delete=models.CASCADE)
+    # Which listing did they favorite? (may be an archived one)
+    listing = ListingForeignKey(Listing, on_delete=models.CASCADE)
     
     # When did they favorite it?
     created_at = models.DateTimeField(auto_now_add=True)
@@ -253,6 +389,42 @@ class Favorite(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.listing.title}"
 
+# CachedImage model - a listing image downloaded to our own storage (see images.py)
+# Rows are keyed by a hash of the remote URL; the file itself is stored under its content hash,
+# so the same picture used by several listings is only stored once
+class CachedImage(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),     # Waiting to be downloaded
+        ('fetching', 'Fetching'),   # A worker is downloading it
+        ('ready', 'Ready'),         # Stored, thumbnails generated
+        ('failed', 'Failed'),       # Could not be downloaded / not an image
+        ('evicted', 'Evicted'),     # Removed from disk to free space, fetched again when requested
+    ]
+    
+    # The remote URL scraped from the listing, and its hash (used in our image URLs)
+    url = models.URLField(max_length=1000)
+    url_hash = models.CharField(max_length=64, unique=True)
+    
+    # sha256 of the downloaded file - also its file name on disk
+    content_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+    content_type = models.CharField(max_length=50, blank=True)
+    size = models.IntegerField(null=True, blank=True)
+    
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', db_index=True)
+    
+    # How many times we tried to download it
+    attempts = models.IntegerField(default=0)
+    
+    # When a worker claimed it (status 'fetching'); claims older than CLAIM_TIMEOUT are
+    # given back, in case the worker died
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    fetched_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.url} ({self.status})"
+
 # Notification model - represents notifications sent to users
 # When new listings match their filters, we create notifications here
 class Notification(models.Model):
@@ -271,16 +443,17 @@ class Notification(models.Model):
     ]
     
     # Unique ID for this notification
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     
     # Which user should receive this notification?
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # (no index of its own - notification_inbox_idx starts with user)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
     
     # Which filter triggered this notification? (can be empty)
     filter = models.ForeignKey(Filter, on_delete=models.CASCADE, null=True, blank=True)
     
-    # Which listing is this notification about?
-    listing = models.ForeignKey(Listing, on_delete=models.CASCADE)
+    # Which listing is this notification about? (may be an archived one)
+    listing = ListingForeignKey(Listing, on_delete=models.CASCADE)
     
     # What type of notification is this?
     notification_type = models.CharField(max_length=20, choices=NOTIFICATION_TYPES)
@@ -297,5 +470,36 @@ class Notification(models.Model):
     # When was it actually sent?
     sent_at = models.DateTimeField(null=True, blank=True)
     
+    # Has the user seen it? (change it through inbox.py, which keeps the unread counter right)
+    read = models.BooleanField(default=False)
+    
+    class Meta:
+        indexes = [
+            # A user's inbox, newest first
+            models.Index(fields=['user', '-created_at'], name='notification_inbox_idx'),
+            # The notification worker's queue (only the few pending rows are in it)
+            models.Index(
+                fields=['created_at'], condition=models.Q(status='pending'), name='notification_pending_idx',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.notification_type} - {self.status}"
+
+# IdAlias model - remembers the old id of rows that were given a time-ordered id
+# (see rekey.py), so links with the old id (like /api/listings/<old id>/) keep working
+class IdAlias(models.Model):
+    # Which model the row belongs to (like "listings.listing")
+    model = models.CharField(max_length=100)
+    
+    # The id it had before and the one it has now
+    old_id = models.UUIDField()
+    new_id = models.UUIDField()
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ['model', 'old_id']
+    
     def __str__(self):
-        return f"{self.user.username} - {self.notification_type} - {self.status}"
\ No newline at end of file
+        return f"{self.model} {self.old_id} -> {self.new_id}"
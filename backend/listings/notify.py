@@ -0,0 +1,64 @@
+# Email delivery of notifications
+# Notifications are created 'pending'; the send_notifications worker emails them in batches,
+# oldest first, and marks them 'sent' (or 'failed' when the mail server refuses one). Users who
+# turned email_notifications off only see them in their inbox, so theirs are marked sent
+# without an email. A batch's rows stay locked while it is sent (other workers skip them), and
+# a crash mid-batch rolls it back, so a notification is emailed at least once, never lost.
+# Runs and results are reported to the shared metrics registry (see metrics.py).
+
+import logging
+import smtplib
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+SUBJECTS = {
+    'new_listing': "New listing matching your filter",
+    'price_drop': "Price drop on a listing you follow",
+    'favorite_update': "A listing you follow was updated",
+}
+
+
+def _message(notification):
+    return EmailMessage(
+        subject=SUBJECTS.get(notification.notification_type, "Notification"),
+        body=notification.message,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[notification.user.email],
+    )
+
+
+def send_pending(batch_size=100):
+    """
+    Sends one batch of pending notifications. Returns (sent, failed) counts.
+    """
+    with transaction.atomic():
+        batch = list(
+            Notification.objects.filter(status='pending').order_by('created_at').select_related('user')
+            .select_for_update(skip_locked=True, of=('self',))[:batch_size]
+        )
+        if not batch:
+            return 0, 0
+        sent, failed = [], []
+        with get_connection() as connection:
+            for notification in batch:
+                if notification.user.email_notifications and notification.user.email:
+                    try:
+                        connection.send_messages([_message(notification)])
+                    except (smtplib.SMTPException, OSError) as error:
+                        logger.warning("Notification %s could not be sent: %s", notification.pk, error)
+                        failed.append(notification.pk)
+                        continue
+                sent.append(notification.pk)
+        Notification.objects.filter(pk__in=sent).update(status='sent', sent_at=timezone.now())
+        Notification.objects.filter(pk__in=failed).update(status='failed')
+    metrics.NOTIFICATIONS_SENT.labels(result='sent').inc(len(sent))
+    metrics.NOTIFICATIONS_SENT.labels(result='failed').inc(len(failed))
+    return len(sent), len(failed)
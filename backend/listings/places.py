@@ -0,0 +1,203 @@
+# Resolving free-text locations to Place rows, and place-based lookups
+# ss.com and friends print locations in many spellings ("Rīga", "Riga", "Rīgas raj.",
+# "Jelgava un raj.", "Rīga, Centrs"). normalize_location() folds them into one key, and
+# resolve_place() maps that key to a Place id. Both are memoized, so each distinct string
+# costs one dictionary lookup after the first time. Misses are not remembered: a string that
+# matched nothing is looked up again, against an index reloaded at most every
+# INDEX_REFRESH_SECONDS, so places loaded by another process are found without a restart.
+# The same cache holds every place's coordinates (place_coordinates()), for the similar-listings
+# vectors.
+
+import csv
+import re
+import threading
+import time
+import unicodedata
+from functools import lru_cache
+from pathlib import Path
+
+from django.db.models import Q
+
+from .geo import covering_cells, geohash_encode, haversine_km
+from .models import Place
+
+GAZETTEER_PATH = Path(__file__).resolve().parent / 'data' / 'latvia_places.csv'
+
+# Geohash length stored on Place (precision 6 = cells of about 1.2 x 0.6 km)
+GEOHASH_PRECISION = 6
+
+# How often (at most) a lookup that found nothing reloads the place index
+INDEX_REFRESH_SECONDS = 300
+
+# Resolved location strings remembered per process
+RESOLVED_CACHE_SIZE = 10000
+
+# Words that don't change which place is meant ("rajons" = district, "novads" = municipality)
+_NOISE_WORDS = {'raj', 'rajons', 'rajona', 'un', 'nov', 'novads', 'novada', 'pag', 'pagasts', 'pilseta', 'lv', 'latvija'}
+
+
+@lru_cache(maxsize=10000)
+def normalize_location(text):
+    """
+    "Rīgas raj." -> "rigas", "Jelgava un raj." -> "jelgava", " RIGA " -> "riga"
+    """
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char)).lower()
+    words = [word for word in re.split(r'[^a-z0-9]+', text) if word and word not in _NOISE_WORDS]
+    return ' '.join(words)
+
+
+def genitive_forms(name):
+    # Latvian genitive, the form used in "Rīgas raj.", "Cēsu novads", "Talsu raj."
+    if name.endswith('is'):
+        return [name[:-2] + 'u']            # Cēsis -> Cēsu
+    if name.endswith('i'):
+        return [name[:-1] + 'u']            # Talsi -> Talsu
+    if name.endswith(('a', 'e')):
+        return [name + 's']                 # Rīga -> Rīgas, Ogre -> Ogres
+    return []
+
+
+def read_gazetteer(path=GAZETTEER_PATH):
+    """
+    Yields the places of the bundled gazetteer as dicts (name, region, latitude, longitude, aliases).
+    """
+    with open(path, encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            yield {
+                'name': row['name'],
+                'region': row['region'],
+                'latitude': float(row['latitude']),
+                'longitude': float(row['longitude']),
+                'aliases': [alias for alias in (row['aliases'] or '').split('|') if alias],
+            }
+
+
+def load_gazetteer(path=GAZETTEER_PATH):
+    """
+    Creates/updates Place rows from the gazetteer. Returns how many places it has.
+    """
+    places = [
+        Place(
+            name=row['name'], region=row['region'],
+            latitude=row['latitude'], longitude=row['longitude'],
+            geohash=geohash_encode(row['latitude'], row['longitude'], GEOHASH_PRECISION),
+        )
+        for row in read_gazetteer(path)
+    ]
+    Place.objects.bulk_create(
+        places, update_conflicts=True, unique_fields=['name'],
+        update_fields=['region', 'latitude', 'longitude', 'geohash'],
+    )
+    clear_caches()
+    return len(places)
+
+
+def _build_place_index():
+    # normalized spelling -> Place id, for every name, alias and genitive form;
+    # Place id -> (latitude, longitude)
+    rows = list(Place.objects.values_list('name', 'id', 'latitude', 'longitude'))
+    ids = {name: place_id for name, place_id, _, _ in rows}
+    coordinates = {place_id: (latitude, longitude) for _, place_id, latitude, longitude in rows}
+    index = {}
+    for row in read_gazetteer():
+        place_id = ids.get(row['name'])
+        if place_id is None:
+            continue
+        for spelling in [row['name'], *genitive_forms(row['name']), *row['aliases']]:
+            index.setdefault(normalize_location(spelling), place_id)
+    for name, place_id in ids.items():
+        index.setdefault(normalize_location(name), place_id)
+    return index, coordinates
+
+
+_lock = threading.Lock()
+_places = None  # (index, coordinates)
+_places_loaded_at = 0.0
+_resolved = {}
+
+
+def _load_places(refresh=False):
+    """
+    The cached (index, coordinates); refresh=True reloads them if they are older than
+    INDEX_REFRESH_SECONDS (empty ones too, so a Place table that is still empty isn't
+    reloaded on every miss).
+    """
+    global _places, _places_loaded_at
+    with _lock:
+        stale = refresh and time.monotonic() - _places_loaded_at > INDEX_REFRESH_SECONDS
+        if _places is None or stale:
+            _places = _build_place_index()
+            _places_loaded_at = time.monotonic()
+        return _places
+
+
+def _place_index(refresh=False):
+    return _load_places(refresh)[0]
+
+
+def place_coordinates(place_ids):
+    """
+    {Place id: (latitude, longitude)} for the given ids (unknown ones and None are left out).
+    """
+    wanted = {place_id for place_id in place_ids if place_id is not None}
+    if not wanted:
+        return {}
+    coordinates = _load_places()[1]
+    if not wanted <= coordinates.keys():
+        coordinates = _load_places(refresh=True)[1]
+    return {place_id: coordinates[place_id] for place_id in wanted if place_id in coordinates}
+
+
+def resolve_place(text):
+    """
+    Place id for a scraped location string, or None if it isn't recognized.
+    """
+    if text in _resolved:
+        return _resolved[text]
+    key = normalize_location(text)
+    if not key:
+        return None
+    index = _place_index()
+    place_id = _lookup(text, key, index)
+    if place_id is None:
+        fresh = _place_index(refresh=True)
+        if fresh is not index:
+            place_id = _lookup(text, key, fresh)
+    if place_id is not None and len(_resolved) < RESOLVED_CACHE_SIZE:
+        _resolved[text] = place_id
+    return place_id
+
+
+def _lookup(text, key, index):
+    if key in index:
+        return index[key]
+    # "Rīga, Centrs" / "Rīgas iela, Jelgava" -> a whole comma-separated part names the place
+    for part in (text or '').split(','):
+        part = normalize_location(part)
+        if part in index:
+            return index[part]
+    # "Centrs Rīga" -> the last word. Not the first one: in "Rīgas iela 5 Jelgava" that's a street
+    return index.get(key.rsplit(' ', 1)[-1])
+
+
+def clear_caches():
+    global _places
+    with _lock:
+        _places = None
+        _resolved.clear()
+
+
+def places_within(latitude, longitude, radius_km):
+    """
+    Ids of places within radius_km of the point.
+    The geohash index narrows it down to nearby grid cells, then exact distances are checked.
+    """
+    in_cells = Q()
+    for cell in covering_cells(latitude, longitude, radius_km, max_precision=GEOHASH_PRECISION):
+        in_cells |= Q(geohash__startswith=cell)
+    candidates = Place.objects.filter(in_cells).values_list('id', 'latitude', 'longitude')
+    return [
+        place_id for place_id, lat, lon in candidates
+        if haversine_km(latitude, longitude, lat, lon) <= radius_km
+    ]
@@ -0,0 +1,117 @@
+# Online migration of existing rows from random (v4) ids to time-ordered (v7) ids
+# New rows already get v7 ids (see ids.py); this rewrites the old ones in small batches while
+# the site keeps running. Each batch is one short transaction that:
+#   1. picks a v7 id for every row from its created_at (so ids end up in creation order),
+#   2. updates every foreign key pointing at those rows (favorites, notifications, tokens, ...),
+#   3. updates the rows' own ids and records old -> new in IdAlias.
+# Foreign keys are checked at commit (Django creates them DEFERRABLE INITIALLY DEFERRED), so
+# the children and the parent can be changed in any order inside the transaction.
+# Rows that already have a v7 id are skipped, so the migration can be stopped and rerun.
+
+import time
+
+from django.db import models, transaction
+from django.db.models import Case, Value, When
+
+from .ids import is_time_ordered, uuid7_at
+from .models import Filter, IdAlias, Listing, Notification, User
+
+# Models with time-ordered ids, by command-line name
+MODELS = {
+    'user': User,
+    'listing': Listing,
+    'filter': Filter,
+    'notification': Notification,
+}
+
+BATCH_SIZE = 1000
+
+
+def referencing_fields(model):
+    """
+    (model, foreign key field) pairs pointing at the model's primary key, including hidden ones
+    like the many-to-many tables of User.groups and the auth token.
+    """
+    fields = []
+    for relation in model._meta.get_fields(include_hidden=True):
+        if not (relation.is_relation and relation.auto_created and not relation.concrete):
+            continue
+        if not (relation.one_to_many or relation.one_to_one):
+            continue
+        field = relation.field
+        if field.target_field == model._meta.pk:
+            fields.append((relation.related_model, field))
+    return fields
+
+
+def _remap(column, mapping):
+    # CASE column WHEN old THEN new ... END - one UPDATE for the whole batch
+    return Case(
+        *[When(**{column: old}, then=Value(new)) for old, new in mapping.items()],
+        output_field=models.UUIDField(),
+    )
+
+
+def rekey_batch(model, rows):
+    """
+    Gives the rows [(old id, created_at), ...] time-ordered ids. Returns how many changed.
+    """
+    mapping = {pk: uuid7_at(created) for pk, created in rows if not is_time_ordered(pk)}
+    if not mapping:
+        return 0
+    label = model._meta.label_lower
+    with transaction.atomic():
+        for related_model, field in referencing_fields(model):
+            related_model._base_manager.filter(**{f"{field.attname}__in": list(mapping)}).update(
+                **{field.attname: _remap(field.attname, mapping)}
+            )
+        pk = model._meta.pk.attname
+        model._base_manager.filter(pk__in=list(mapping)).update(**{pk: _remap(pk, mapping)})
+        IdAlias.objects.bulk_create(
+            [IdAlias(model=label, old_id=old, new_id=new) for old, new in mapping.items()],
+            ignore_conflicts=True,
+        )
+    return len(mapping)
+
+
+def rekey_model(model, batch_size=BATCH_SIZE, pause=0.0, max_batches=None):
+    """
+    Walks the table in id order and re-keys it batch by batch. Yields (rows seen, rows changed)
+    per batch. pause (seconds) between batches gives replicas and other writers room to breathe.
+    """
+    last_pk = None
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        queryset = model._base_manager.order_by('pk')
+        if last_pk is not None:
+            queryset = queryset.filter(pk__gt=last_pk)
+        rows = list(queryset.values_list('pk', 'created_at')[:batch_size])
+        if not rows:
+            return
+        # New v7 ids may sort after last_pk and be seen again later - they are skipped then
+        changed = rekey_batch(model, rows)
+        last_pk = rows[-1][0]
+        batches += 1
+        yield len(rows), changed
+        if pause:
+            time.sleep(pause)
+
+
+def resolve_alias(model, old_id):
+    """
+    The current id of a row that used to have old_id, or None.
+    """
+    return (
+        IdAlias.objects.filter(model=model._meta.label_lower, old_id=old_id)
+        .values_list('new_id', flat=True).first()
+    )
+
+
+def alias_map(model, old_ids):
+    """
+    {old id: current id} for those of the ids whose rows have been re-keyed.
+    """
+    return dict(
+        IdAlias.objects.filter(model=model._meta.label_lower, old_id__in=list(old_ids))
+        .values_list('old_id', 'new_id')
+    )
@@ -0,0 +1,47 @@
+# Trigram indexes for "contains" text search (used by the admin search boxes)
+# Django's icontains becomes UPPER(column::text) LIKE UPPER('%word%'), which a normal
+# b-tree index can't help with. A pg_trgm GIN index on the same UPPER(...) expression can,
+# so searching titles and messages stays fast on tables with millions of rows.
+# PostgreSQL only - on other databases nothing is created and search just scans.
+
+import logging
+
+from django.db import connections, router
+
+logger = logging.getLogger(__name__)
+
+# (index name, table, column) - one GIN trigram index on UPPER(column) each
+TRIGRAM_INDEXES = [
+    ('listing_title_trgm', 'listings_listing', 'title'),
+    ('archived_listing_title_trgm', 'listings_archivedlisting', 'title'),
+    ('notification_message_trgm', 'listings_notification', 'message'),
+]
+
+
+def ensure_search_indexes(using='default'):
+    """
+    Enables pg_trgm and builds any missing trigram index without locking the table for writes.
+    Safe to run again; indexes that already exist are skipped.
+    """
+    connection = connections[using]
+    # Replicas get the indexes from the primary through replication
+    if connection.vendor != 'postgresql' or not router.allow_migrate(using, 'listings'):
+        return
+    quote = connection.ops.quote_name
+    tables = set(connection.introspection.table_names())
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for name, table, column in TRIGRAM_INDEXES:
+            if table not in tables:
+                continue
+            # CONCURRENTLY can't run inside a transaction - migrate's post_migrate runs outside one
+            cursor.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {quote(name)} ON {quote(table)} "
+                f"USING gin ((UPPER({quote(column)}::text)) gin_trgm_ops)"
+            )
+            logger.info("Trigram index %s is in place", name)
+
+
+def create_search_indexes(sender, using='default', **kwargs):
+    # post_migrate receiver (connected in apps.py)
+    ensure_search_indexes(using)
@@ -2,7 +2,9 @@
 # so they can be sent to the frontend
 
 from rest_framework import serializers
-from .models import User, Source, Listing, Filter, Favorite, Notification
+from django.urls import reverse
+from .images import url_hash
+from .models import User, Source, Place, Listing, Filter, Favorite, Notification
 
 class UserSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True)
@@ -15,6 +17,11 @@ class UserSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ('id', 'created_at', 'updated_at', 'is_active', 'is_staff')
 
+class PlaceSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Place
+        fields = ['id', 'name', 'region', 'latitude', 'longitude']
+
 class SourceSerializer(serializers.ModelSerializer):
     class Meta:
         model = Source
@@ -26,15 +33,48 @@ class ListingSerializer(serializers.ModelSerializer):
     source_id = serializers.PrimaryKeyRelatedField(
         queryset=Source.objects.all(), source='source', write_only=True
     )
+    # The same images served from our own cache: [{"thumbnail": url, "full": url}, ...]
+    cached_images = serializers.SerializerMethodField()
+
+    def get_cached_images(self, obj):
+        request = self.context.get('request')
+        result = []
+        for image_url in obj.images or []:
+            key = url_hash(image_url)
+            urls = {
+                'thumbnail': reverse('cached_image', args=[key, 'card']),
+                'full': reverse('cached_image', args=[key, 'detail']),
+            }
+            if request is not None:
+                urls = {name: request.build_absolute_uri(url) for name, url in urls.items()}
+            result.append(urls)
+        return result
 
     class Meta:
         model = Listing
         fields = [
             'id', 'external_id', 'listing_type', 'source', 'source_id', 'title', 'description',
-            'price', 'location', 'images', 'url', 'year', 'mileage', 'fuel_type', 'car_category',
-            'rooms', 'area', 'property_type', 'is_active', 'created_at', 'updated_at', 'scraped_at'
+            'price', 'location', 'place', 'images', 'cached_images', 'url', 'year', 'mileage', 'fuel_type', 'car_category',
+            'rooms', 'area', 'property_type', 'market_price', 'deal_score',
+            'is_active', 'created_at', 'updated_at', 'scraped_at'
         ]
-        read_only_fields = ('id', 'created_at', 'updated_at', 'scraped_at')
+        # place is resolved from location when the listing is saved; market values are computed
+        read_only_fields = ('id', 'place', 'market_price', 'deal_score', 'created_at', 'updated_at', 'scraped_at')
+
+# Used by the batch ingest endpoint to validate thousands of listings at once
+# Sources are looked up once per batch (context['sources'] = {id: Source})
+# instead of one PrimaryKeyRelatedField query per item
+class ListingBatchSerializer(ListingSerializer):
+    source_id = serializers.IntegerField(write_only=True)
+
+    class Meta(ListingSerializer.Meta):
+        # An existing external_id is not an error here - that listing gets updated
+        extra_kwargs = {'external_id': {'validators': []}}
+
+    def validate_source_id(self, value):
+        if value not in self.context['sources']:
+            raise serializers.ValidationError(f'Invalid pk "{value}" - object does not exist.')
+        return value
 
 class FilterSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
@@ -45,7 +85,7 @@ class FilterSerializer(serializers.ModelSerializer):
     class Meta:
         model = Filter
         fields = '__all__'
-        read_only_fields = ('id', 'created_at', 'updated_at')
+        read_only_fields = ('id', 'place', 'created_at', 'updated_at')
 
 class FavoriteSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
@@ -80,7 +120,7 @@ class NotificationSerializer(serializers.ModelSerializer):
         model = Notification
         fields = [
             'id', 'user', 'user_id', 'filter', 'filter_id', 'listing', 'listing_id',
-            'notification_type', 'status', 'message', 'created_at', 'sent_at'
+            'notification_type', 'status', 'message', 'read', 'created_at', 'sent_at'
         ]
         read_only_fields = ('id', 'created_at', 'sent_at')
 
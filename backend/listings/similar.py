@@ -0,0 +1,457 @@
+# "Similar listings" - nearest neighbours in a precomputed feature space
+# Every active listing is encoded as a small float vector (standardized numbers + one-hot
+# categories). Vectors live in a memory-mapped .npy file per listing_type, so every web worker
+# shares one copy through the OS page cache and a query is a vectorized distance computation
+# over the whole array instead of a pile of ORM range queries.
+#
+# The build_similarity_index command (re)builds the arrays from the database and fixes the
+# scaling (mean/std of each number); ingest, the scraper and the API then keep them up to date
+# with VectorIndex.update(), which overwrites, appends or removes single rows in place.
+# Removed rows leave an empty slot that the next added listing takes, so the arrays only grow
+# when the index really has more listings.
+#
+# Files in SIMILAR_LISTINGS['ROOT'], per listing type:
+#   car.json                  - generation, row count, capacity, feature scaling
+#   car-<generation>.vectors.npy, car-<generation>.ids.npy - the arrays (ids are UUID bytes)
+#   car.lock                  - serializes writers (readers never lock)
+
+import fcntl
+import json
+import os
+import uuid
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .models import BaseListing, Place
+from .places import place_coordinates
+
+DEFAULTS = {
+    'ROOT': 'vector_index',     # relative paths are inside BASE_DIR
+    'BLOCK_ROWS': 65536,        # rows per distance computation block
+    'BUILD_CHUNK': 50000,       # rows read from the database at a time when building
+}
+
+# Columns a listing needs for its vector
+SOURCE_FIELDS = [
+    'id', 'listing_type', 'is_active', 'price', 'year', 'mileage', 'fuel_type', 'car_category',
+    'rooms', 'area', 'property_type', 'place_id',
+]
+
+# Per listing type: numeric features, one categorical field (one-hot over its choices)
+# and optionally a free-text field hashed into a few buckets
+FEATURES = {
+    'car': {
+        'numeric': ['price', 'year', 'mileage'],
+        'choice': ('fuel_type', [value for value, _ in BaseListing.FUEL_TYPES]),
+        'hashed': ('car_category', 8),
+    },
+    'real_estate': {
+        'numeric': ['price', 'rooms', 'area', 'latitude', 'longitude'],
+        'choice': ('property_type', [value for value, _ in BaseListing.PROPERTY_TYPES]),
+        'hashed': None,
+    },
+}
+
+# Skewed values are compared on a log scale (a €1000 difference matters more on a €3000 car)
+LOG_FIELDS = {'price', 'mileage', 'area'}
+
+# How much a category mismatch counts (one-hot difference = sqrt(2) * weight)
+CATEGORY_WEIGHT = 1.0
+
+# Slots kept free at the end of the arrays so ingest can append without growing them
+HEADROOM = 1.25
+
+
+def similar_settings():
+    return {**DEFAULTS, **getattr(settings, 'SIMILAR_LISTINGS', {})}
+
+
+def index_root():
+    return Path(settings.BASE_DIR) / similar_settings()['ROOT']
+
+
+def dimensions(listing_type):
+    spec = FEATURES[listing_type]
+    size = len(spec['numeric']) + len(spec['choice'][1])
+    if spec['hashed']:
+        size += spec['hashed'][1]
+    return size
+
+
+def _all_place_coordinates():
+    # For builds; single updates and queries use the cached place_coordinates()
+    return {pk: (lat, lon) for pk, lat, lon in Place.objects.values_list('id', 'latitude', 'longitude')}
+
+
+def _float(value):
+    return np.nan if value is None else float(value)
+
+
+def _key(pk):
+    # ids are stored as raw UUID bytes; numpy's S16 drops trailing zero bytes, so do the same here
+    return pk.bytes.rstrip(b'\0')
+
+
+def _row(listing):
+    # Model instance -> the dict the encoders take
+    return {field: getattr(listing, 'pk' if field == 'id' else field) for field in SOURCE_FIELDS}
+
+
+def raw_columns(listing_type, rows, places):
+    """
+    Turns a list of listing dicts into numpy columns (unscaled numbers, category codes).
+    Missing numbers become NaN, unknown categories -1.
+    """
+    spec = FEATURES[listing_type]
+    columns = {}
+    for name in spec['numeric']:
+        if name in ('latitude', 'longitude'):
+            position = 0 if name == 'latitude' else 1
+            values = [places.get(row['place_id'], (None, None))[position] for row in rows]
+        else:
+            values = [row[name] for row in rows]
+        column = np.array([_float(value) for value in values], dtype=np.float64)
+        if name in LOG_FIELDS:
+            column = np.log1p(np.clip(column, 0, None))
+        columns[name] = column
+    field, choices = spec['choice']
+    codes = {value: code for code, value in enumerate(choices)}
+    columns[field] = np.array([codes.get(row[field], -1) for row in rows], dtype=np.int32)
+    if spec['hashed']:
+        field, buckets = spec['hashed']
+        columns[field] = np.array(
+            [zlib.crc32(row[field].strip().lower().encode()) % buckets if row[field] else -1 for row in rows],
+            dtype=np.int32,
+        )
+    return columns
+
+
+def column_stats(listing_type, columns):
+    # mean/std of every numeric feature, used to scale them to comparable ranges
+    stats = {}
+    for name in FEATURES[listing_type]['numeric']:
+        column = columns[name]
+        known = column[~np.isnan(column)]
+        mean = float(known.mean()) if known.size else 0.0
+        std = float(known.std()) if known.size else 0.0
+        stats[name] = [mean, std if std > 0 else 1.0]
+    return stats
+
+
+def encode(listing_type, columns, stats):
+    """
+    Builds the (rows x dimensions) float32 feature matrix from raw columns.
+    Numbers are standardized (missing ones end up at the mean, i.e. 0); categories are one-hot.
+    """
+    spec = FEATURES[listing_type]
+    count = len(columns[spec['numeric'][0]])
+    matrix = np.zeros((count, dimensions(listing_type)), dtype=np.float32)
+    offset = 0
+    for name in spec['numeric']:
+        mean, std = stats[name]
+        matrix[:, offset] = np.nan_to_num((columns[name] - mean) / std)
+        offset += 1
+    categorical = [(spec['choice'][0], len(spec['choice'][1]))]
+    if spec['hashed']:
+        categorical.append(spec['hashed'])
+    for field, size in categorical:
+        codes = columns[field]
+        rows = np.flatnonzero(codes >= 0)
+        matrix[rows, offset + codes[rows]] = CATEGORY_WEIGHT
+        offset += size
+    return matrix
+
+
+def _concat_columns(parts):
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+class VectorIndex:
+    """
+    The memory-mapped vectors of one listing type.
+    """
+
+    def __init__(self, listing_type, root=None):
+        self.listing_type = listing_type
+        self.root = Path(root) if root else index_root()
+        self._loaded = None  # (meta file identity, meta, vectors, ids)
+
+    # === FILES ===
+
+    @property
+    def meta_path(self):
+        return self.root / f"{self.listing_type}.json"
+
+    def _array_paths(self, generation):
+        prefix = self.root / f"{self.listing_type}-{generation}"
+        return Path(f"{prefix}.vectors.npy"), Path(f"{prefix}.ids.npy")
+
+    @contextmanager
+    def _locked(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / f"{self.listing_type}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_meta(self):
+        try:
+            return json.loads(self.meta_path.read_text())
+        except FileNotFoundError:
+            return None
+
+    def _write_meta(self, meta):
+        # Replaced atomically, so readers see either the old or the new version
+        temporary = self.meta_path.with_suffix('.json.tmp')
+        temporary.write_text(json.dumps(meta))
+        os.replace(temporary, self.meta_path)
+
+    def _create_arrays(self, generation, capacity):
+        vectors_path, ids_path = self._array_paths(generation)
+        vectors = np.lib.format.open_memmap(
+            vectors_path, mode='w+', dtype=np.float32, shape=(capacity, dimensions(self.listing_type)),
+        )
+        ids = np.lib.format.open_memmap(ids_path, mode='w+', dtype='S16', shape=(capacity,))
+        return vectors, ids
+
+    def _open_arrays(self, generation, mode):
+        vectors_path, ids_path = self._array_paths(generation)
+        return np.load(vectors_path, mmap_mode=mode), np.load(ids_path, mmap_mode=mode)
+
+    def _remove_generation(self, generation):
+        # Readers that still have the old files mapped keep working until they reload
+        for path in self._array_paths(generation):
+            path.unlink(missing_ok=True)
+
+    def load(self):
+        """
+        Returns (meta, vectors, ids) for reading, or None if the index was never built.
+        Arrays are reopened only when a rebuild or grow replaced them.
+        """
+        try:
+            stat = self.meta_path.stat()
+        except FileNotFoundError:
+            return None
+        identity = (stat.st_ino, stat.st_mtime_ns)
+        if self._loaded and self._loaded[0] == identity:
+            return self._loaded[1:]
+        meta = self._read_meta()
+        if meta is None:
+            return None
+        if self._loaded and self._loaded[1]['generation'] == meta['generation']:
+            vectors, ids = self._loaded[2:]
+        else:
+            vectors, ids = self._open_arrays(meta['generation'], 'r')
+        self._loaded = (identity, meta, vectors, ids)
+        return meta, vectors, ids
+
+    # === WRITING ===
+
+    def build(self, rows, chunk_size=None):
+        """
+        Rebuilds the index from an iterable of listing dicts (SOURCE_FIELDS) of this type.
+        Only active listings are indexed. Returns the number of vectors written.
+        """
+        chunk_size = chunk_size or similar_settings()['BUILD_CHUNK']
+        places = _all_place_coordinates()
+        parts, keys, chunk = [], [], []
+
+        def flush():
+            active = [row for row in chunk if row['is_active']]
+            if active:
+                parts.append(raw_columns(self.listing_type, active, places))
+                keys.extend(_key(row['id']) for row in active)
+            chunk.clear()
+
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                flush()
+        flush()
+
+        columns = _concat_columns(parts) if parts else raw_columns(self.listing_type, [], places)
+        stats = column_stats(self.listing_type, columns)
+        matrix = encode(self.listing_type, columns, stats)
+        count = len(keys)
+
+        with self._locked():
+            old = self._read_meta()
+            generation = old['generation'] + 1 if old else 1
+            capacity = max(int(count * HEADROOM), count + 1024)
+            vectors, ids = self._create_arrays(generation, capacity)
+            vectors[:count] = matrix
+            ids[:count] = np.array(keys, dtype='S16')
+            vectors.flush()
+            ids.flush()
+            self._write_meta({
+                'generation': generation, 'count': count, 'capacity': capacity, 'stats': stats,
+            })
+            if old:
+                self._remove_generation(old['generation'])
+        return count
+
+    def _grow(self, meta, vectors, ids, needed):
+        capacity = max(meta['capacity'] * 2, needed)
+        generation = meta['generation'] + 1
+        new_vectors, new_ids = self._create_arrays(generation, capacity)
+        new_vectors[:meta['count']] = vectors[:meta['count']]
+        new_ids[:meta['count']] = ids[:meta['count']]
+        old_generation = meta['generation']
+        meta.update(generation=generation, capacity=capacity)
+        return old_generation, new_vectors, new_ids
+
+    def update(self, rows, places=None):
+        """
+        Brings single listings up to date: active ones of this type are written (overwritten
+        in place, or into a free slot), anything else is removed from the index.
+        Does nothing until the index has been built (scaling comes from the build).
+        """
+        rows = list(rows)
+        # Checked before locking too, so writes don't create lock files for an index nobody built
+        if not rows or not self.meta_path.exists():
+            return
+        with self._locked():
+            meta = self._read_meta()
+            if meta is None:
+                return
+            vectors, ids = self._open_arrays(meta['generation'], 'r+')
+            count = meta['count']
+            keys = [_key(row['id']) for row in rows]
+            # Where each of these listings currently is (one vectorized scan of the ids)
+            existing = ids[:count]
+            hits = np.flatnonzero(np.isin(existing, np.array(keys, dtype='S16')))
+            slots = {bytes(existing[slot]): int(slot) for slot in hits}
+
+            keep = [row['is_active'] and row['listing_type'] == self.listing_type for row in rows]
+            for key, kept in zip(keys, keep):
+                if not kept and key in slots:
+                    ids[slots[key]] = b''
+
+            indexed = [row for row, kept in zip(rows, keep) if kept]
+            old_generation = None
+            if indexed:
+                if places is None:
+                    places = place_coordinates(row['place_id'] for row in indexed)
+                columns = raw_columns(self.listing_type, indexed, places)
+                matrix = encode(self.listing_type, columns, meta['stats'])
+                # New listings fill removed slots first, then go at the end
+                free = iter(np.flatnonzero(ids[:count] == b'').tolist())
+                targets = []
+                for row in indexed:
+                    key = _key(row['id'])
+                    if key not in slots:
+                        slots[key] = next(free, count)
+                        if slots[key] == count:
+                            count += 1
+                    targets.append(slots[key])
+                if count > meta['capacity']:
+                    old_generation, vectors, ids = self._grow(meta, vectors, ids, int(count * HEADROOM))
+                vectors[targets] = matrix
+                ids[targets] = np.array([_key(row['id']) for row in indexed], dtype='S16')
+
+            vectors.flush()
+            ids.flush()
+            meta['count'] = count
+            self._write_meta(meta)
+            if old_generation is not None:
+                self._remove_generation(old_generation)
+
+    # === QUERYING ===
+
+    def vectors_for(self, rows):
+        """
+        Encodes listing dicts with the index's scaling (None if the index isn't built).
+        """
+        loaded = self.load()
+        if loaded is None:
+            return None
+        meta = loaded[0]
+        columns = raw_columns(self.listing_type, rows, place_coordinates(row['place_id'] for row in rows))
+        return encode(self.listing_type, columns, meta['stats'])
+
+    def search(self, queries, k, exclude=()):
+        """
+        k nearest neighbours for each row of a (queries x dimensions) matrix.
+        Distances are computed block by block as |v|^2 - 2 v.q + |q|^2 with one matrix product
+        per block, so many queries cost little more than one.
+        Returns one list of (listing id bytes, distance) per query, nearest first.
+        """
+        loaded = self.load()
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if loaded is None or k <= 0:
+            return [[] for _ in queries]
+        meta, vectors, ids = loaded
+        count = meta['count']
+        block_rows = similar_settings()['BLOCK_ROWS']
+        excluded = np.array([_key(pk) for pk in exclude], dtype='S16')
+        query_norms = np.einsum('ij,ij->i', queries, queries)
+
+        best_distances, best_slots = [], []
+        for start in range(0, count, block_rows):
+            block = np.asarray(vectors[start:start + block_rows])
+            block_ids = ids[start:start + block_rows]
+            distances = np.einsum('ij,ij->i', block, block)[:, None] - 2 * block @ queries.T + query_norms
+            # Empty (removed) slots and excluded listings never match
+            skip = block_ids == b''
+            if excluded.size:
+                skip |= np.isin(block_ids, excluded)
+            distances[skip] = np.inf
+            take = min(k, len(block))
+            nearest = np.argpartition(distances, take - 1, axis=0)[:take]
+            best_distances.append(np.take_along_axis(distances, nearest, axis=0))
+            best_slots.append(nearest + start)
+
+        if not best_distances:
+            return [[] for _ in queries]
+        distances = np.concatenate(best_distances)
+        slots = np.concatenate(best_slots)
+        results = []
+        for column in range(len(queries)):
+            order = np.argsort(distances[:, column])[:k]
+            results.append([
+                (bytes(ids[slots[row, column]]).ljust(16, b'\0'), float(max(distances[row, column], 0)))
+                for row in order if np.isfinite(distances[row, column])
+            ])
+        return results
+
+
+_indexes = {}
+
+
+def get_index(listing_type):
+    # One instance per process, so the memory maps are opened once
+    if listing_type not in _indexes:
+        _indexes[listing_type] = VectorIndex(listing_type)
+    return _indexes[listing_type]
+
+
+def index_listings(listings):
+    """
+    Updates the vector indexes for saved listings (model instances or dicts with SOURCE_FIELDS).
+    Called after listings are created/updated/deactivated.
+    """
+    rows = [listing if isinstance(listing, dict) else _row(listing) for listing in listings]
+    if not rows:
+        return
+    places = place_coordinates(row['place_id'] for row in rows)
+    for listing_type in FEATURES:
+        get_index(listing_type).update(rows, places=places)
+
+
+def similar_listing_ids(listing, k):
+    """
+    Ids of the k listings closest to the given one (nearest first); empty if not indexed yet.
+    """
+    if listing.listing_type not in FEATURES:
+        return []
+    index = get_index(listing.listing_type)
+    vectors = index.vectors_for([_row(listing)])
+    if vectors is None:
+        return []
+    return [uuid.UUID(bytes=key) for key, _ in index.search(vectors, k, exclude=[listing.pk])[0]]
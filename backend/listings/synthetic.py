@@ -0,0 +1,222 @@
+# Synthetic (fake but realistic-looking) data for load testing
+# Everything is generated lazily from a seed: ids are derived from (seed, kind, index),
+# so favorites and notifications can point at listings without keeping millions of ids in memory,
+# and the same seed always produces the same dataset (times relative to `now`). Ids have the
+# time-ordered v7 layout the real tables use (see ids.py), with the row's creation time in front.
+
+import hashlib
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+
+from .ids import uuid7_at
+from .places import resolve_place
+
+CITIES = [
+    ('Rīga', 40), ('Jūrmala', 6), ('Daugavpils', 6), ('Liepāja', 5), ('Jelgava', 5),
+    ('Ventspils', 3), ('Rēzekne', 3), ('Valmiera', 3), ('Ogre', 3), ('Jēkabpils', 2),
+    ('Salaspils', 2), ('Tukums', 2), ('Cēsis', 2), ('Sigulda', 2), ('Mārupe', 2),
+]
+CAR_MAKES = {
+    'BMW': ['320', '520', 'X3', 'X5', '118'],
+    'Audi': ['A4', 'A6', 'Q5', 'A3'],
+    'Volkswagen': ['Golf', 'Passat', 'Touran', 'Tiguan'],
+    'Toyota': ['Corolla', 'RAV4', 'Avensis', 'Auris'],
+    'Volvo': ['V70', 'XC60', 'S60', 'V40'],
+    'Škoda': ['Octavia', 'Superb', 'Fabia'],
+    'Opel': ['Astra', 'Insignia', 'Zafira'],
+    'Mercedes-Benz': ['C 200', 'E 220', 'A 180'],
+}
+CAR_CATEGORIES = ['Sedan', 'Universal', 'Hatchback', 'SUV', 'Minivan', 'Coupe']
+FUEL_TYPES = [('petrol', 35), ('diesel', 45), ('hybrid', 12), ('electric', 5), ('other', 3)]
+PROPERTY_TYPES = [('apartment', 60), ('house', 20), ('room', 5), ('commercial', 5), ('land', 8), ('other', 2)]
+NOTIFICATION_TYPES = ['new_listing', 'price_drop', 'favorite_update']
+
+# Synthetic rows are spread over this many days back from now
+HISTORY_DAYS = 365
+
+
+def _digest(seed, kind, index):
+    return hashlib.blake2b(f"{seed}:{kind}:{index}".encode(), digest_size=16).digest()
+
+
+def synthetic_id(seed, kind, index, created):
+    """
+    Reproducible time-ordered UUID for the index-th row of a kind ('listing', 'user', ...)
+    created at `created`.
+    """
+    return uuid7_at(created, entropy=_digest(seed, kind, index))
+
+
+def synthetic_time(seed, kind, index, now):
+    """
+    Creation time of the index-th row of a kind, up to HISTORY_DAYS before now. Derived from the
+    index (not drawn in sequence), so rows pointing at users and listings can rebuild their ids.
+    """
+    offset = int.from_bytes(_digest(seed, f"{kind}:time", index)[:8], 'big') % (HISTORY_DAYS * 86400)
+    return now - timedelta(seconds=offset)
+
+
+def _row_id(seed, kind, index, now):
+    return synthetic_id(seed, kind, index, synthetic_time(seed, kind, index, now))
+
+
+def _weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def _past(rng, now):
+    return now - timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400))
+
+
+def sources():
+    return [
+        {'name': 'ss.com', 'url': 'https://www.ss.com', 'source_type': 'car'},
+        {'name': 'auto24.lv', 'url': 'https://www.auto24.lv', 'source_type': 'car'},
+        {'name': 'ss.com RE', 'url': 'https://www.ss.com/lv/real-estate/', 'source_type': 'real_estate'},
+        {'name': 'city24.lv', 'url': 'https://www.city24.lv', 'source_type': 'real_estate'},
+    ]
+
+
+def users(seed, count, now=None):
+    rng = random.Random(f"{seed}:users")
+    now = now or timezone.now()
+    # Hashing a password is slow on purpose - do it once and share it
+    password = make_password('synthetic')
+    for index in range(count):
+        email = f"user{index}.{seed}@example.lv"
+        joined = synthetic_time(seed, 'user', index, now)
+        yield {
+            'id': synthetic_id(seed, 'user', index, joined),
+            'username': email,
+            'email': email,
+            'password': password,
+            'role': 'registered',
+            'email_notifications': rng.random() < 0.7,
+            'date_joined': joined,
+            'created_at': joined,
+            'updated_at': joined,
+        }
+
+
+def listings(seed, count, source_ids, now=None):
+    """
+    source_ids: {'car': [ids], 'real_estate': [ids]}
+    """
+    rng = random.Random(f"{seed}:listings")
+    now = now or timezone.now()
+    for index in range(count):
+        created = synthetic_time(seed, 'listing', index, now)
+        updated = created + timedelta(seconds=rng.randrange(int((now - created).total_seconds()) + 1))
+        location = _weighted(rng, CITIES)
+        row = {
+            'id': synthetic_id(seed, 'listing', index, created),
+            'external_id': f"synthetic-{seed}-{index}",
+            'location': location,
+            'place_id': resolve_place(location),
+            'is_active': rng.random() < 0.8,
+            'created_at': created,
+            'updated_at': updated,
+            'scraped_at': updated,
+        }
+        if rng.random() < 0.55:
+            make = rng.choice(list(CAR_MAKES))
+            model = rng.choice(CAR_MAKES[make])
+            year = rng.randint(1995, 2025)
+            age = now.year - year
+            price = max(300, int(rng.lognormvariate(9.6, 0.6) * (0.92 ** age) * 2.5))
+            row.update({
+                'listing_type': 'car',
+                'source_id': rng.choice(source_ids['car']),
+                'title': f"{make} {model} {year}",
+                'description': f"{make} {model}, {year}. gads, labā stāvoklī.",
+                'price': Decimal(price),
+                'url': f"https://www.ss.com/msg/lv/transport/cars/{index}.html",
+                'year': year,
+                'mileage': max(0, int(rng.gauss(age * 17000, 25000))),
+                'fuel_type': _weighted(rng, FUEL_TYPES),
+                'car_category': rng.choice(CAR_CATEGORIES),
+                'images': [f"https://i.ss.com/gallery/{index}/{n}.jpg" for n in range(rng.randint(0, 6))],
+            })
+        else:
+            property_type = _weighted(rng, PROPERTY_TYPES)
+            rooms = rng.randint(1, 5)
+            area = Decimal(round(rng.uniform(15, 35) * rooms + rng.uniform(0, 40), 2)).quantize(Decimal('0.01'))
+            price = max(5000, int(area * Decimal(rng.lognormvariate(7.1, 0.4))))
+            row.update({
+                'listing_type': 'real_estate',
+                'source_id': rng.choice(source_ids['real_estate']),
+                'title': f"{rooms} ist. {property_type}, {area} m²",
+                'description': f"Pārdod {rooms} istabu īpašumu, {area} m².",
+                'price': Decimal(price),
+                'url': f"https://www.ss.com/msg/lv/real-estate/{index}.html",
+                'rooms': rooms,
+                'area': area,
+                'property_type': property_type,
+                'images': [f"https://i.ss.com/gallery/{index}/{n}.jpg" for n in range(rng.randint(0, 8))],
+            })
+        yield row
+
+
+def filters(seed, user_count, per_user, now=None):
+    rng = random.Random(f"{seed}:filters")
+    now = now or timezone.now()
+    for user_index in range(user_count):
+        for number in range(rng.randint(0, per_user * 2)):
+            created = _past(rng, now)
+            filter_type = rng.choice(['car', 'real_estate'])
+            row = {
+                'id': synthetic_id(seed, 'filter', (user_index, number), created),
+                'user_id': _row_id(seed, 'user', user_index, now),
+                'name': f"Filter {number + 1}",
+                'filter_type': filter_type,
+                'max_price': Decimal(rng.choice([5000, 10000, 20000, 50000, 100000, 150000])),
+                'location': _weighted(rng, CITIES) if rng.random() < 0.6 else None,
+                'created_at': created,
+                'updated_at': created,
+            }
+            if filter_type == 'car':
+                row['min_year'] = rng.randint(2000, 2020)
+                row['fuel_types'] = rng.sample([value for value, _ in FUEL_TYPES], rng.randint(0, 2))
+            else:
+                row['min_rooms'] = rng.randint(1, 3)
+                row['property_types'] = rng.sample([value for value, _ in PROPERTY_TYPES], rng.randint(0, 2))
+            yield row
+
+
+def favorites(seed, user_count, listing_count, per_user, now=None):
+    rng = random.Random(f"{seed}:favorites")
+    now = now or timezone.now()
+    for user_index in range(user_count):
+        count = min(listing_count, rng.randint(0, per_user * 2))
+        # sample() on a range never builds the list, and gives distinct listings per user
+        for listing_index in rng.sample(range(listing_count), count):
+            yield {
+                'user_id': _row_id(seed, 'user', user_index, now),
+                'listing_id': _row_id(seed, 'listing', listing_index, now),
+                'created_at': _past(rng, now),
+            }
+
+
+def notifications(seed, user_count, listing_count, per_user, now=None):
+    rng = random.Random(f"{seed}:notifications")
+    now = now or timezone.now()
+    for user_index in range(user_count):
+        for number in range(rng.randint(0, per_user * 2)):
+            created = _past(rng, now)
+            status = 'sent' if rng.random() < 0.9 else rng.choice(['pending', 'failed'])
+            yield {
+                'id': synthetic_id(seed, 'notification', (user_index, number), created),
+                'user_id': _row_id(seed, 'user', user_index, now),
+                'listing_id': _row_id(seed, 'listing', rng.randrange(listing_count), now),
+                'notification_type': rng.choice(NOTIFICATION_TYPES),
+                'status': status,
+                'message': "A new listing matches your filter",
+                'created_at': created,
+                'sent_at': created if status == 'sent' else None,
+                'read': status == 'sent' and rng.random() < 0.8,
+            }
@@ -0,0 +1,148 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from listings import paginators
+from listings.archive import run_archival
+from listings.inbox import recount_unread, unread_count
+from listings.models import Favorite, Listing, Notification, Source, User
+from listings.paginators import EstimatedCountPaginator
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.executed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql)
+
+    def fetchone(self):
+        return self.rows.pop(0)
+
+
+class AdminTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='admin@x.lv', email='admin@x.lv', password=None)
+        cls.user = User.objects.create_user(username='user@x.lv', email='user@x.lv', password=None)
+        cls.source = Source.objects.create(name='ss.com', url='https://www.ss.com', source_type='car')
+        cls.listings = [
+            Listing.objects.create(
+                external_id=f"test-{number}", listing_type='car', source=cls.source, title=title,
+                price=10000, location='Rīga', url=f"https://www.ss.com/{number}", is_active=number != 0,
+            )
+            for number, title in enumerate(['Audi A6 Avant', 'BMW X5', 'BMW 320d'])
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def action(self, model, action, objects):
+        response = self.client.post(
+            f"/admin/listings/{model}/", {'action': action, '_selected_action': [str(obj.pk) for obj in objects]},
+        )
+        self.assertEqual(response.status_code, 302)
+
+
+class EstimatedCountPaginatorTests(AdminTestCase):
+    def count(self, queryset, *rows):
+        cursor = FakeCursor(rows)
+        connection = mock.MagicMock(vendor='postgresql')
+        connection.cursor.return_value = cursor
+        with mock.patch.object(paginators, 'connections', {queryset.db: connection}):
+            return EstimatedCountPaginator(queryset, 20).count, cursor.executed
+
+    def test_exact_count_on_other_databases(self):
+        self.assertEqual(EstimatedCountPaginator(Listing.objects.order_by('pk'), 20).count, 3)
+
+    def test_large_table_uses_the_estimate(self):
+        count, executed = self.count(Listing.objects.order_by('pk'), (250000.0,))
+        self.assertEqual(count, 250000)
+        self.assertIn('pg_class', executed[0])
+
+    def test_filtered_results_use_the_plan_estimate(self):
+        count, executed = self.count(Listing.objects.filter(is_active=True).order_by('pk'), ('[{"Plan": {"Plan Rows": 40000}}]',))
+        self.assertEqual(count, 40000)
+        self.assertTrue(executed[0].startswith('EXPLAIN'))
+
+    def test_small_or_unanalyzed_tables_are_counted_exactly(self):
+        self.assertEqual(self.count(Listing.objects.order_by('pk'), (12.0,))[0], 3)
+        self.assertEqual(self.count(Listing.objects.order_by('pk'), (-1.0,))[0], 3)
+        self.assertEqual(self.count(Listing.objects.filter(is_active=True).order_by('pk'), ([{'Plan': {'Plan Rows': 5}}],))[0], 2)
+
+
+class ListingAdminTests(AdminTestCase):
+    def test_changelists(self):
+        for model in ('listing', 'archivedlisting', 'favorite', 'notification', 'cachedimage'):
+            response = self.client.get(f"/admin/listings/{model}/?q=bmw")
+            self.assertEqual(response.status_code, 200, model)
+
+    def test_deactivate(self):
+        Listing.objects.filter(pk=self.listings[1].pk).update(market_price=12000, deal_score=10)
+        self.action('listing', 'deactivate', self.listings[1:])
+        self.assertFalse(Listing.objects.filter(is_active=True).order_by('pk').exists())
+        self.assertEqual(
+            set(Listing.objects.values_list('market_price', 'deal_score')), {(None, None)},
+        )
+
+    def test_request_rescrape(self):
+        self.action('listing', 'request_rescrape', self.listings[:2])
+        self.assertEqual(
+            list(Listing.objects.filter(rescrape_requested=True).order_by('external_id').values_list('external_id', flat=True)),
+            ['test-0', 'test-1'],
+        )
+
+
+class FavoriteAdminTests(AdminTestCase):
+    def test_search_by_title_finds_archived_listings(self):
+        archived = Favorite.objects.create(user=self.user, listing=self.listings[0])
+        live = Favorite.objects.create(user=self.user, listing=self.listings[1])
+        Favorite.objects.create(user=self.admin, listing=self.listings[2])
+        Listing.objects.filter(pk=self.listings[0].pk).update(updated_at=timezone.now() - timedelta(days=60))
+        self.assertEqual(sum(run_archival()), 1)
+
+        def search(term):
+            response = self.client.get('/admin/listings/favorite/', {'q': term})
+            self.assertEqual(response.status_code, 200)
+            return set(response.context['cl'].result_list)
+
+        self.assertEqual(search('audi avant'), {archived})
+        self.assertEqual(search('x5'), {live})
+        self.assertEqual(search('user@x.lv'), {archived, live})
+        self.assertEqual(search('nothing'), set())
+
+
+class NotificationAdminTests(AdminTestCase):
+    def setUp(self):
+        super().setUp()
+        self.notifications = [
+            Notification.objects.create(
+                user=self.user, listing=listing, notification_type='new_listing', message='Match',
+                status='sent', sent_at=timezone.now(),
+            )
+            for listing in self.listings
+        ]
+        recount_unread()
+
+    def test_mark_as_read_and_unread(self):
+        self.action('notification', 'mark_as_read', self.notifications[:2])
+        self.assertEqual(unread_count(self.user.pk), 1)
+        self.assertEqual(Notification.objects.filter(read=True).count(), 2)
+        self.action('notification', 'mark_as_unread', self.notifications)
+        self.assertEqual(unread_count(self.user.pk), 3)
+
+    def test_resend(self):
+        self.action('notification', 'resend', self.notifications[:1])
+        self.assertEqual(
+            list(Notification.objects.filter(status='pending').values_list('pk', 'sent_at')),
+            [(self.notifications[0].pk, None)],
+        )
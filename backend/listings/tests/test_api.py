@@ -0,0 +1,54 @@
+import tempfile
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from listings.benchmark import SCENARIOS, benchmark_user, run_benchmark
+from listings.models import Listing
+from listings.places import clear_caches
+
+
+class BenchmarkEndpointTests(TestCase):
+    """
+    Smoke tests for the endpoints benchmark_api measures, on a small synthetic dataset.
+    """
+    # Reads are routed to replicas when there are any (mirrors of the test database)
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        # generate_data loads places; don't let their ids outlive this test's database
+        cls.addClassCleanup(clear_caches)
+        # page 50 of the listings needs at least 50 pages
+        call_command('generate_data', listings=1000, users=5, stdout=StringIO())
+
+    def test_scenarios_respond(self):
+        anonymous = APIClient()
+        logged_in = APIClient()
+        logged_in.force_authenticate(benchmark_user())
+        listing_id = Listing.objects.values_list('id', flat=True).first()
+        for name, url, needs_user in SCENARIOS:
+            with self.subTest(name):
+                client = logged_in if needs_user else anonymous
+                response = client.get(url.format(listing=listing_id))
+                self.assertEqual(response.status_code, 200)
+
+    def test_run_benchmark(self):
+        results = run_benchmark(requests=2, warmup=0)
+        self.assertEqual(set(results), {name for name, _, _ in SCENARIOS})
+        for name, result in results.items():
+            with self.subTest(name):
+                self.assertEqual(result['statuses'], [200])
+                self.assertEqual(result['requests'], 2)
+                self.assertGreater(result['queries_per_request'], 0)
+
+    def test_command_needs_at_least_one_request(self):
+        with self.assertRaisesMessage(CommandError, '--requests'):
+            call_command('benchmark_api', requests=0, stdout=StringIO())
+
+    def test_command_writes_results(self):
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command('benchmark_api', requests=1, warmup=0, scenario=['listings.list'], output=output.name, stdout=StringIO())
+            self.assertIn(b'listings.list', output.read())
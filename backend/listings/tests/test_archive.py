@@ -0,0 +1,105 @@
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from listings import archive, similar
+from listings.inbox import unread_count
+from listings.models import ArchivedListing, Favorite, Listing, Notification, Source, User
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        settings_override = override_settings(SIMILAR_LISTINGS={'ROOT': root.name})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        similar._indexes.clear()
+        self.addCleanup(similar._indexes.clear)
+
+        self.user = User.objects.create_user(username='user@x.lv', email='user@x.lv', password=None)
+        source = Source.objects.create(name='ss.com', url='https://www.ss.com', source_type='car')
+        self.listings = [
+            Listing.objects.create(
+                external_id=f"test-{number}", listing_type='car', source=source, title=f"BMW X5 {number}",
+                price=10000 + number * 100, location='Rīga', url=f"https://www.ss.com/{number}",
+                year=2015, mileage=100000, is_active=number != 0,
+            )
+            for number in range(6)
+        ]
+        # The first one has been inactive for a long time
+        Listing.objects.filter(pk=self.listings[0].pk).update(updated_at=timezone.now() - timedelta(days=60))
+        self.old = self.listings[0]
+        self.favorite = Favorite.objects.create(user=self.user, listing=self.old)
+        self.notification = Notification.objects.create(
+            user=self.user, listing=self.old, notification_type='new_listing', message='Match',
+        )
+        User.objects.filter(pk=self.user.pk).update(unread_notifications=1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def archive(self):
+        self.assertEqual(sum(archive.run_archival()), 1)
+
+    def test_archive_and_restore_round_trip(self):
+        before = Listing.objects.filter(pk=self.old.pk).values().get()
+        self.archive()
+        self.assertFalse(Listing.objects.filter(pk=self.old.pk).exists())
+        archived = ArchivedListing.objects.filter(pk=self.old.pk).values().get()
+        self.assertIsNotNone(archived.pop('archived_at'))
+        self.assertEqual(archived, before)
+
+        self.assertEqual(archive.restore_by_external_ids([self.old.external_id]), 1)
+        self.assertFalse(ArchivedListing.objects.filter(pk=self.old.pk).exists())
+        self.assertEqual(Listing.objects.filter(pk=self.old.pk).values().get(), before)
+
+    def test_favorites_and_notifications_still_find_archived_listings(self):
+        self.archive()
+        favorite = Favorite.objects.get(pk=self.favorite.pk)
+        self.assertIsInstance(favorite.listing, ArchivedListing)
+        self.assertEqual(favorite.listing.title, self.old.title)
+        prefetched = Notification.objects.prefetch_related('listing').get(pk=self.notification.pk)
+        self.assertEqual(prefetched.listing.pk, self.old.pk)
+
+        response = self.client.get('/api/favorites/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['listing']['title'], self.old.title)
+
+    def test_archived_detail_and_similar(self):
+        call_command('build_similarity_index', stdout=StringIO())
+        self.archive()
+        self.assertNotIn(str(self.old.pk), [item['id'] for item in self.client.get('/api/listings/').json()['results']])
+        response = self.client.get(f"/api/listings/{self.old.pk}/")
+        self.assertEqual((response.status_code, response.json()['title']), (200, self.old.title))
+        response = self.client.get(f"/api/listings/{self.old.pk}/similar/?limit=3")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 3)
+        # Only reading is allowed on an archived listing
+        self.client.force_authenticate(User.objects.create_superuser(username='admin@x.lv', email='admin@x.lv', password=None))
+        self.assertEqual(self.client.patch(f"/api/listings/{self.old.pk}/", {'title': 'x'}, format='json').status_code, 404)
+
+    def test_deleting_archived_listings_deletes_their_favorites_and_notifications(self):
+        self.archive()
+        admin_user = User.objects.create_superuser(username='admin@x.lv', email='admin@x.lv', password=None)
+        self.client.force_login(admin_user)
+        response = self.client.post(
+            '/admin/listings/archivedlisting/',
+            {'action': 'delete_selected', '_selected_action': [str(self.old.pk)], 'post': 'yes'},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(ArchivedListing.objects.exists())
+        self.assertFalse(Favorite.objects.exists())
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(unread_count(self.user.pk), 0)
+
+    def test_delete_archived_listings(self):
+        self.archive()
+        other = Favorite.objects.create(user=self.user, listing=self.listings[1])
+        self.assertEqual(archive.delete_archived_listings([self.old.pk]), 1)
+        self.assertEqual(list(Favorite.objects.all()), [other])
+        self.assertEqual(unread_count(self.user.pk), 0)
@@ -0,0 +1,100 @@
+import csv
+import gzip
+import io
+import json
+from datetime import timedelta
+
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from listings.export import EXPORT_FIELDS, accepts_gzip
+from listings.models import Listing, Source, User
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        source = Source.objects.create(name='ss.com', url='https://www.ss.com', source_type='car')
+        cls.listings = [
+            Listing.objects.create(
+                external_id=f"test-{number}", listing_type='car' if number < 3 else 'real_estate', source=source,
+                title=f"Listing, \"{number}\"", price=10000 + number, location='Rīga',
+                url=f"https://www.ss.com/{number}", images=[f"https://i.ss.com/{number}.jpg"],
+            )
+            for number in range(5)
+        ]
+        # Oldest first in the export
+        now = timezone.now()
+        for number, listing in enumerate(cls.listings):
+            Listing.objects.filter(pk=listing.pk).update(updated_at=now - timedelta(days=10 - number))
+        cls.admin = User.objects.create_superuser(username='admin@x.lv', email='admin@x.lv', password=None)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def export(self, query='', **headers):
+        response = self.client.get(f"/api/listings/export/{query}", headers=headers)
+        self.assertEqual(response.status_code, 200)
+        body = b''.join(response.streaming_content)
+        if response.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        return response, body.decode('utf-8')
+
+    def test_ndjson(self):
+        response, body = self.export()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="listings.ndjson"')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row['external_id'] for row in rows], [f"test-{number}" for number in range(5)])
+        self.assertEqual(list(rows[0]), EXPORT_FIELDS)
+        self.assertEqual(rows[0]['images'], ['https://i.ss.com/0.jpg'])
+
+    def test_csv(self):
+        response, body = self.export('?output=csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(io.StringIO(body)))
+        self.assertEqual(rows[0], EXPORT_FIELDS)
+        self.assertEqual(len(rows), 6)
+        first = dict(zip(rows[0], rows[1]))
+        self.assertEqual(first['id'], str(self.listings[0].pk))
+        self.assertEqual(first['title'], 'Listing, "0"')
+        self.assertEqual(json.loads(first['images']), ['https://i.ss.com/0.jpg'])
+
+    def test_gzip_is_negotiated(self):
+        response, body = self.export(**{'Accept-Encoding': 'br, gzip'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(len(body.splitlines()), 5)
+
+        response, body = self.export(**{'Accept-Encoding': 'identity'})
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(len(body.splitlines()), 5)
+
+    def test_filters(self):
+        _, body = self.export('?listing_type=real_estate')
+        self.assertEqual([json.loads(line)['external_id'] for line in body.splitlines()], ['test-3', 'test-4'])
+        changed_since = Listing.objects.get(pk=self.listings[4].pk).updated_at.isoformat()
+        _, body = self.export(f"?output=csv&changed_since={changed_since.replace('+', '%2B')}")
+        self.assertEqual(len(list(csv.reader(io.StringIO(body)))), 2)
+
+    def test_empty_result(self):
+        _, body = self.export('?listing_type=real_estate&min_price=99999')
+        self.assertEqual(body, '')
+        _, body = self.export('?output=csv&min_price=99999')
+        self.assertEqual(list(csv.reader(io.StringIO(body))), [EXPORT_FIELDS])
+
+    def test_bad_format_and_permissions(self):
+        self.assertEqual(self.client.get('/api/listings/export/?output=xml').status_code, 400)
+        self.client.force_authenticate(User.objects.create_user(username='user@x.lv', email='user@x.lv', password=None))
+        self.assertEqual(self.client.get('/api/listings/export/').status_code, 403)
+
+
+class AcceptsGzipTests(SimpleTestCase):
+    def test_accept_encoding(self):
+        for header, expected in [
+            ('gzip', True), ('deflate, gzip;q=0.5', True), ('*', True), ('GZIP', True),
+            ('', False), ('br', False), ('gzip;q=0', False), ('gzip;q=0.0, br', False), ('x-gzip-like', False),
+        ]:
+            self.assertEqual(accepts_gzip(header), expected, header)
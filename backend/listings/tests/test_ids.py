@@ -0,0 +1,130 @@
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from listings import ids, synthetic
+from listings.models import Favorite, Filter, IdAlias, Listing, Notification, Source, User
+from listings.places import clear_caches
+from listings.rekey import alias_map, rekey_batch, rekey_model
+
+
+class Uuid7Tests(SimpleTestCase):
+    def test_version_and_variant(self):
+        value = ids.uuid7()
+        self.assertEqual(value.version, 7)
+        self.assertEqual(value.variant, uuid.RFC_4122)
+        self.assertTrue(ids.is_time_ordered(value))
+        self.assertFalse(ids.is_time_ordered(uuid.uuid4()))
+
+    def test_increasing_when_counter_overflows_within_one_millisecond(self):
+        # The clock stands still: the 12-bit counter runs out and the next millisecond is borrowed
+        with mock.patch.object(ids.time, 'time_ns', return_value=1_900_000_000_000_000_000):
+            values = [ids.uuid7() for _ in range(3 * (ids._COUNTER_MAX + 1))]
+        self.assertEqual(values, sorted(values))
+        self.assertEqual(len(set(values)), len(values))
+        self.assertGreater(values[-1].int >> 80, 1_900_000_000_000)
+
+    def test_increasing_when_clock_goes_backwards(self):
+        with mock.patch.object(ids.time, 'time_ns', return_value=2_000_000_000_000_000_000):
+            first = ids.uuid7()
+        with mock.patch.object(ids.time, 'time_ns', return_value=1_999_000_000_000_000_000):
+            second = ids.uuid7()
+        self.assertLess(first, second)
+
+    def test_uuid7_at_keeps_the_timestamp(self):
+        moment = datetime(2024, 5, 1, 12, 0, tzinfo=dt_timezone.utc)
+        value = ids.uuid7_at(moment)
+        self.assertEqual(value.version, 7)
+        self.assertEqual(value.int >> 80, int(moment.timestamp() * 1000))
+
+
+class RekeyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(id=uuid.uuid4(), username='user@x.lv', email='user@x.lv', password=None)
+        self.token = Token.objects.create(user=self.user)
+        source = Source.objects.create(name='ss.com', url='https://www.ss.com', source_type='car')
+        self.listing = Listing.objects.create(
+            id=uuid.uuid4(), external_id='test-1', listing_type='car', source=source, title='BMW X5',
+            price=10000, location='Rīga', url='https://www.ss.com/1',
+        )
+        self.filter = Filter.objects.create(id=uuid.uuid4(), user=self.user, name='BMW', filter_type='car')
+        Favorite.objects.create(user=self.user, listing=self.listing)
+        Notification.objects.create(
+            id=uuid.uuid4(), user=self.user, filter=self.filter, listing=self.listing,
+            notification_type='new_listing', message='x',
+        )
+
+    def test_rekey_batch_rewrites_foreign_keys_and_records_aliases(self):
+        old_user, old_listing = self.user.pk, self.listing.pk
+        self.assertEqual(rekey_batch(User, [(old_user, self.user.created_at)]), 1)
+        self.assertEqual(rekey_batch(Listing, [(old_listing, self.listing.created_at)]), 1)
+
+        user = User.objects.get()
+        listing = Listing.objects.get()
+        self.assertTrue(ids.is_time_ordered(user.pk))
+        self.assertTrue(ids.is_time_ordered(listing.pk))
+        self.assertEqual(Token.objects.get().user_id, user.pk)
+        self.assertEqual(Filter.objects.get().user_id, user.pk)
+        self.assertEqual(list(Favorite.objects.values_list('user_id', 'listing_id')), [(user.pk, listing.pk)])
+        self.assertEqual(list(Notification.objects.values_list('user_id', 'listing_id')), [(user.pk, listing.pk)])
+        self.assertEqual(alias_map(User, [old_user]), {old_user: user.pk})
+        self.assertEqual(alias_map(Listing, [old_listing, uuid.uuid4()]), {old_listing: listing.pk})
+
+    def test_rekey_model_is_idempotent(self):
+        for model in (User, Listing, Filter, Notification):
+            self.assertEqual(sum(changed for _, changed in rekey_model(model, batch_size=1)), 1)
+            self.assertEqual(sum(changed for _, changed in rekey_model(model, batch_size=1)), 0)
+        self.assertEqual(IdAlias.objects.count(), 4)
+
+    def test_old_listing_url_still_works(self):
+        old_listing = self.listing.pk
+        rekey_batch(Listing, [(old_listing, self.listing.created_at)])
+        response = APIClient().get(f"/api/listings/{old_listing}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['id'], str(Listing.objects.get().pk))
+
+    def test_rows_written_with_an_old_id_still_find_the_listing(self):
+        old_listing = self.listing.pk
+        rekey_batch(Listing, [(old_listing, self.listing.created_at)])
+        listing = Listing.objects.get()
+        # Written with the old id after the batch repointed the existing rows
+        late = Favorite.objects.create(user=self.user, listing_id=old_listing)
+        self.assertEqual(Favorite.objects.get(pk=late.pk).listing, listing)
+        favorites = Favorite.objects.prefetch_related('listing').order_by('pk')
+        self.assertEqual([favorite.listing.title for favorite in favorites], ['BMW X5', 'BMW X5'])
+        self.assertEqual({favorite.listing.pk for favorite in favorites}, {listing.pk})
+
+        Favorite.objects.filter(pk=late.pk).update(listing_id=uuid.uuid4())
+        with self.assertRaises(Listing.DoesNotExist):
+            Favorite.objects.get(pk=late.pk).listing
+
+
+class SyntheticIdTests(TestCase):
+    def test_ids_are_time_ordered_and_reproducible(self):
+        now = datetime(2025, 6, 1, tzinfo=dt_timezone.utc)
+        rows = list(synthetic.users(3, 20, now))
+        self.assertEqual([row['id'] for row in rows], [row['id'] for row in synthetic.users(3, 20, now)])
+        for row in rows:
+            self.assertEqual(row['id'].version, 7)
+            self.assertEqual(row['id'].int >> 80, int(row['created_at'].timestamp() * 1000))
+        # Sorting by id sorts by creation time
+        self.assertEqual(
+            [row['created_at'] for row in sorted(rows, key=lambda row: row['id'])],
+            sorted(row['created_at'] for row in rows),
+        )
+
+    def test_generated_references_point_at_generated_rows(self):
+        # generate_data loads the places; their ids must not outlive this test's transaction
+        self.addCleanup(clear_caches)
+        call_command('generate_data', listings=200, users=10, stdout=StringIO())
+        listing_ids = set(Listing.objects.values_list('pk', flat=True))
+        self.assertTrue(all(ids.is_time_ordered(pk) for pk in listing_ids))
+        for model in (Favorite, Notification):
+            self.assertTrue(model.objects.exists())
+            self.assertLessEqual(set(model.objects.values_list('listing_id', flat=True)), listing_ids)
@@ -0,0 +1,252 @@
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from unittest import mock
+
+from PIL import Image
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from listings import images
+from listings.models import CachedImage
+
+
+def image_bytes(size=(800, 600), color='red', image_format='JPEG'):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, image_format)
+    return buffer.getvalue()
+
+
+class ImageOrigin(BaseHTTPRequestHandler):
+    # path -> (status, headers, body); filled in by the tests
+    routes = {}
+
+    def do_GET(self):
+        status, headers, body = self.routes.get(self.path, (404, {}, b''))
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class LocalOriginMixin:
+    """
+    Serves ImageOrigin.routes from a local HTTP server (allowed as the only image host)
+    and keeps the image cache in a temporary MEDIA_ROOT.
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), ImageOrigin)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+        cls.origin = f"http://127.0.0.1:{cls.server.server_port}"
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        config = {**images.DEFAULTS, 'ALLOWED_HOSTS': ['127.0.0.1'], 'WORKERS': 2}
+        overrides = override_settings(MEDIA_ROOT=media_root, IMAGE_CACHE=config)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.addCleanup(ImageOrigin.routes.clear)
+
+    def serve(self, path, body=b'', status=200, **headers):
+        ImageOrigin.routes[path] = (status, headers, body)
+        return self.origin + path
+
+
+class DownloadTests(LocalOriginMixin, SimpleTestCase):
+    def test_download(self):
+        data = image_bytes()
+        url = self.serve('/a.jpg', data, **{'Content-Type': 'image/jpeg'})
+        self.assertEqual(images.download(url, images.image_settings()), data)
+
+    def test_redirect_within_allowed_hosts_is_followed(self):
+        self.serve('/b.jpg', b'data')
+        url = self.serve('/a.jpg', status=301, Location='/b.jpg')
+        self.assertEqual(images.download(url, images.image_settings()), b'data')
+
+    def test_redirect_to_other_host_is_not_followed(self):
+        url = self.serve('/a.jpg', status=302, Location='http://169.254.169.254/x')
+        with self.assertRaisesMessage(ValueError, 'Host not allowed'):
+            images.download(url, images.image_settings())
+
+    def test_redirect_loop(self):
+        url = self.serve('/a.jpg', status=302, Location='/a.jpg')
+        with self.assertRaisesMessage(ValueError, 'Too many redirects'):
+            images.download(url, images.image_settings())
+
+    def test_too_large(self):
+        url = self.serve('/a.jpg', b'x' * 2048)
+        with self.assertRaisesMessage(ValueError, 'Image too large'):
+            images.download(url, {**images.image_settings(), 'MAX_DOWNLOAD_BYTES': 1024})
+
+    def test_http_errors(self):
+        with self.assertRaises(images.requests.HTTPError):
+            images.download(self.origin + '/missing.jpg', images.image_settings())
+
+    def test_decoder_errors_fail_only_that_image(self):
+        config = images.image_settings()
+        with mock.patch.object(images, 'download', return_value=b'x'), \
+                mock.patch.object(images, 'store_image', side_effect=Image.DecompressionBombError('bomb')):
+            image_id, result = images._process(1, 'https://i.ss.com/a.jpg', config)
+        self.assertEqual(image_id, 1)
+        self.assertIn('bomb', result['error'])
+
+
+class StoreImageTests(LocalOriginMixin, SimpleTestCase):
+    def test_original_and_thumbnails(self):
+        data = image_bytes((2000, 1000), image_format='PNG')
+        content_hash, content_type = images.store_image(data, images.image_settings())
+        self.assertEqual(content_type, 'image/png')
+        self.assertEqual(images.image_path(content_hash).read_bytes(), data)
+        for size_name, (width, height) in images.image_settings()['SIZES'].items():
+            with Image.open(images.image_path(content_hash, size_name)) as thumbnail:
+                self.assertEqual(thumbnail.format, 'JPEG')
+                self.assertLessEqual(thumbnail.width, width)
+                self.assertLessEqual(thumbnail.height, height)
+                self.assertEqual(thumbnail.width / thumbnail.height, 2)
+
+    def test_same_content_is_stored_once(self):
+        data = image_bytes()
+        content_hash, _ = images.store_image(data, images.image_settings())
+        path = images.image_path(content_hash, 'card')
+        os.utime(path, (0, 0))
+        self.assertEqual(images.store_image(data, images.image_settings())[0], content_hash)
+        self.assertEqual(path.stat().st_mtime, 0)
+
+    def test_not_an_image(self):
+        with self.assertRaises(Image.UnidentifiedImageError):
+            images.store_image(b'<html>', images.image_settings())
+
+
+class FetchFromOriginTests(LocalOriginMixin, TestCase):
+    def test_fetch_pending(self):
+        good = self.serve('/good.jpg', image_bytes())
+        moved = self.serve('/moved.jpg', status=302, Location='/good.jpg')
+        images.enqueue_images([good, moved, self.origin + '/missing.jpg'])
+        self.assertEqual(images.fetch_pending(10), (2, 1))
+        ready = CachedImage.objects.get(url=good)
+        self.assertEqual((ready.status, ready.content_type), ('ready', 'image/jpeg'))
+        self.assertTrue(images.image_path(ready.content_hash, 'card').exists())
+        self.assertEqual(CachedImage.objects.get(url=moved).content_hash, ready.content_hash)
+        self.assertEqual(CachedImage.objects.get(url__endswith='missing.jpg').status, 'pending')
+
+
+class CachedImageViewTests(LocalOriginMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = self.serve('/a.jpg', image_bytes())
+        images.enqueue_images([self.url])
+        images.fetch_pending(10)
+        self.image = CachedImage.objects.get(url=self.url)
+        self.path = f"/api/images/{self.image.url_hash}/card/"
+
+    def test_cached_image(self):
+        response = self.client.get(self.path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['ETag'], f'"{self.image.content_hash}"')
+        self.assertEqual(response['Cache-Control'], f"public, max-age={images.DEFAULTS['MAX_AGE']}")
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertEqual(b''.join(response.streaming_content), images.image_path(self.image.content_hash, 'card').read_bytes())
+
+        original = self.client.get(f"/api/images/{self.image.url_hash}/original/")
+        self.assertEqual(original['Content-Type'], 'image/jpeg')
+        original.close()
+        response.close()
+
+    def test_revalidation(self):
+        response = self.client.get(self.path, headers={'If-None-Match': f'"{self.image.content_hash}"'})
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(self.path, headers={'If-None-Match': '"something-else"'})
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+    def test_unknown_image_or_size(self):
+        self.assertEqual(self.client.get(f"/api/images/{self.image.url_hash}/huge/").status_code, 404)
+        self.assertEqual(self.client.get('/api/images/0000/card/').status_code, 404)
+
+    def test_miss_redirects_to_the_original_and_queues_a_download(self):
+        images.image_path(self.image.content_hash, 'card').unlink()
+        response = self.client.get(self.path)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], self.url)
+        self.assertEqual(response['Cache-Control'], 'no-store')
+        self.assertEqual(CachedImage.objects.get(pk=self.image.pk).status, 'pending')
+
+    def test_not_downloaded_yet(self):
+        CachedImage.objects.filter(pk=self.image.pk).update(status='pending')
+        response = self.client.get(self.path)
+        self.assertEqual((response.status_code, response['Location']), (302, self.url))
+
+
+class EvictTests(LocalOriginMixin, TestCase):
+    def test_least_recently_served_are_evicted_first(self):
+        config = images.image_settings()
+        stored = []
+        for number, color in enumerate(['red', 'green', 'blue']):
+            content_hash, _ = images.store_image(image_bytes(color=color), config)
+            CachedImage.objects.create(
+                url=f"{self.origin}/{number}.jpg", url_hash=images.url_hash(f"{self.origin}/{number}.jpg"),
+                status='ready', content_hash=content_hash,
+            )
+            for path in images.cache_root().glob(f"*/*/*/{content_hash}"):
+                os.utime(path, (1000 * (number + 1), 1000 * (number + 1)))
+            stored.append(content_hash)
+        sizes = [sum(path.stat().st_size for path in images.cache_root().glob(f"*/*/*/{h}")) for h in stored]
+
+        deleted, freed = images.evict(max_bytes=sizes[2])
+        self.assertEqual((deleted, freed), (2 * (1 + len(config['SIZES'])), sizes[0] + sizes[1]))
+        self.assertFalse(images.image_path(stored[0]).exists())
+        self.assertTrue(images.image_path(stored[2]).exists())
+        self.assertEqual(
+            dict(CachedImage.objects.values_list('content_hash', 'status')),
+            {stored[0]: 'evicted', stored[1]: 'evicted', stored[2]: 'ready'},
+        )
+        self.assertEqual(images.evict(max_bytes=sizes[2]), (0, 0))
+
+
+class FetchPendingTests(TestCase):
+    def setUp(self):
+        images.enqueue_images([f"https://i.ss.com/{number}.jpg" for number in range(3)])
+
+    def test_claimed_images_are_not_claimed_again(self):
+        first = images.claim_pending(2)
+        second = images.claim_pending(2)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse({image_id for image_id, _ in first} & {image_id for image_id, _ in second})
+        self.assertEqual(images.claim_pending(2), [])
+
+    def test_failed_download_does_not_leave_images_fetching(self):
+        with mock.patch.object(images, 'store_image', side_effect=Image.DecompressionBombError('bomb')), \
+                mock.patch.object(images, 'download', return_value=b'x'):
+            self.assertEqual(images.fetch_pending(10, workers=2), (0, 3))
+        self.assertFalse(CachedImage.objects.filter(status='fetching').exists())
+        self.assertEqual(set(CachedImage.objects.values_list('status', 'attempts')), {('pending', 1)})
+
+    def test_stale_claims_are_released(self):
+        images.claim_pending(3)
+        CachedImage.objects.update(claimed_at=timezone.now() - timedelta(hours=1))
+        CachedImage.objects.filter(url__endswith='0.jpg').update(attempts=2)
+        self.assertEqual(images.release_stale_claims(), 3)
+        self.assertEqual(CachedImage.objects.filter(status='pending').count(), 2)
+        self.assertEqual(CachedImage.objects.get(url__endswith='0.jpg').status, 'failed')
+
+    def test_fresh_claims_are_kept(self):
+        images.claim_pending(3)
+        self.assertEqual(images.release_stale_claims(), 0)
+        self.assertEqual(CachedImage.objects.filter(status='fetching').count(), 3)
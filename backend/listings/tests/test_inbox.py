@@ -0,0 +1,154 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db.models import Count, F, Q
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from listings import inbox
+from listings.models import Filter, Listing, Notification, Source, User
+
+
+class InboxTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user@x.lv', email='user@x.lv', password=None)
+        self.other = User.objects.create_user(username='other@x.lv', email='other@x.lv', password=None)
+        source = Source.objects.create(name='ss.com', url='https://www.ss.com', source_type='car')
+        self.listings = [
+            Listing.objects.create(
+                external_id=f"test-{number}", listing_type='car', source=source, title='BMW X5',
+                price=10000, location='Rīga', url=f"https://www.ss.com/{number}",
+            )
+            for number in range(2)
+        ]
+        self.filter = Filter.objects.create(user=self.user, name='BMW', filter_type='car')
+        now = timezone.now()
+        self.notifications = []
+        for number in range(6):
+            notification = Notification.objects.create(
+                user=self.user, listing=self.listings[number % 2], filter=self.filter if number < 2 else None,
+                notification_type='new_listing', message=f"Match {number}", read=number >= 4,
+            )
+            # Distinct timestamps, newest last
+            Notification.objects.filter(pk=notification.pk).update(created_at=now - timedelta(minutes=10 - number))
+            self.notifications.append(notification)
+        Notification.objects.create(user=self.other, listing=self.listings[0], notification_type='new_listing', message='x')
+        inbox.recount_unread()
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=self.user).key}")
+
+    def assertCountersMatch(self):
+        wrong = User.objects.annotate(
+            unread=Count('notification', filter=Q(notification__read=False)),
+        ).exclude(unread=F('unread_notifications'))
+        self.assertFalse(wrong.exists(), list(wrong.values_list('username', 'unread_notifications', 'unread')))
+
+    def unread(self):
+        response = self.client.get('/api/notifications/unread_count/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['unread']
+
+
+class InboxApiTests(InboxTestCase):
+    def test_inbox_is_own_and_newest_first(self):
+        response = self.client.get('/api/notifications/?page_size=4')
+        self.assertEqual(response.status_code, 200)
+        page = response.json()
+        self.assertEqual([item['message'] for item in page['results']], ['Match 5', 'Match 4', 'Match 3', 'Match 2'])
+        rest = self.client.get(page['next']).json()
+        self.assertEqual([item['message'] for item in rest['results']], ['Match 1', 'Match 0'])
+
+    def test_pages_keep_count(self):
+        page = self.client.get('/api/notifications/?page_size=4').json()
+        self.assertEqual(page['count'], 6)
+        self.assertIsNone(page['previous'])
+        rest = self.client.get(page['next']).json()
+        self.assertEqual(rest['count'], 6)
+        self.assertEqual(self.client.get(rest['previous']).json()['results'], page['results'])
+
+    def test_unread_filter(self):
+        response = self.client.get('/api/notifications/?unread=true')
+        self.assertEqual(len(response.json()['results']), 4)
+
+    def test_unread_count(self):
+        self.assertEqual(self.unread(), 4)
+
+    def test_read_is_counted_once(self):
+        pk = self.notifications[0].pk
+        self.assertEqual(self.client.post(f"/api/notifications/{pk}/read/").json(), {'unread': 3})
+        self.assertEqual(self.client.post(f"/api/notifications/{pk}/read/").json(), {'unread': 3})
+        self.assertEqual(self.unread(), 3)
+        self.assertCountersMatch()
+
+    def test_mark_unread_with_patch(self):
+        response = self.client.patch(f"/api/notifications/{self.notifications[5].pk}/", {'read': False}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.unread(), 5)
+        self.assertCountersMatch()
+
+    def test_read_all(self):
+        response = self.client.post('/api/notifications/read_all/')
+        self.assertEqual(response.json(), {'marked': 4, 'unread': 0})
+        self.assertEqual(self.unread(), 0)
+        self.assertCountersMatch()
+
+    def test_read_all_with_ids(self):
+        ids = [str(self.notifications[0].pk), str(self.notifications[5].pk)]
+        response = self.client.post('/api/notifications/read_all/', {'ids': ids}, format='json')
+        self.assertEqual(response.json(), {'marked': 1, 'unread': 3})
+        self.assertEqual(self.client.post('/api/notifications/read_all/', {'ids': ['nope']}, format='json').status_code, 400)
+
+    def test_other_users_notifications_are_untouched(self):
+        self.client.post('/api/notifications/read_all/')
+        self.assertEqual(User.objects.get(pk=self.other.pk).unread_notifications, 1)
+
+    def test_delete(self):
+        response = self.client.delete(f"/api/notifications/{self.notifications[0].pk}/")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.unread(), 3)
+        self.assertCountersMatch()
+
+
+class InboxCounterTests(InboxTestCase):
+    def test_listing_delete_cascade(self):
+        inbox.delete_with_notifications(Listing.objects.filter(pk=self.listings[0].pk), 'listing')
+        self.assertFalse(Listing.objects.filter(pk=self.listings[0].pk).exists())
+        self.assertCountersMatch()
+        self.assertEqual(User.objects.get(pk=self.user.pk).unread_notifications, 2)
+        self.assertEqual(User.objects.get(pk=self.other.pk).unread_notifications, 0)
+
+    def test_filter_delete_cascade(self):
+        response = self.client.delete(f"/api/filters/{self.filter.pk}/")
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Notification.objects.filter(message__in=['Match 0', 'Match 1']).exists())
+        self.assertCountersMatch()
+        self.assertEqual(User.objects.get(pk=self.user.pk).unread_notifications, 2)
+
+    def test_delete_does_not_go_row_by_row(self):
+        Notification.objects.bulk_create(
+            Notification(user=self.user, listing=self.listings[0], notification_type='new_listing', message=f"More {number}")
+            for number in range(50)
+        )
+        inbox.recount_unread()
+        # Counting and deleting the notifications is the same few queries however many there are
+        with self.assertNumQueries(13):
+            inbox.delete_with_notifications(Listing.objects.filter(pk=self.listings[0].pk), 'listing')
+        self.assertCountersMatch()
+
+    def test_trim_keeps_newest(self):
+        call_command('trim_notifications', keep=3, batch_size=2, stdout=StringIO())
+        self.assertEqual(
+            list(Notification.objects.filter(user=self.user).order_by('created_at').values_list('message', flat=True)),
+            ['Match 3', 'Match 4', 'Match 5'],
+        )
+        self.assertEqual(Notification.objects.filter(user=self.other).count(), 1)
+        self.assertCountersMatch()
+
+    def test_trim_recount_repairs_counters(self):
+        User.objects.update(unread_notifications=42)
+        call_command('trim_notifications', keep=100, recount=True, stdout=StringIO())
+        self.assertCountersMatch()
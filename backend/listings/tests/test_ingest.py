@@ -0,0 +1,90 @@
+import gzip
+import json
+import os
+from unittest import mock
+
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from listings import ingest
+from listings.models import Listing, Source, User
+
+
+class BatchUpsertTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.source = Source.objects.create(name='ss.com', url='https://www.ss.com', source_type='car')
+        cls.admin = User.objects.create_superuser(username='admin@x.lv', email='admin@x.lv', password=None)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def item(self, number, **fields):
+        return {
+            'external_id': f"ext-{number}", 'listing_type': 'car', 'source_id': self.source.pk,
+            'title': 'BMW X5 2017', 'price': 10000 + number, 'location': 'Rīga',
+            'url': f"https://www.ss.com/{number}", 'year': 2017, 'mileage': 150000, **fields,
+        }
+
+    def ndjson(self, lines):
+        return ''.join(line if isinstance(line, str) else json.dumps(line) + '\n' for line in lines).encode()
+
+    def post(self, body, content_type='application/x-ndjson', **extra):
+        return self.client.generic('POST', '/api/listings/batch/', body, content_type=content_type, **extra)
+
+    def test_json_array(self):
+        response = self.client.post('/api/listings/batch/', [self.item(1), self.item(2)], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['updated']), (2, 0))
+        listing = Listing.objects.get(external_id='ext-1')
+        self.assertEqual(response.data['results'][0]['id'], str(listing.id))
+
+    def test_ndjson_counts_created_updated_skipped_and_errors(self):
+        existing = Listing.objects.create(
+            external_id='ext-1', listing_type='car', source=self.source, title='Old title',
+            price=1, location='Rīga', url='https://www.ss.com/1',
+        )
+        body = self.ndjson([
+            self.item(1), self.item(2, price=1), self.item(2), '{"external_id": \n', self.item(3, source_id=999), '\n',
+        ])
+        response = self.post(body)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {key: response.data[key] for key in ('created', 'updated', 'skipped', 'error')},
+            {'created': 1, 'updated': 1, 'skipped': 1, 'error': 2},
+        )
+        statuses = [(result['index'], result['status']) for result in response.data['results']]
+        self.assertEqual(statuses, [(0, 'updated'), (1, 'skipped'), (2, 'created'), (3, 'error'), (4, 'error')])
+        self.assertEqual(response.data['results'][0]['id'], str(existing.id))
+        self.assertEqual(Listing.objects.get(pk=existing.pk).title, 'BMW X5 2017')
+        self.assertEqual(float(Listing.objects.get(external_id='ext-2').price), 10002)
+
+    def test_gzip(self):
+        response = self.post(gzip.compress(self.ndjson([self.item(1), self.item(2)])), HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 2)
+
+    def test_gzip_is_only_for_ndjson(self):
+        response = self.post(gzip.compress(b'[]'), content_type='application/json', HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 400)
+
+    def test_corrupt_gzip_is_a_400_with_the_results_written_so_far(self):
+        # Random descriptions keep it from compressing into a single read
+        items = [self.item(number, description=os.urandom(100).hex()) for number in range(300)]
+        body = gzip.compress(self.ndjson(items))
+        with mock.patch.object(ingest, 'CHUNK_SIZE', 10):
+            truncated = self.post(body[:-100], HTTP_CONTENT_ENCODING='gzip')
+            self.assertEqual(truncated.status_code, 400)
+            self.assertIn('detail', truncated.data)
+            written = [result['index'] for result in truncated.data['results']]
+            # Whole chunks up to where the stream broke off were written and reported
+            self.assertTrue(0 < len(written) < len(items))
+            self.assertEqual(written, list(range(len(written))))
+            self.assertEqual(len(written) % 10, 0)
+            self.assertEqual(truncated.data['created'], len(written))
+            self.assertEqual(Listing.objects.count(), len(written))
+
+            middle = len(body) // 2
+            corrupt = self.post(body[:middle] + b'\xff' * 64 + body[middle + 64:], HTTP_CONTENT_ENCODING='gzip')
+            self.assertEqual(corrupt.status_code, 400)
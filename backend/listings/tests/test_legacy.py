@@ -0,0 +1,136 @@
+import sqlite3
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.test import TestCase
+
+from listings.legacy import LegacyImport, open_legacy
+from listings.models import Favorite, Listing, Notification, User
+from listings.rekey import MODELS, rekey_model
+
+SCHEMA = Path(settings.BASE_DIR) / 'database' / 'create_tables.sql'
+
+ROWS = """
+INSERT INTO users (id, name, email, password, role) VALUES
+    (1, 'Anna', 'anna@x.lv', 'secret', 'registered'),
+    (2, 'Juris', 'juris@x.lv', 'secret', 'registered');
+INSERT INTO listings (id, title, price, currency, location, type, category, specs, source) VALUES
+    (1, 'BMW X5 2017', 18000, 'EUR', 'Rīga', 'car', 'SUV', '{"year": 2017, "mileage": 150000}', 'ss.com'),
+    (2, '3-room flat', 90000, 'EUR', 'Jūrmala', 'real-estate', 'apartment', '{"rooms": 3, "area": 72.5}', 'city24.lv'),
+    (3, 'Audi A6 2015', 12000, 'USD', 'Rīga', 'car', NULL, NULL, 'ss.com');
+INSERT INTO favorites (user_id, listing_id) VALUES (1, 1), (2, 2), (1, 3);
+INSERT INTO notifications (user_id, title, message, type, read, listing_id) VALUES
+    (1, 'New', 'A match', 'new-listing', 0, 1),
+    (2, 'New', 'A match', 'new-listing', 1, 2),
+    (1, 'New', 'A match', 'new-listing', 0, 3);
+"""
+
+
+class LegacyImportTestCase(TestCase):
+    rows = ROWS
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        path = Path(folder.name) / 'legacy.db'
+        with sqlite3.connect(path) as connection:
+            connection.executescript(SCHEMA.read_text())
+            connection.executescript(self.rows)
+        connection.close()
+        self.connection = open_legacy(path)
+        self.addCleanup(self.connection.close)
+        self.state = {}
+
+    def run_import(self, tables, chunk_size=1):
+        importer = LegacyImport(self.connection, self.state, chunk_size=chunk_size)
+        importer.run(tables)
+        return importer
+
+
+class LegacyImportTests(LegacyImportTestCase):
+    def test_import_is_idempotent(self):
+        tables = ['users', 'listings', 'favorites', 'notifications']
+        self.run_import(tables)
+        self.state = {}
+        self.run_import(tables)
+        self.assertEqual(
+            (User.objects.count(), Listing.objects.count(), Favorite.objects.count(), Notification.objects.count()),
+            (2, 2, 2, 2),
+        )
+        self.assertEqual(User.objects.get(email='anna@x.lv').unread_notifications, 1)
+
+    def test_resume_after_rekey_follows_new_ids(self):
+        self.run_import(['users', 'listings'])
+        for model in MODELS.values():
+            for _ in rekey_model(model):
+                pass
+
+        self.run_import(['favorites', 'notifications'])
+        self.assertEqual(Favorite.objects.count(), 2)
+        self.assertEqual(Notification.objects.count(), 2)
+        users = set(User.objects.values_list('pk', flat=True))
+        listings = set(Listing.objects.values_list('pk', flat=True))
+        for model in (Favorite, Notification):
+            for user_id, listing_id in model.objects.values_list('user_id', 'listing_id'):
+                self.assertIn(user_id, users)
+                self.assertIn(listing_id, listings)
+
+        # Starting over doesn't import the re-keyed rows a second time
+        self.state = {}
+        self.run_import(['users', 'listings', 'favorites', 'notifications'])
+        self.assertEqual(
+            (User.objects.count(), Listing.objects.count(), Favorite.objects.count(), Notification.objects.count()),
+            (2, 2, 2, 2),
+        )
+
+    def test_listings_not_in_eur_are_skipped_and_reported(self):
+        importer = self.run_import(['users', 'listings', 'favorites', 'notifications'])
+        self.assertFalse(Listing.objects.filter(external_id='legacy-3').exists())
+        self.assertEqual(Favorite.objects.count(), 2)
+        self.assertEqual(Notification.objects.count(), 2)
+        counts = importer.skipped_counts()
+        self.assertEqual(counts['legacy listings are not priced in EUR'], 1)
+        self.assertEqual(counts['legacy listings have an unknown type'], 0)
+        self.assertEqual(counts['legacy favorites point at missing or skipped users/listings'], 1)
+        self.assertEqual(counts['legacy notifications point at missing or skipped users/listings'], 1)
+
+    def test_passwords_are_not_hashed_by_default(self):
+        self.run_import(['users'])
+        self.assertFalse(any(user.has_usable_password() for user in User.objects.all()))
+
+
+class LegacyDuplicateEmailTests(LegacyImportTestCase):
+    rows = ROWS + """
+INSERT INTO users (id, name, email, password, role) VALUES (3, 'Anna', ' Anna@X.lv', 'secret', 'registered');
+INSERT INTO favorites (user_id, listing_id) VALUES (3, 2);
+"""
+
+    def test_case_variants_become_one_user(self):
+        # All users in one chunk, so both spellings would go into the same COPY
+        self.run_import(['users', 'listings', 'favorites'], chunk_size=100)
+        self.assertEqual(User.objects.count(), 2)
+        anna = User.objects.get(email='anna@x.lv')
+        self.assertEqual(Favorite.objects.filter(user=anna).count(), 2)
+
+
+class LegacyImageTests(LegacyImportTestCase):
+    rows = ROWS + """
+INSERT INTO listing_images (listing_id, url) VALUES
+    (2, 'https://img.example/2a.jpg'), (1, 'https://img.example/1.jpg'), (2, 'https://img.example/2b.jpg');
+"""
+
+    def test_images_are_read_through_an_index(self):
+        self.run_import(['listings'])
+        self.assertEqual(Listing.objects.get(external_id='legacy-1').images, ['https://img.example/1.jpg'])
+        self.assertEqual(
+            Listing.objects.get(external_id='legacy-2').images,
+            ['https://img.example/2a.jpg', 'https://img.example/2b.jpg'],
+        )
+        plan = ' '.join(
+            str(row[-1]) for row in self.connection.execute(
+                "EXPLAIN QUERY PLAN SELECT listing_id, url FROM listing_images_by_listing "
+                "WHERE listing_id BETWEEN 1 AND 2 ORDER BY listing_id, id"
+            )
+        )
+        self.assertIn('USING INDEX listing_images_by_listing_id', plan)
@@ -0,0 +1,79 @@
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from prometheus_client import REGISTRY
+
+from listings.models import Place, User
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@override_settings(METRICS_TOKEN='s3cret', METRICS_ALLOWED_IPS=['10.0.0.5'])
+class MetricsAccessTests(TestCase):
+    def get(self, remote_addr='203.0.113.7', **headers):
+        return self.client.get('/metrics', REMOTE_ADDR=remote_addr, headers=headers)
+
+    def test_anonymous_requests_are_refused(self):
+        self.assertEqual(self.get().status_code, 404)
+        self.assertEqual(self.get(Authorization='Bearer wrong').status_code, 404)
+
+    def test_token(self):
+        response = self.get(Authorization='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'agg_http_request_duration_seconds', response.content)
+
+    def test_allowed_ip(self):
+        self.assertEqual(self.get(remote_addr='10.0.0.5').status_code, 200)
+
+    def test_staff_only(self):
+        user = User.objects.create_user(username='someone', email='someone@example.com', password=None)
+        self.client.force_login(user)
+        self.assertEqual(self.get().status_code, 404)
+        user.is_staff = True
+        user.save(update_fields=['is_staff'])
+        self.assertEqual(self.get().status_code, 200)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_empty_token_never_matches(self):
+        self.assertEqual(self.get(Authorization='Bearer ').status_code, 404)
+
+
+class MetricsMiddlewareTests(TestCase):
+    view = 'PlaceViewSet.list'
+
+    def setUp(self):
+        Place.objects.create(name='Rīga', region='Rīga', latitude=56.95, longitude=24.11, geohash='ud1hf')
+
+    def test_request_is_recorded_under_its_viewset_action(self):
+        requests = sample('agg_http_request_duration_seconds_count', method='GET', view=self.view, status='200')
+        sizes = sample('agg_http_response_size_bytes_sum', view=self.view)
+        response = self.client.get('/api/places/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sample('agg_http_request_duration_seconds_count', method='GET', view=self.view, status='200'), requests + 1,
+        )
+        self.assertEqual(sample('agg_http_response_size_bytes_sum', view=self.view), sizes + len(response.content))
+        self.assertGreater(sample('agg_http_request_serialization_seconds_count', view=self.view), 0)
+
+    def test_queries_of_the_request_are_counted(self):
+        queries = sample('agg_http_request_db_queries_sum', view=self.view)
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get('/api/places/')
+        self.assertGreater(len(captured), 0)
+        self.assertEqual(sample('agg_http_request_db_queries_sum', view=self.view), queries + len(captured))
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_queries_over_the_threshold_are_logged(self):
+        slow = sample('agg_db_slow_queries_total', view=self.view)
+        with self.assertLogs('listings.slow_queries', 'WARNING') as logs:
+            self.client.get('/api/places/')
+        self.assertIn('listings_place', logs.output[0])
+        self.assertIn(self.view, logs.output[0])
+        self.assertEqual(sample('agg_db_slow_queries_total', view=self.view), slow + len(logs.output))
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=60000)
+    def test_fast_queries_are_not_logged(self):
+        with self.assertNoLogs('listings.slow_queries', 'WARNING'):
+            self.client.get('/api/places/')
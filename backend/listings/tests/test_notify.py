@@ -0,0 +1,74 @@
+import smtplib
+from io import StringIO
+from unittest import mock
+
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase
+from prometheus_client import REGISTRY
+
+from listings.models import Listing, Notification, Source, User
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class SendNotificationsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user@x.lv', email='user@x.lv', password=None)
+        self.quiet = User.objects.create_user(
+            username='quiet@x.lv', email='quiet@x.lv', password=None, email_notifications=False,
+        )
+        source = Source.objects.create(name='ss.com', url='https://www.ss.com', source_type='car')
+        listing = Listing.objects.create(
+            external_id='test-1', listing_type='car', source=source, title='BMW X5',
+            price=10000, location='Rīga', url='https://www.ss.com/1',
+        )
+        self.pending = Notification.objects.create(
+            user=self.user, listing=listing, notification_type='new_listing', message='A match',
+        )
+        self.inbox_only = Notification.objects.create(
+            user=self.quiet, listing=listing, notification_type='new_listing', message='A match',
+        )
+        Notification.objects.create(
+            user=self.user, listing=listing, notification_type='new_listing', message='Old', status='sent',
+        )
+
+    def send(self):
+        call_command('send_notifications', batch_size=1, stdout=StringIO())
+
+    def test_pending_notifications_are_emailed_once(self):
+        self.send()
+        self.assertEqual([message.to for message in mail.outbox], [['user@x.lv']])
+        self.assertEqual(mail.outbox[0].body, 'A match')
+        self.assertFalse(Notification.objects.filter(status='pending').exists())
+        self.assertIsNotNone(Notification.objects.get(pk=self.pending.pk).sent_at)
+        self.send()
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_users_without_email_notifications_get_none(self):
+        self.send()
+        self.assertEqual(Notification.objects.get(pk=self.inbox_only.pk).status, 'sent')
+        self.assertNotIn(['quiet@x.lv'], [message.to for message in mail.outbox])
+
+    def test_runs_and_results_are_reported(self):
+        runs = sample('agg_job_duration_seconds_count', job='send_notifications')
+        sent = sample('agg_notifications_total', result='sent')
+        failed = sample('agg_notifications_total', result='failed')
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=smtplib.SMTPException):
+            with self.assertLogs('listings.notify', 'WARNING'):
+                self.send()
+        self.assertEqual(Notification.objects.get(pk=self.pending.pk).status, 'failed')
+        self.assertEqual(sample('agg_job_duration_seconds_count', job='send_notifications'), runs + 1)
+        self.assertIsNotNone(REGISTRY.get_sample_value('agg_job_last_success_timestamp_seconds', {'job': 'send_notifications'}))
+        self.assertEqual(sample('agg_notifications_total', result='sent'), sent + 1)
+        self.assertEqual(sample('agg_notifications_total', result='failed'), failed + 1)
+
+    def test_failed_run_is_counted(self):
+        failures = sample('agg_job_failures_total', job='send_notifications')
+        with mock.patch('listings.notify.get_connection', side_effect=OSError("no mail server")):
+            with self.assertRaises(OSError):
+                self.send()
+        self.assertEqual(sample('agg_job_failures_total', job='send_notifications'), failures + 1)
+        self.assertEqual(Notification.objects.filter(status='pending').count(), 2)
@@ -0,0 +1,61 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from listings import places
+from listings.geo import covering_cells
+from listings.models import Place
+from listings.places import GEOHASH_PRECISION, clear_caches, load_gazetteer, places_within, resolve_place
+
+
+class CoveringCellsTests(SimpleTestCase):
+    def test_cells_are_never_longer_than_max_precision(self):
+        for radius_km in (0, 0.1, 1, 50):
+            cells = covering_cells(56.9496, 24.1052, radius_km, max_precision=GEOHASH_PRECISION)
+            self.assertTrue(cells)
+            self.assertTrue(all(len(cell) <= GEOHASH_PRECISION for cell in cells), (radius_km, cells))
+
+
+class PlacesWithinTests(TestCase):
+    def setUp(self):
+        load_gazetteer()
+        self.riga = Place.objects.get(name='Rīga')
+
+    def test_small_radius_finds_the_place_itself(self):
+        for radius_km in (0, 0.1):
+            self.assertEqual(places_within(self.riga.latitude, self.riga.longitude, radius_km), [self.riga.id])
+
+    def test_large_radius_finds_neighbours(self):
+        nearby = places_within(self.riga.latitude, self.riga.longitude, 30)
+        self.assertIn(self.riga.id, nearby)
+        self.assertGreater(len(nearby), 1)
+
+
+class ResolvePlaceTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.addCleanup(clear_caches)
+
+    def test_places_added_later_are_resolved(self):
+        self.assertIsNone(resolve_place('Rīga, Centrs'))
+        # Like load_gazetteer in another process: this process's caches aren't cleared
+        riga = Place.objects.create(name='Rīga', region='riga', latitude=56.9496, longitude=24.1052)
+        with mock.patch.object(places, 'INDEX_REFRESH_SECONDS', 0):
+            self.assertEqual(resolve_place('Rīga, Centrs'), riga.id)
+        self.assertEqual(resolve_place('rigas'), riga.id)
+
+    def test_misses_reload_the_index_at_most_every_refresh_interval(self):
+        # One query loads the (empty) index, the other misses use it
+        with self.assertNumQueries(1):
+            for number in range(20):
+                self.assertIsNone(resolve_place(f"Nowhere {number}"))
+
+    def test_spellings(self):
+        load_gazetteer()
+        riga, jelgava = Place.objects.get(name='Rīga').id, Place.objects.get(name='Jelgava').id
+        for text, expected in [
+            ('Rīga', riga), (' RIGA ', riga), ('Rīgas raj.', riga), ('Rīga, Centrs', riga), ('Centrs Rīga', riga),
+            ('Jelgava un raj.', jelgava), ('Rīgas iela, Jelgava', jelgava), ('Rīgas iela 5 Jelgava', jelgava),
+            ('Rīgas iela 5', None), ('', None), (None, None),
+        ]:
+            self.assertEqual(resolve_place(text), expected, text)
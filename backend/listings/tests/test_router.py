@@ -0,0 +1,86 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from agg_backend.db_router import PrimaryReplicaRouter, is_pinned, pick_replica, pin_to_primary, read_from_replica
+from listings.models import Filter, Listing, User
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class RouterTests(TestCase):
+    router = PrimaryReplicaRouter()
+
+    def test_outside_a_request_everything_uses_the_primary(self):
+        self.assertEqual(self.router.db_for_read(Listing), 'default')
+        self.assertEqual(self.router.db_for_write(Listing), 'default')
+
+    def test_reads_go_to_the_replica_until_something_is_written(self):
+        with read_from_replica() as routing:
+            self.assertEqual(self.router.db_for_read(Listing), 'replica1')
+            self.assertEqual(self.router.db_for_write(Listing), 'default')
+            self.assertTrue(routing.wrote)
+            self.assertEqual(self.router.db_for_read(Listing), 'default')
+
+    def test_reads_stay_on_the_primary_when_not_allowed(self):
+        with read_from_replica(allowed=False) as routing:
+            self.assertEqual(self.router.db_for_read(Listing), 'default')
+            routing.allowed = True
+            self.assertEqual(self.router.db_for_read(Listing), 'replica1')
+
+    def test_only_the_primary_is_migrated(self):
+        self.assertTrue(self.router.allow_migrate('default', 'listings'))
+        self.assertFalse(self.router.allow_migrate('replica1', 'listings'))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_uses_the_primary(self):
+        self.assertEqual(pick_replica(), 'default')
+        with read_from_replica() as routing:
+            self.assertIsNone(routing.replica)
+            self.assertEqual(self.router.db_for_read(Listing), 'default')
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaPinTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='user@x.lv', email='user@x.lv', password=None)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def routed_reads(self, method, *args, **kwargs):
+        # Records where reads would go, but runs them all on the one test database
+        aliases = []
+        db_for_read = PrimaryReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            aliases.append(db_for_read(router, model, **hints))
+            return 'default'
+
+        with mock.patch.object(PrimaryReplicaRouter, 'db_for_read', autospec=True, side_effect=record):
+            response = getattr(self.client, method)(*args, **kwargs)
+        self.assertLess(response.status_code, 400, response.content)
+        return aliases
+
+    def test_pin(self):
+        self.assertFalse(is_pinned(self.user))
+        pin_to_primary(self.user)
+        self.assertTrue(is_pinned(self.user))
+        pin_to_primary(None)
+
+    def test_safe_reads_use_the_replica(self):
+        self.assertIn('replica1', self.routed_reads('get', '/api/filters/'))
+
+    def test_reads_after_a_write_stay_on_the_primary(self):
+        self.routed_reads('post', '/api/filters/', {'user_id': self.user.pk, 'name': 'Cars', 'filter_type': 'car'}, format='json')
+        self.assertTrue(Filter.objects.filter(user=self.user).exists())
+        self.assertTrue(is_pinned(self.user))
+        self.assertNotIn('replica1', self.routed_reads('get', '/api/filters/'))
+        # Other users still read from the replica
+        self.client.force_authenticate(User.objects.create_user(username='other@x.lv', email='other@x.lv', password=None))
+        self.assertIn('replica1', self.routed_reads('get', '/api/filters/'))
+
+    def test_the_pin_is_shared_between_processes(self):
+        # Workers only share what's in the cache backend, not process memory
+        self.assertNotIn('locmem', cache.__class__.__module__)
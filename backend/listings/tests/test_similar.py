@@ -0,0 +1,81 @@
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from listings import similar
+from listings.models import Listing, Place, Source, User
+from listings.places import clear_caches
+
+
+def make_listing(source, number, **fields):
+    values = {
+        'external_id': f"test-{number}", 'listing_type': 'car', 'source': source,
+        'title': f"BMW X5 {number}", 'price': 10000 + number * 100, 'location': 'Rīga',
+        'url': f"https://www.ss.com/{number}", 'year': 2015, 'mileage': 100000 + number * 1000,
+        'fuel_type': 'diesel',
+    }
+    values.update(fields)
+    return Listing.objects.create(**values)
+
+
+class SimilarIndexTests(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        settings_override = override_settings(SIMILAR_LISTINGS={'ROOT': root.name})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        similar._indexes.clear()
+        self.addCleanup(similar._indexes.clear)
+
+        self.source = Source.objects.create(name='ss.com', url='https://www.ss.com', source_type='car')
+        self.listings = [make_listing(self.source, number) for number in range(10)]
+        call_command('build_similarity_index', stdout=StringIO())
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser(username='admin@x.lv', email='admin@x.lv', password='x'))
+
+    def test_similar_returns_neighbours(self):
+        response = self.client.get(f"/api/listings/{self.listings[0].pk}/similar/?limit=3")
+        self.assertEqual(response.status_code, 200)
+        ids = [item['id'] for item in response.json()]
+        self.assertEqual(len(ids), 3)
+        self.assertNotIn(str(self.listings[0].pk), ids)
+
+    def test_delete_removes_listing_from_index(self):
+        deleted = self.listings[1]
+        response = self.client.delete(f"/api/listings/{deleted.pk}/")
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Listing.objects.filter(pk=deleted.pk).exists())
+
+        response = self.client.get(f"/api/listings/{self.listings[0].pk}/similar/?limit=50")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(str(deleted.pk), [item['id'] for item in response.json()])
+
+    def test_removed_slots_are_reused(self):
+        index = similar.get_index('car')
+        self.client.delete(f"/api/listings/{self.listings[1].pk}/")
+        added = make_listing(self.source, 99)
+        similar.index_listings([added])
+        self.assertEqual(index._read_meta()['count'], 10)
+
+        response = self.client.get(f"/api/listings/{self.listings[0].pk}/similar/?limit=50")
+        self.assertIn(str(added.pk), [item['id'] for item in response.json()])
+
+    def test_queries_use_cached_place_coordinates(self):
+        self.addCleanup(clear_caches)
+        place = Place.objects.create(name='Rīga', region='Rīga', latitude=56.95, longitude=24.11, geohash='ud1hf')
+        listing = make_listing(self.source, 99, listing_type='real_estate', place=place, rooms=2, area=50)
+        call_command('build_similarity_index', stdout=StringIO())
+        similar.similar_listing_ids(listing, 3)
+        with self.assertNumQueries(0):
+            similar.similar_listing_ids(listing, 3)
+
+    def test_update_before_build_writes_nothing(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        index = similar.VectorIndex('car', root=f"{root.name}/missing")
+        index.update([similar._row(self.listings[0])])
+        self.assertFalse(index.root.exists())
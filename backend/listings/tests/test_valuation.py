@@ -0,0 +1,82 @@
+from unittest import mock
+
+from django.db import transaction
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from listings import valuation
+from listings.models import Listing, Source, User
+
+
+class DealScoreTests(TestCase):
+    def setUp(self):
+        source = Source.objects.create(name='ss.com', url='https://www.ss.com', source_type='car')
+        self.listings = [
+            Listing.objects.create(
+                external_id=f"test-{number}", listing_type='car', source=source, title='BMW X5 2017',
+                price=10000 + number * 1000, location='Rīga', url=f"https://www.ss.com/{number}",
+                year=2017, mileage=150000,
+            )
+            for number in range(8)
+        ]
+
+    def test_scores_are_relative_to_segment_median(self):
+        valuation.score_all()
+        cheapest = Listing.objects.get(pk=self.listings[0].pk)
+        self.assertEqual(cheapest.market_segment, 'car:bmw x5')
+        self.assertEqual(float(cheapest.market_price), 13500)
+        self.assertGreater(cheapest.deal_score, 0)
+        self.assertEqual(valuation.score_all(), 0)
+
+    def test_deactivated_listings_lose_their_score(self):
+        valuation.score_all()
+        Listing.objects.filter(pk=self.listings[0].pk).update(is_active=False)
+        valuation.score_all()
+        listing = Listing.objects.get(pk=self.listings[0].pk)
+        self.assertIsNone(listing.deal_score)
+        self.assertIsNone(listing.market_price)
+
+    def test_deactivating_through_the_api_clears_the_score(self):
+        valuation.score_all()
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser(username='admin@x.lv', email='admin@x.lv', password='x'))
+        response = client.patch(f"/api/listings/{self.listings[0].pk}/", {'is_active': False}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(Listing.objects.get(pk=self.listings[0].pk).deal_score)
+
+    def test_save_in_several_chunks_inside_a_transaction(self):
+        with mock.patch.object(valuation, 'CHUNK_SIZE', 3), transaction.atomic():
+            self.assertEqual(valuation.score_all(), len(self.listings))
+        self.assertFalse(Listing.objects.filter(deal_score=None).exists())
+
+    def test_a_listing_moving_segment_refreshes_the_one_it_left(self):
+        valuation.score_all()
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser(username='admin@x.lv', email='admin@x.lv', password=None))
+        response = client.patch(f"/api/listings/{self.listings[0].pk}/", {'title': 'Audi A6 2017'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Listing.objects.get(pk=self.listings[0].pk).market_segment, 'car:audi a6')
+        # The BMW X5 median no longer includes the listing that left (11000..17000)
+        self.assertEqual(float(Listing.objects.get(pk=self.listings[1].pk).market_price), 14000)
+
+    def test_batch_upsert_moving_segment_refreshes_the_one_it_left(self):
+        valuation.score_all()
+        listing = self.listings[0]
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser(username='admin@x.lv', email='admin@x.lv', password=None))
+        item = {
+            'external_id': listing.external_id, 'listing_type': 'car', 'source_id': listing.source_id,
+            'title': 'Audi A6 2017', 'price': 10000, 'location': 'Rīga', 'url': listing.url,
+            'year': 2017, 'mileage': 150000,
+        }
+        response = client.post('/api/listings/batch/', [item], format='json')
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(float(Listing.objects.get(pk=self.listings[1].pk).market_price), 14000)
+
+    def test_assign_segments_reports_old_and_new_segments(self):
+        valuation.score_all()
+        listing = Listing.objects.get(pk=self.listings[0].pk)
+        listing.title = 'Audi A6 2017'
+        listing.save()
+        self.assertEqual(valuation.assign_segments([listing]), {'car:bmw x5', 'car:audi a6'})
+        self.assertEqual(Listing.objects.get(pk=listing.pk).market_segment, 'car:audi a6')
@@ -2,14 +2,15 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework.authtoken.views import obtain_auth_token
 from .views import (
-    UserViewSet, SourceViewSet, ListingViewSet,
+    UserViewSet, SourceViewSet, PlaceViewSet, ListingViewSet,
     FilterViewSet, FavoriteViewSet, NotificationViewSet,
-    RegisterView,
+    RegisterView, cached_image,
 )
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet)
 router.register(r'sources', SourceViewSet)
+router.register(r'places', PlaceViewSet)
 router.register(r'listings', ListingViewSet)
 router.register(r'filters', FilterViewSet)
 router.register(r'favorites', FavoriteViewSet)
@@ -22,4 +23,6 @@ urlpatterns = [
     # Expects a POST request with 'username' and 'password' fields, returns an authentication token.
     path('auth/login/', obtain_auth_token, name='api_token_auth'),
     path('auth/register/', RegisterView.as_view(), name='api_register'),
+    # Listing images from our own cache (see images.py)
+    path('images/<str:url_hash>/<str:size>/', cached_image, name='cached_image'),
 ]
\ No newline at end of file
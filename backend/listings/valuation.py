@@ -0,0 +1,309 @@
+# Market value and deal score
+# Each listing belongs to a market segment of comparable listings (make + model for cars;
+# property type + place for real estate). Within it, the reference ("market") price is the
+# median of the most specific group that has enough listings:
+#   cars:        segment + year bucket + mileage bucket -> segment + year bucket -> segment
+#   real estate: segment + rooms + area bucket          -> segment + rooms       -> segment
+# (for real estate the median is taken of the price per m², then multiplied by the area).
+# deal_score is how many percent the asking price is below that (negative = above market).
+#
+# Everything is computed on numpy columns: one sort per grouping level gives every group's
+# median at once, so millions of listings take seconds. Since all levels nest inside a
+# segment, refreshing only the segments an ingest batch touched gives the same result as
+# a full run for those listings.
+
+import math
+
+import numpy as np
+from django.db import connection, transaction
+
+from .bulkload import copy_into
+from .models import Listing
+
+# A group needs at least this many listings to be trusted as a reference
+MIN_GROUP_SIZE = 5
+
+# Rows read from the database / written back at a time
+CHUNK_SIZE = 10000
+
+# Segments refreshed per query in refresh_segments
+SEGMENT_BATCH = 500
+
+YEAR_BUCKET = 3             # years
+MILEAGE_BUCKET = 50000      # km
+AREA_BUCKET_RATIO = 1.25    # area buckets grow by 25% (30-37 m², 37-47 m², ...)
+MAX_ROOMS = 5               # 5 and more rooms are one group
+
+FIELDS = [
+    'id', 'listing_type', 'title', 'property_type', 'place_id', 'location', 'price',
+    'year', 'mileage', 'rooms', 'area', 'market_segment', 'market_price', 'deal_score',
+]
+
+
+def market_segment(listing_type, title, property_type, place_id, location):
+    """
+    The group of comparable listings, like "car:bmw x5" or "real_estate:apartment:12".
+    """
+    if listing_type == 'car':
+        # Titles start with make and model ("BMW X5 2017", "Volkswagen Golf ...")
+        words = (title or '').lower().split()[:2]
+        return f"car:{' '.join(words)}" if words else None
+    if listing_type == 'real_estate':
+        where = place_id or (location or '').strip().lower()
+        return f"real_estate:{property_type or 'other'}:{where}"
+    return None
+
+
+def segment_for(listing):
+    return market_segment(
+        listing.listing_type, listing.title, listing.property_type, listing.place_id, listing.location,
+    )
+
+
+def _number_column(values):
+    return np.array([np.nan if value is None else float(value) for value in values], dtype=np.float64)
+
+
+def _bucket(values, size):
+    # Bucket number, -1 for unknown
+    return np.where(np.isnan(values), -1, np.floor(np.nan_to_num(values) / size)).astype(np.int64)
+
+
+def _group_codes(*columns):
+    # One small integer per distinct combination of the (integer) columns
+    codes = np.zeros(len(columns[0]), dtype=np.int64)
+    for column in columns:
+        _, column_codes = np.unique(column, return_inverse=True)
+        codes = codes * (int(column_codes.max(initial=0)) + 1) + column_codes.ravel()
+    _, codes = np.unique(codes, return_inverse=True)
+    return codes.ravel()
+
+
+def group_medians(codes, values):
+    """
+    Median of values for every group code, and the size of every group.
+    One lexsort orders rows by group and value; each group's median is then picked by position.
+    """
+    order = np.lexsort((values, codes))
+    sorted_values = values[order]
+    counts = np.bincount(codes)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    present = counts > 0
+    medians = np.full(len(counts), np.nan)
+    low = starts[present] + (counts[present] - 1) // 2
+    high = starts[present] + counts[present] // 2
+    medians[present] = (sorted_values[low] + sorted_values[high]) / 2
+    return medians, counts
+
+
+def reference_prices(columns):
+    """
+    Market price for each row of a columnar batch (dict of numpy arrays), NaN if no group
+    with enough comparable listings exists. Rows of both listing types may be mixed.
+    """
+    count = len(columns['price'])
+    reference = np.full(count, np.nan)
+    if not count:
+        return reference
+    _, segments = np.unique(columns['market_segment'], return_inverse=True)
+    segments = segments.ravel()
+    is_car = columns['listing_type'] == 'car'
+    area = columns['area']
+
+    # Cars are compared on price, real estate on price per m²
+    unit_price = np.where(is_car, columns['price'], columns['price'] / np.where(area > 0, area, np.nan))
+    known = ~np.isnan(unit_price) & (columns['market_segment'] != '')
+
+    year_bucket = _bucket(columns['year'], YEAR_BUCKET)
+    mileage_bucket = _bucket(columns['mileage'], MILEAGE_BUCKET)
+    rooms = np.minimum(np.nan_to_num(columns['rooms'], nan=-1), MAX_ROOMS).astype(np.int64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        area_bucket = _bucket(np.log(area) / math.log(AREA_BUCKET_RATIO), 1)
+
+    # Finest level first; a row takes the first level whose group is big enough
+    levels = [
+        (np.where(is_car, year_bucket, rooms), np.where(is_car, mileage_bucket, area_bucket)),
+        (np.where(is_car, year_bucket, rooms),),
+        (),
+    ]
+    unit_reference = np.full(count, np.nan)
+    rows = np.flatnonzero(known)
+    if not rows.size:
+        return reference
+    for extra in levels:
+        codes = _group_codes(segments[rows], *(column[rows] for column in extra))
+        medians, sizes = group_medians(codes, unit_price[rows])
+        trusted = (sizes[codes] >= MIN_GROUP_SIZE) & np.isnan(unit_reference[rows])
+        unit_reference[rows[trusted]] = medians[codes[trusted]]
+
+    reference = np.where(is_car, unit_reference, unit_reference * area)
+    return reference
+
+
+def deal_scores(prices, reference):
+    # Percent below the market price (positive = cheaper than comparable listings)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = np.round((reference - prices) / reference * 100, 1)
+    return np.where(np.isfinite(scores), scores, np.nan)
+
+
+def _load_columns(queryset):
+    """
+    Reads the listings into numpy columns (market_segment computed where missing).
+    """
+    rows = queryset.values_list(*FIELDS).iterator(chunk_size=CHUNK_SIZE)
+    # One list per column, filled straight from the row tuples
+    data = [[] for _ in FIELDS]
+    for row in rows:
+        for column, value in zip(data, row):
+            column.append(value)
+    data = dict(zip(FIELDS, data))
+    stored = data['market_segment']
+    segments = [
+        segment or market_segment(listing_type, title, property_type, place_id, location)
+        for segment, listing_type, title, property_type, place_id, location in zip(
+            stored, data['listing_type'], data['title'], data['property_type'],
+            data['place_id'], data['location'],
+        )
+    ]
+
+    columns = {
+        'id': data['id'],
+        'listing_type': np.array(data['listing_type'], dtype=object),
+        'market_segment': np.array([segment or '' for segment in segments], dtype=object),
+        'stored_segment': np.array([segment or '' for segment in stored], dtype=object),
+        'market_price': _number_column(data['market_price']),
+        'deal_score': _number_column(data['deal_score']),
+    }
+    for name in ('price', 'year', 'mileage', 'rooms', 'area'):
+        columns[name] = _number_column(data[name])
+    return columns
+
+
+def _save(rows):
+    """
+    Writes (id, market_segment, market_price, deal_score) rows back.
+    PostgreSQL: COPY into a temporary table and one UPDATE ... FROM per chunk;
+    elsewhere bulk_update.
+    """
+    for start in range(0, len(rows), CHUNK_SIZE):
+        chunk = rows[start:start + CHUNK_SIZE]
+        if connection.vendor == 'postgresql':
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    "CREATE TEMPORARY TABLE listing_valuation "
+                    "(id uuid PRIMARY KEY, market_segment varchar(200), "
+                    "market_price numeric(10, 2), deal_score double precision)"
+                )
+                copy_into(cursor, 'listing_valuation', ['id', 'market_segment', 'market_price', 'deal_score'], chunk)
+                cursor.execute(
+                    f"UPDATE {Listing._meta.db_table} AS listing "
+                    "SET market_segment = v.market_segment, market_price = v.market_price, "
+                    "deal_score = v.deal_score FROM listing_valuation AS v WHERE listing.id = v.id"
+                )
+                # Dropped right away: inside a caller's transaction this block is only a
+                # savepoint, and the next chunk creates the table again
+                cursor.execute("DROP TABLE listing_valuation")
+        else:
+            Listing.objects.bulk_update(
+                [
+                    Listing(id=pk, market_segment=segment, market_price=price, deal_score=score)
+                    for pk, segment, price, score in chunk
+                ],
+                ['market_segment', 'market_price', 'deal_score'],
+                batch_size=1000,
+            )
+
+
+def _differs(new, old):
+    # Elementwise "changed", where NaN == NaN (no value before, no value now)
+    return ~((new == old) | (np.isnan(new) & np.isnan(old)))
+
+
+def score_queryset(queryset):
+    """
+    Recomputes market_price and deal_score for the listings in the queryset
+    (which should cover whole segments). Only rows whose values changed are written.
+    Returns the number of listings updated.
+    """
+    columns = _load_columns(queryset)
+    reference = reference_prices(columns)
+    scores = deal_scores(columns['price'], reference)
+    reference = np.round(reference, 2)
+
+    changed_rows = np.flatnonzero(
+        _differs(reference, np.round(columns['market_price'], 2))
+        | _differs(scores, columns['deal_score'])
+        | (columns['market_segment'] != columns['stored_segment'])
+    )
+    changed = [
+        (
+            columns['id'][row],
+            columns['market_segment'][row] or None,
+            None if np.isnan(reference[row]) else float(reference[row]),
+            None if np.isnan(scores[row]) else float(scores[row]),
+        )
+        for row in changed_rows
+    ]
+    _save(changed)
+    return len(changed)
+
+
+def clear_scores(queryset):
+    """
+    Removes market price and deal score from listings (deactivated ones are no deals).
+    Returns the number of listings changed.
+    """
+    return queryset.exclude(market_price=None, deal_score=None).update(market_price=None, deal_score=None)
+
+
+def score_all(listing_type=None):
+    """
+    The full batch job: every active listing (of one type, or all); inactive ones lose their score.
+    """
+    queryset = Listing.objects.all()
+    if listing_type:
+        queryset = queryset.filter(listing_type=listing_type)
+    cleared = clear_scores(queryset.filter(is_active=False))
+    return cleared + score_queryset(queryset.filter(is_active=True))
+
+
+def refresh_segments(segments):
+    """
+    Recomputes only the given market segments (after an ingest batch).
+    """
+    segments = sorted(segment for segment in set(segments) if segment)
+    updated = 0
+    for start in range(0, len(segments), SEGMENT_BATCH):
+        batch = segments[start:start + SEGMENT_BATCH]
+        updated += clear_scores(Listing.objects.filter(is_active=False, market_segment__in=batch))
+        updated += score_queryset(Listing.objects.filter(is_active=True, market_segment__in=batch))
+    return updated
+
+
+def assign_segments(listings):
+    """
+    Sets market_segment on saved listings (and in the database, where it changed).
+    Returns every segment involved: the current ones and any a listing moved out of,
+    whose medians still count it until they are refreshed.
+    """
+    touched = set()
+    moved = {}
+    for listing in listings:
+        segment = segment_for(listing)
+        touched.update((listing.market_segment, segment))
+        if listing.market_segment != segment:
+            listing.market_segment = segment
+            moved.setdefault(segment, []).append(listing.pk)
+    for segment, pks in moved.items():
+        Listing.objects.filter(pk__in=pks).update(market_segment=segment)
+    touched.discard(None)
+    return touched
+
+
+def update_deal_scores(listings):
+    """
+    Called after listings were saved: makes sure their market_segment is set and refreshes
+    the segments they are in (and were in before).
+    """
+    return refresh_segments(assign_segments(listings))
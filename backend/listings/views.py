@@ -1,35 +1,195 @@
 from rest_framework import viewsets, permissions, generics
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
 from django.contrib.auth.hashers import make_password
-from .models import User, Source, Listing, Filter, Favorite, Notification
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseNotModified, HttpResponseRedirect, StreamingHttpResponse,
+)
+from django.utils.cache import patch_vary_headers
+from .models import User, Source, Place, Listing, ArchivedListing, CachedImage, Filter, Favorite, Notification
 from .serializers import (
-    UserSerializer, SourceSerializer, ListingSerializer,
+    UserSerializer, SourceSerializer, PlaceSerializer, ListingSerializer,
     FilterSerializer, FavoriteSerializer, NotificationSerializer
 )
+from agg_backend.db_router import is_pinned, pick_replica, pin_to_primary, read_from_replica
+from .filters import filter_listings, order_listings
+from .export import EXPORT_FORMATS, accepts_gzip, export_stream
+from .images import ORIGINAL, enqueue_images, image_path, image_settings, touch
+from .inbox import InboxPagination, delete_notifications, delete_with_notifications, mark_read, notifications_created, recount_unread, unread_count
+from .ingest import UnreadableBody, count_statuses, iter_ndjson, upsert_listings
+from .metrics import can_scrape, render_metrics
+from .places import resolve_place
+from .rekey import resolve_alias
+from .similar import SOURCE_FIELDS, index_listings, similar_listing_ids
+from .valuation import refresh_segments, update_deal_scores
 
 #API views handle HTTP requests (GET, POST, PUT, DELETE)
 # #They connect models/serializers to the outside world, so the frontend can fetch and update data. 
 # Routing tells Django which URLs should trigger which views.
 
+# Safe (read-only) actions read from a database replica, unless the user wrote something
+# in the last few seconds - then they stay on the primary so they see their own changes
+class ReplicaReadMixin:
+    def dispatch(self, request, *args, **kwargs):
+        # Primary until initial() has authenticated the user and decided otherwise
+        with read_from_replica(allowed=False) as routing:
+            self.db_routing = routing
+            response = super().dispatch(request, *args, **kwargs)
+        if routing.wrote:
+            pin_to_primary(getattr(self.request, 'user', None))
+        return response
+
+    # Runs after authentication, so we know who the user is
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.db_routing.allowed = request.method in permissions.SAFE_METHODS and not is_pinned(request.user)
+
 # UserViewSet allows CRUD operations on users (admin only for now)
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAdminUser]
 
 # SourceViewSet allows CRUD operations on sources (admin only)
-class SourceViewSet(viewsets.ModelViewSet):
+class SourceViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Source.objects.all()
     serializer_class = SourceSerializer
     permission_classes = [permissions.IsAdminUser]
 
+# PlaceViewSet lists the known cities/towns (for location and "near" filters), read-only
+class PlaceViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Place.objects.all().order_by('name')
+    serializer_class = PlaceSerializer
+    permission_classes = [permissions.AllowAny]
+    pagination_class = None
+
 # ListingViewSet allows anyone to view listings, but only admins can add/edit/delete
-class ListingViewSet(viewsets.ModelViewSet):
+class ListingViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Listing.objects.all().order_by('-created_at')
     serializer_class = ListingSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
+    # Apply ?listing_type=car&max_price=15000&... filters and ?ordering=-deal_score (see filters.py)
+    def get_queryset(self):
+        params = self.request.query_params
+        return order_listings(filter_listings(super().get_queryset(), params), params)
+
+    # Archived listings are not in the list, but their detail pages (and similar listings)
+    # still work, and so do links with the id a listing had before it got a time-ordered one
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            if self.action not in ('retrieve', 'similar'):
+                raise
+        pk = self.kwargs['pk']
+        try:
+            listing = ArchivedListing.objects.select_related('source').filter(pk=pk).first()
+            if listing is None:
+                new_id = resolve_alias(Listing, pk)
+                listing = new_id and Listing.objects.select_related('source').filter(pk=new_id).first()
+        except (ValueError, DjangoValidationError):
+            raise Http404
+        if not listing:
+            raise Http404
+        self.check_object_permissions(self.request, listing)
+        return listing
+
+    # Resolve the free-text location to a known place once, when the listing is saved,
+    # queue its images for the local image cache and refresh its "similar listings" vector
+    def perform_create(self, serializer):
+        listing = serializer.save(place_id=resolve_place(serializer.validated_data.get('location')))
+        enqueue_images(listing.images)
+        index_listings([listing])
+        update_deal_scores([listing])
+
+    def perform_update(self, serializer):
+        if 'location' in serializer.validated_data:
+            listing = serializer.save(place_id=resolve_place(serializer.validated_data['location']))
+        else:
+            listing = serializer.save()
+        enqueue_images(listing.images)
+        index_listings([listing])
+        update_deal_scores([listing])
+
+    # The index gets a snapshot of the deleted row; the listing's segment is re-scored without it
+    def perform_destroy(self, instance):
+        row = {field: getattr(instance, 'pk' if field == 'id' else field) for field in SOURCE_FIELDS}
+        delete_with_notifications(Listing.objects.filter(pk=instance.pk), 'listing')
+        index_listings([{**row, 'is_active': False}])
+        refresh_segments([instance.market_segment])
+
+    # Listings most like this one (price, year, mileage, fuel... for cars; price, rooms, area,
+    # type and location for real estate), from the precomputed vector index (see similar.py)
+    # GET /api/listings/<id>/similar/?limit=10
+    @action(detail=True, methods=['get'], pagination_class=None)
+    def similar(self, request, pk=None):
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+        except ValueError:
+            raise ValidationError({'limit': 'Must be a number.'})
+        listing = self.get_object()
+        # Ask for a few extra: some neighbours may have been deactivated since the last rebuild
+        ids = similar_listing_ids(listing, limit * 2)
+        found = {
+            item.pk: item
+            for item in Listing.objects.filter(pk__in=ids, is_active=True).select_related('source')
+        }
+        similar = [found[pk] for pk in ids if pk in found][:limit]
+        return Response(self.get_serializer(similar, many=True).data)
+
+    # Full dump of listings for partners and analytics jobs (admin only)
+    # GET /api/listings/export/?output=ndjson|csv&changed_since=...&<listing filters>
+    # Streamed straight from a database cursor and gzipped if the client accepts it
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    def export(self, request):
+        export_format = request.query_params.get('output', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({'output': f"Choose one of: {', '.join(EXPORT_FORMATS)}"})
+
+        compress = accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        response = StreamingHttpResponse(
+            # The response is streamed after the view returns, so pick a replica explicitly
+            export_stream(self.get_queryset().using(pick_replica()), export_format, compress=compress),
+            content_type=EXPORT_FORMATS[export_format],
+        )
+        response['Content-Disposition'] = f'attachment; filename="listings.{export_format}"'
+        if compress:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+    # Batch create/update for external scrapers (admin only)
+    # POST /api/listings/batch/ with either a JSON array of listings or an NDJSON body
+    # (Content-Type: application/x-ndjson, optionally Content-Encoding: gzip).
+    # Listings are matched on external_id; the response has one result per item.
+    # A body that breaks off part way (corrupt gzip) gets a 400 with the results of the
+    # items written before that; the rest can be sent again.
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAdminUser])
+    def batch(self, request):
+        content_type = request.content_type.split(';')[0].strip()
+        compressed = request.META.get('HTTP_CONTENT_ENCODING', '') == 'gzip'
+
+        if content_type == 'application/x-ndjson':
+            items = iter_ndjson(request.stream, compressed=compressed)
+        elif compressed:
+            raise ValidationError({'detail': 'Gzip bodies are only supported for application/x-ndjson.'})
+        elif isinstance(request.data, list):
+            items = request.data
+        else:
+            raise ValidationError({'detail': 'Expected a list of listings.'})
+
+        try:
+            results = upsert_listings(items)
+        except UnreadableBody as e:
+            return Response({'detail': str(e), **count_statuses(e.results), 'results': e.results}, status=400)
+        return Response({**count_statuses(results), 'results': results})
+
 # FilterViewSet allows users to manage their own filters
-class FilterViewSet(viewsets.ModelViewSet):
+class FilterViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Filter.objects.all()
     serializer_class = FilterSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -38,12 +198,21 @@ class FilterViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return Filter.objects.filter(user=self.request.user)
 
-    # Automatically set the user when creating a filter
+    # Automatically set the user (and resolve the location) when creating a filter
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        serializer.save(user=self.request.user, place_id=resolve_place(serializer.validated_data.get('location')))
+
+    def perform_update(self, serializer):
+        if 'location' in serializer.validated_data:
+            serializer.save(place_id=resolve_place(serializer.validated_data['location']))
+        else:
+            serializer.save()
+
+    def perform_destroy(self, instance):
+        delete_with_notifications(Filter.objects.filter(pk=instance.pk), 'filter')
 
 # FavoriteViewSet allows users to manage their own favorites
-class FavoriteViewSet(viewsets.ModelViewSet):
+class FavoriteViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Favorite.objects.all()
     serializer_class = FavoriteSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -56,15 +225,70 @@ class FavoriteViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-# NotificationViewSet allows users to view their own notifications
-class NotificationViewSet(viewsets.ModelViewSet):
+# NotificationViewSet is the user's inbox: their own notifications, newest first
+# (?unread=true for unread only). Read state and the unread counter go through inbox.py.
+class NotificationViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Notification.objects.all()
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = InboxPagination
 
     # Only show notifications for the current user
     def get_queryset(self):
-        return Notification.objects.filter(user=self.request.user)
+        queryset = (
+            Notification.objects.filter(user=self.request.user)
+            .select_related('user', 'filter__user')
+            .prefetch_related('listing__source')
+        )
+        if self.request.query_params.get('unread', '').lower() in ('1', 'true'):
+            queryset = queryset.filter(read=False)
+        return queryset
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            notifications_created([serializer.save()])
+
+    def perform_update(self, serializer):
+        notification = serializer.instance
+        old_user_id = notification.user_id
+        read = serializer.validated_data.pop('read', None)
+        with transaction.atomic():
+            notification = serializer.save()
+            if notification.user_id != old_user_id:
+                recount_unread([old_user_id, notification.user_id])
+            if read is not None:
+                mark_read(notification.user_id, [notification.pk], read)
+                notification.read = read
+
+    def perform_destroy(self, instance):
+        delete_notifications(instance.user_id, [instance.pk])
+
+    # GET /api/notifications/unread_count/ - the badge, straight from the user row
+    @action(detail=False, methods=['get'])
+    def unread_count(self, request):
+        return Response({'unread': request.user.unread_notifications})
+
+    # POST /api/notifications/{id}/read/
+    @action(detail=True, methods=['post'])
+    def read(self, request, pk=None):
+        notification = self.get_object()
+        mark_read(request.user.pk, [notification.pk])
+        return Response({'unread': unread_count(request.user.pk)})
+
+    # POST /api/notifications/read_all/ - everything, or {"ids": [...]}
+    @action(detail=False, methods=['post'])
+    def read_all(self, request):
+        pks = request.data.get('ids') if isinstance(request.data, dict) else None
+        if pks is not None and not isinstance(pks, list):
+            raise ValidationError({'ids': 'Expected a list of notification ids.'})
+        try:
+            marked = mark_read(request.user.pk, pks)
+        except DjangoValidationError:
+            raise ValidationError({'ids': 'Invalid notification id.'})
+        return Response({
+            'marked': marked,
+            'unread': unread_count(request.user.pk),
+        })
 
 # Registration view for new users
 class RegisterView(generics.CreateAPIView):
@@ -77,3 +301,48 @@ class RegisterView(generics.CreateAPIView):
         password = serializer.validated_data.get('password')
         serializer.save(password=make_password(password))
 
+# Serves listing images from the local cache (see images.py)
+# GET /api/images/<url hash>/<card|detail|original>/
+# The URL is keyed by the source URL, not the content, and the picture behind it can change
+# after eviction and a new download, so responses are cached for MAX_AGE only and then
+# revalidated with the content hash as ETag (a 304 if it's still the same picture).
+# Images that aren't cached (yet) redirect to the original URL without being cached.
+def cached_image(request, url_hash, size):
+    if size != ORIGINAL and size not in image_settings()['SIZES']:
+        raise Http404
+    image = CachedImage.objects.filter(url_hash=url_hash).values('url', 'status', 'content_hash', 'content_type').first()
+    if image is None:
+        raise Http404
+
+    if image['status'] == 'ready':
+        path = image_path(image['content_hash'], size)
+        try:
+            file = open(path, 'rb')
+        except FileNotFoundError:
+            pass
+        else:
+            touch(path)
+            etag = f'"{image["content_hash"]}"'
+            if etag in request.headers.get('If-None-Match', ''):
+                file.close()
+                response = HttpResponseNotModified()
+            else:
+                content_type = image['content_type'] if size == ORIGINAL else 'image/jpeg'
+                response = FileResponse(file, content_type=content_type)
+            response['ETag'] = etag
+            response['Cache-Control'] = f"public, max-age={image_settings()['MAX_AGE']}"
+            return response
+
+    if image['status'] in ('ready', 'evicted'):
+        # The file is gone from disk - download it again
+        CachedImage.objects.filter(url_hash=url_hash).update(status='pending')
+    response = HttpResponseRedirect(image['url'])
+    response['Cache-Control'] = 'no-store'
+    return response
+
+# Prometheus metrics in the text exposition format (see metrics.py)
+def metrics_view(request):
+    if not can_scrape(request):
+        raise Http404
+    body, content_type = render_metrics()
+    return HttpResponse(body, content_type=content_type)
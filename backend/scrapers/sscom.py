@@ -2,11 +2,25 @@ import requests
 from bs4 import BeautifulSoup
 import time
 from listings.models import Listing, Source
+from listings.archive import restore_by_external_ids
+from listings.places import resolve_place
+from listings.images import enqueue_images
+from listings.similar import index_listings
+from listings.valuation import assign_segments, refresh_segments
+from listings.metrics import SCRAPER_FETCH_TIME, SCRAPER_LISTINGS, track_job
 from django.utils import timezone
 from django.db import transaction
 
 SS_COM_CARS_URL = "https://www.ss.com/lv/transport/cars/bmw/"
 BASE_URL = "https://www.ss.com"
+SOURCE_NAME = "ss.com"
+
+def fetch(url):
+    """
+    Downloads a page from ss.com, recording how long it took.
+    """
+    with SCRAPER_FETCH_TIME.labels(source=SOURCE_NAME).time():
+        return requests.get(url, headers={"User-Agent": "Mozilla/5.0"})
 
 def get_listing_links():
     """
@@ -16,7 +30,7 @@ def get_listing_links():
     page = 1
     while True:
         url = SS_COM_CARS_URL + f"page{page}.html" if page > 1 else SS_COM_CARS_URL
-        resp = requests.get(url, headers={"User-Agent": "Mozilla/5.0"})
+        resp = fetch(url)
         soup = BeautifulSoup(resp.text, "html.parser")
         table = soup.find("table", {"id": "page_main"})
         if not table:
@@ -38,7 +52,7 @@ def parse_listing(url):
     """
     Parses a single BMW listing page and returns a dict of fields.
     """
-    resp = requests.get(url, headers={"User-Agent": "Mozilla/5.0"})
+    resp = fetch(url)
     soup = BeautifulSoup(resp.text, "html.parser")
     title = soup.find("h2").text.strip() if soup.find("h2") else "BMW"
     price_tag = soup.find("td", class_="ads_price")
@@ -79,8 +93,11 @@ def parse_listing(url):
 def save_listing(data, source_obj):
     """
     Saves or updates a Listing in the database.
+    Returns (listing, created, market segments to refresh).
     """
     with transaction.atomic():
+        # If this ad was archived earlier, bring it back instead of creating a duplicate
+        restore_by_external_ids([data["external_id"]])
         listing, created = Listing.objects.update_or_create(
             external_id=data["external_id"],
             source=source_obj,
@@ -89,6 +106,7 @@ def save_listing(data, source_obj):
                 "description": data["description"],
                 "price": data["price"],
                 "location": data["location"],
+                "place_id": resolve_place(data["location"]),
                 "images": data["images"],
                 "url": data["url"],
                 "year": data["year"],
@@ -97,29 +115,45 @@ def save_listing(data, source_obj):
                 "listing_type": "car",
                 "car_category": "BMW",
                 "is_active": True,
+                "rescrape_requested": False,
                 "scraped_at": timezone.now(),
             }
         )
-        return listing, created
+        # Queue the pictures for the local image cache (fetch_images downloads them)
+        enqueue_images(data["images"])
+        index_listings([listing])
+        return listing, created, assign_segments([listing])
 
 def main():
     # Ensure Source exists
     source_obj, _ = Source.objects.get_or_create(
-        name="ss.com",
+        name=SOURCE_NAME,
         defaults={"source_type": "car", "url": SS_COM_CARS_URL, "is_active": True}
     )
     links = get_listing_links()
     print(f"Found {len(links)} BMW listings on ss.com")
+    # Also revisit listings an admin asked to re-scrape (even if they dropped off the category pages)
+    flagged = Listing.objects.filter(rescrape_requested=True, source=source_obj).values_list("url", flat=True)
+    seen = set(links)
+    links.extend(url for url in flagged if url not in seen)
+    # Deal scores are refreshed once per touched segment at the end, not after every listing
+    segments = set()
     for url in links:
         try:
             data = parse_listing(url)
-            save_listing(data, source_obj)
+            listing, created, touched = save_listing(data, source_obj)
+            segments |= touched
+            SCRAPER_LISTINGS.labels(source=SOURCE_NAME, result="created" if created else "updated").inc()
             print(f"Saved: {data['title']} ({data['external_id']})")
             time.sleep(0.5)
         except Exception as e:
+            SCRAPER_LISTINGS.labels(source=SOURCE_NAME, result="error").inc()
             print(f"Error scraping {url}: {e}")
+    refresh_segments(segments)
 
 if __name__ == "__main__":
     # This script should be run with Django context, e.g.:
     # python manage.py shell < scrapers/sscom.py
-    main()
\ No newline at end of file
+    # (set PROMETHEUS_MULTIPROC_DIR so its metrics show up on the API's /metrics)
+    with track_job("sscom_scraper"):
+        main()
\ No newline at end of file